@@ -0,0 +1,66 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+# Modules deferred to the code paths that use them:
+_HEAVY = ['opentrons', 'opentrons.simulate', 'pandas']
+
+_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import %s
+print(json.dumps({'time': time.perf_counter() - start,
+                  'loaded': [mod for mod in %r if mod in sys.modules]}))
+'''
+
+
+def time_import(module):
+    '''Time import of module in a fresh interpreter.'''
+    output = subprocess.run([sys.executable, '-c', _SCRIPT % (module, _HEAVY)],
+                            check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    '''main method.'''
+    parser = argparse.ArgumentParser(
+        description='Benchmark import time of liv_ot modules')
+    parser.add_argument('--modules', nargs='+',
+                        default=['liv_ot.simple', 'liv_ot.simple_pandas',
+                                 'liv_ot.batch', 'liv_ot.planner'])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail if any median import time exceeds this')
+    args = parser.parse_args()
+
+    failed = False
+
+    for module in args.modules:
+        results = [time_import(module) for _ in range(args.repeats)]
+        median = statistics.median(result['time'] for result in results)
+        loaded = results[0]['loaded']
+
+        print(json.dumps({'module': module, 'median_ms': median * 1000,
+                          'heavy_modules': loaded}))
+
+        if loaded or (args.max_ms is not None and
+                      median * 1000 > args.max_ms):
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
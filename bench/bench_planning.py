@@ -0,0 +1,94 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import argparse
+import importlib
+import itertools
+import json
+import os.path
+import sys
+import time
+
+from opentrons import simulate
+
+from liv_ot.labware import Registry
+from liv_ot.planning import PlanningContext
+
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'data')
+
+
+def run(writer_name, get_protocol, setup_path, wrklst_path):
+    '''Write protocol, returning its commands and time taken.'''
+    module = importlib.import_module('liv_ot.' + writer_name)
+    kwargs = {'seed': 0} if writer_name == 'simple_pandas' else {}
+    start = time.perf_counter()
+    protocol = get_protocol()
+
+    module.ProtocolWriter(protocol, setup_path, wrklst_path, offline=True,
+                          **kwargs).write()
+
+    return protocol.commands(), time.perf_counter() - start
+
+
+def main():
+    '''main method.'''
+    parser = argparse.ArgumentParser(
+        description='Check PlanningContext against opentrons.simulate')
+    parser.add_argument('--writers', nargs='+',
+                        default=['simple', 'simple_pandas'])
+    parser.add_argument('--setup',
+                        default=os.path.join(_DATA_DIR, 'setup.json'))
+    parser.add_argument('--worklists', nargs='+',
+                        default=[os.path.join(_DATA_DIR, 'worklist.csv'),
+                                 os.path.join(_DATA_DIR,
+                                              'worklist_orig.csv')])
+    args = parser.parse_args()
+
+    registry = Registry()
+    definitions = registry.get_definitions()
+    failed = False
+
+    for writer_name, wrklst_path in itertools.product(args.writers,
+                                                      args.worklists):
+        result = {'writer': writer_name,
+                  'worklist': os.path.basename(wrklst_path)}
+
+        try:
+            expected, result['simulate'] = run(
+                writer_name,
+                lambda: simulate.get_protocol_api(
+                    '2.0', extra_labware=definitions),
+                args.setup, wrklst_path)
+        except ValueError as err:
+            # e.g. simple requires dest wells:
+            result['skipped'] = str(err)
+            print(json.dumps(result))
+            continue
+
+        actual, result['planning'] = run(
+            writer_name, lambda: PlanningContext(registry=registry),
+            args.setup, wrklst_path)
+
+        result['commands'] = len(expected)
+        result['speedup'] = result['simulate'] / result['planning']
+        result['match'] = actual == expected
+
+        if not result['match']:
+            failed = True
+            result['first_difference'] = next(
+                ([idx, exp, act] for idx, (exp, act) in enumerate(
+                    itertools.zip_longest(expected, actual)) if exp != act))
+
+        print(json.dumps(result))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=protected-access
+from functools import partial
+import random
+import sys
+import timeit
+
+from opentrons import simulate
+
+import pandas as pd
+
+from liv_ot.deck import DeckIndex
+from liv_ot.simple_pandas import _get_locations
+
+
+def get_deck(protocol):
+    '''Load source and destination plates.'''
+    deck = DeckIndex()
+
+    for slot, name in [('1', 'src'), ('2', 'dest')]:
+        deck.add(protocol.load_labware('corning_384_wellplate_112ul_flat',
+                                       slot, name))
+
+    return deck
+
+
+def get_worklist(deck, num_rows):
+    '''Get random worklist.'''
+    wells = list(deck.get_labware('src').wells_by_name())
+
+    return pd.DataFrame({'src_plate': 'src',
+                         'src_well': random.choices(wells, k=num_rows),
+                         'dest_plate': 'dest',
+                         'dest_well': random.choices(wells, k=num_rows),
+                         'vol': 10.0,
+                         'dest_top': random.choices([-1.0, 0.0], k=num_rows)})
+
+
+def get_well_by_row(row, deck, is_src=True):
+    '''Previous per-row implementation, for comparison.'''
+    prefix = 'src' if is_src else 'dest'
+    well = deck.get_well(row['%s_plate' % prefix], row['%s_well' % prefix])
+
+    top = '%s_top' % prefix
+    bottom = '%s_bottom' % prefix
+
+    if top in row:
+        well.top(row[top])
+    elif bottom in row:
+        well.bottom(row[bottom])
+
+    return well
+
+
+def main(args):
+    '''main method.'''
+    protocol = simulate.get_protocol_api('2.0')
+    deck = get_deck(protocol)
+    number = int(args[0]) if args else 10
+
+    for num_rows in [384, 1536]:
+        df = get_worklist(deck, num_rows)
+
+        apply_time = timeit.timeit(
+            lambda: [df.apply(partial(get_well_by_row, deck=deck,
+                                      is_src=is_src), axis=1).tolist()
+                     for is_src in [True, False]],
+            number=number) / number
+
+        join_time = timeit.timeit(
+            lambda: [_get_locations(df, deck, prefix)
+                     for prefix in ['src', 'dest']],
+            number=number) / number
+
+        print('%d rows: apply %.2f ms, join %.2f ms (%.1fx)' %
+              (num_rows, apply_time * 1000, join_time * 1000,
+               apply_time / join_time))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
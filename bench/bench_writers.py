@@ -0,0 +1,256 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=protected-access
+import argparse
+from collections import defaultdict
+import csv
+from functools import wraps
+import importlib
+import itertools
+import json
+import math
+import os.path
+import platform
+import random
+import tempfile
+import time
+
+import opentrons
+from opentrons import simulate
+
+from liv_ot import deck, planner, simple, simple_pandas
+from liv_ot.transfers import get_well_name
+
+
+_PLATES = {96: 'corning_96_wellplate_360ul_flat',
+           384: 'corning_384_wellplate_112ul_flat',
+           1536: 'liv_1536_wellplate_10ul'}
+
+# Pipettes (by mount, with their tip racks), transfer volumes and disposal
+# volume by number of wells, so that transfers fit the destination wells:
+_HANDLING = {
+    96: ({'left': ('p300_single', 'opentrons_96_tiprack_300ul'),
+          'right': ('p1000_single', 'opentrons_96_tiprack_1000ul')},
+         [30, 50, 100, 200], 50.0),
+    384: ({'left': ('p300_single', 'opentrons_96_tiprack_300ul'),
+           'right': ('p1000_single', 'opentrons_96_tiprack_1000ul')},
+          [30, 50, 100], 50.0),
+    1536: ({'left': ('p20_single_gen2', 'opentrons_96_tiprack_20ul'),
+            'right': ('p10_single', 'opentrons_96_tiprack_10ul')},
+           [1, 2, 5], 2.0)}
+
+# Source plates, filled, from which each transfer may draw its volume and
+# a disposal volume:
+_SRC_PLATE = 'nest_96_wellplate_2ml_deep'
+_SRC_VOLUME = 2000.0
+_SRC_WELLS = [get_well_name(row, col)
+              for col in range(12) for row in range(8)]
+
+
+def get_1536_def():
+    '''Get synthetic 1536 well plate definition.'''
+    rows, cols, pitch = 32, 48, 2.25
+    ordering = [[get_well_name(row, col) for row in range(rows)]
+                for col in range(cols)]
+
+    wells = {get_well_name(row, col):
+             {'depth': 5, 'totalLiquidVolume': 10, 'shape': 'circular',
+              'diameter': 1.5, 'x': 11.005 + col * pitch,
+              'y': 79.625 - row * pitch, 'z': 5.4}
+             for row in range(rows) for col in range(cols)}
+
+    return {'ordering': ordering,
+            'brand': {'brand': 'liv'},
+            'metadata': {'displayName': 'Synthetic 1536 Well Plate',
+                         'displayCategory': 'wellPlate',
+                         'displayVolumeUnits': 'µL', 'tags': []},
+            'dimensions': {'xDimension': 127.76, 'yDimension': 85.48,
+                           'zDimension': 10.4},
+            'wells': wells,
+            'groups': [{'metadata': {}, 'wells': list(wells)}],
+            'parameters': {'format': 'irregular', 'quirks': [],
+                           'isTiprack': False,
+                           'isMagneticModuleCompatible': False,
+                           'loadName': _PLATES[1536]},
+            'namespace': 'custom_beta', 'version': 1, 'schemaVersion': 2,
+            'cornerOffsetFromSlot': {'x': 0, 'y': 0, 'z': 0}}
+
+
+def write_inputs(out_dir, num_wells, num_plates, num_rows, fixed_dests,
+                 seed=0):
+    '''Write synthetic setup and worklist, returning their paths.
+
+    Each row fills its own destination well (so num_rows may not exceed
+    the destination wells), drawing from a random source well of as many
+    source plates as are needed for no well to be overdrawn.'''
+    if num_rows > num_wells * num_plates:
+        raise ValueError('%d rows exceed %d destination wells' %
+                         (num_rows, num_wells * num_plates))
+
+    rand = random.Random(seed)
+    rows, cols = {96: (8, 12), 384: (16, 24), 1536: (32, 48)}[num_wells]
+    wells = [get_well_name(row, col)
+             for col in range(cols) for row in range(rows)]
+    pipettes, vols, disposal_volume = _HANDLING[num_wells]
+
+    # Draws of each source well, taken in random order:
+    num_draws = int(_SRC_VOLUME // (max(vols) + disposal_volume))
+    num_srcs = math.ceil(num_rows / (len(_SRC_WELLS) * num_draws))
+    srcs = [('src_%d' % idx, well) for idx in range(num_srcs)
+            for well in _SRC_WELLS] * num_draws
+    rand.shuffle(srcs)
+
+    setup = {'tip_racks': [{'type': tip_rack, 'mount': mount}
+                           for mount, (_, tip_rack) in pipettes.items()],
+             'pipettes': {mount: name
+                          for mount, (name, _) in pipettes.items()},
+             'liquid_classes': {
+                 'default': {'disposal_volume': disposal_volume}},
+             'plates': [{'name': 'src_%d' % idx, 'type': _SRC_PLATE,
+                         'volume': _SRC_VOLUME}
+                        for idx in range(num_srcs)] +
+                       [{'name': 'dest_%d' % idx, 'type': _PLATES[num_wells]}
+                        for idx in range(num_plates)]}
+
+    setup_path = os.path.join(out_dir, 'setup.json')
+    wrklst_path = os.path.join(out_dir, 'worklist.csv')
+
+    with open(setup_path, 'w') as setup_file:
+        json.dump(setup, setup_file)
+
+    with open(wrklst_path, 'w', newline='') as wrklst_file:
+        writer = csv.writer(wrklst_file)
+        writer.writerow(['src_plate', 'src_well', 'dest_plate'] +
+                        (['dest_well'] if fixed_dests else []) + ['vol'])
+
+        for idx in range(num_rows):
+            dest_plate, dest_well = divmod(idx, num_wells)
+            writer.writerow(
+                list(srcs[idx]) + ['dest_%d' % dest_plate] +
+                ([wells[dest_well]] if fixed_dests else []) +
+                [rand.choice(vols)])
+
+    return setup_path, wrklst_path
+
+
+class PhaseTimer():
+    '''Accumulate wall-clock time of patched functions by phase.'''
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.__patched = []
+
+    def patch(self, obj, name, phase):
+        '''Time calls to obj.name under phase.'''
+        func = getattr(obj, name)
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[phase] += time.perf_counter() - start
+
+        setattr(obj, name, timed)
+        self.__patched.append((obj, name, func))
+
+    def unpatch(self):
+        '''Restore patched functions.'''
+        for obj, name, func in reversed(self.__patched):
+            setattr(obj, name, func)
+
+        self.__patched = []
+
+
+def run(writer_name, setup_path, wrklst_path):
+    '''Time phases of one ProtocolWriter run.'''
+    module = importlib.import_module('liv_ot.' + writer_name)
+    protocol = simulate.get_protocol_api(
+        simple.metadata['apiLevel'],
+        extra_labware={_PLATES[1536]: get_1536_def()})
+
+    timer = PhaseTimer()
+    writer_cls = module.ProtocolWriter
+    timer.patch(writer_cls, '_ProtocolWriter__do_setup', 'setup')
+    timer.patch(planner, 'partition', 'pipettes')
+    timer.patch(planner, 'schedule', 'plan')
+    timer.patch(planner, 'execute', 'simulate')
+
+    if writer_name == 'simple_pandas':
+        timer.patch(simple_pandas, '_get_locations', 'resolve')
+    else:
+        timer.patch(deck.DeckIndex, 'get_location', 'resolve')
+
+    try:
+        start = time.perf_counter()
+        writer = writer_cls(protocol, setup_path, wrklst_path)
+        writer._ProtocolWriter__setup_ftr.result()
+        timer.times['fetch'] = time.perf_counter() - start
+
+        writer.write()
+        timer.times['total'] = time.perf_counter() - start
+    finally:
+        timer.unpatch()
+
+    # Pipette selection is timed within planning:
+    timer.times['plan'] -= timer.times['pipettes']
+
+    return dict(timer.times), len(protocol.commands())
+
+
+def main():
+    '''main method.'''
+    parser = argparse.ArgumentParser(
+        description='Benchmark ProtocolWriter phases on synthetic worklists')
+    parser.add_argument('--writers', nargs='+',
+                        default=['simple', 'simple_pandas'])
+    parser.add_argument('--wells', nargs='+', type=int,
+                        default=[96, 384, 1536])
+    parser.add_argument('--plates', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--rows', nargs='+', type=int, default=[96, 1000])
+    parser.add_argument('--dests', nargs='+', default=['fixed', 'random'],
+                        choices=['fixed', 'random'])
+    parser.add_argument('--out',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'liv_ot_bench_writers.json'),
+                        help='results file (default in the temp directory)')
+    args = parser.parse_args()
+
+    results = []
+
+    for writer_name, num_wells, num_plates, num_rows, dests in \
+            itertools.product(args.writers, args.wells, args.plates,
+                              args.rows, args.dests):
+        # simple requires dest wells; rows cannot exceed dest wells:
+        if dests == 'random' and writer_name == 'simple' or \
+                num_rows > num_wells * num_plates:
+            continue
+
+        result = {'writer': writer_name, 'wells': num_wells,
+                  'plates': num_plates, 'rows': num_rows, 'dests': dests}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = write_inputs(tmp_dir, num_wells, num_plates, num_rows,
+                                 dests == 'fixed')
+
+            result['phases'], result['commands'] = run(writer_name, *paths)
+
+        print(json.dumps(result))
+        results.append(result)
+
+    with open(args.out, 'w') as out_file:
+        json.dump({'python': platform.python_version(),
+                   'opentrons': opentrons.__version__,
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'results': results}, out_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
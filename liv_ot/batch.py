@@ -0,0 +1,147 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=import-outside-toplevel
+import argparse
+import csv
+import glob
+import importlib
+import json
+import multiprocessing
+import os.path
+import re
+import sys
+import time
+
+from liv_ot.instrument import Instrumentation
+from liv_ot.labware import Registry
+from liv_ot.planning import PlanningContext
+
+
+# Recycle worker processes, bounding memory held by simulated protocols:
+_MAX_TASKS_PER_CHILD = 16
+
+# Worklist row number (see transfers.get_row) of the first error, as in
+# 'row 5: unknown plate' or 'No pipette can transfer rows: 5 (1.0 uL)':
+_ROW_RE = re.compile(r'\brows?:? (\d+)')
+
+
+def get_jobs(path):
+    '''Get jobs from a manifest CSV (columns setup, worklist and optional
+    name; relative paths being relative to the manifest) or a directory of
+    job directories, each containing setup.json and worklist.csv.'''
+    if os.path.isdir(path):
+        for setup in sorted(glob.glob(os.path.join(path, '*',
+                                                   'setup.json'))):
+            job_dir = os.path.dirname(setup)
+
+            yield {'name': os.path.basename(job_dir),
+                   'setup': setup,
+                   'worklist': os.path.join(job_dir, 'worklist.csv')}
+
+        return
+
+    root = os.path.dirname(os.path.abspath(path))
+
+    with open(path, newline='') as manifest_file:
+        for row_idx, row in enumerate(csv.DictReader(manifest_file)):
+            yield {'name': row.get('name') or str(row_idx),
+                   'setup': os.path.join(root, row['setup']),
+                   'worklist': os.path.join(root, row['worklist'])}
+
+
+def simulate_job(job):
+    '''Simulate job, returning a result record rather than raising.'''
+    result = dict(job)
+    start = time.perf_counter()
+
+    try:
+        module = importlib.import_module('liv_ot.' + job['writer'])
+        registry = Registry(job.get('labware_dir'))
+
+        if job.get('planning'):
+            protocol = PlanningContext(registry=registry)
+        else:
+            # Deferred to workers, as initialising the simulator is slow:
+            from opentrons import simulate
+
+            protocol = simulate.get_protocol_api(
+                module.metadata['apiLevel'],
+                extra_labware=registry.get_definitions())
+
+        instrumentation = Instrumentation()
+
+        module.ProtocolWriter(protocol, job['setup'], job['worklist'],
+                              offline=True, order=job.get('order'),
+                              instrumentation=instrumentation,
+                              registry=registry).write()
+
+        counters = instrumentation.report()['counters']
+
+        result.update({
+            'status': 'success',
+            'commands': len(protocol.commands()),
+            'estimated_runtime': counters.pop('estimated_runtime', 0.0),
+            'counters': counters})
+    except Exception as err:  # pylint: disable=broad-except
+        match = _ROW_RE.search(str(err))
+
+        result.update({'status': 'error',
+                       'error': '%s: %s' % (type(err).__name__, err),
+                       'row': int(match.group(1)) if match else None})
+
+    result['time'] = time.perf_counter() - start
+
+    return result
+
+
+def run(jobs, out_file, workers=None):
+    '''Simulate jobs across a process pool, streaming results as NDJSON as
+    they finish. Returns number of failed jobs.'''
+    failures = 0
+
+    with multiprocessing.Pool(workers,
+                              maxtasksperchild=_MAX_TASKS_PER_CHILD) as pool:
+        for result in pool.imap_unordered(simulate_job, jobs):
+            failures += result['status'] != 'success'
+            out_file.write(json.dumps(result) + '\n')
+            out_file.flush()
+
+    return failures
+
+
+def main():
+    '''main method.'''
+    parser = argparse.ArgumentParser(
+        description='Simulate many setup / worklist pairs in parallel')
+    parser.add_argument('jobs',
+                        help='manifest CSV or directory of job directories')
+    parser.add_argument('--writer', default='simple',
+                        choices=['simple', 'simple_pandas'])
+    parser.add_argument('--order', choices=['nearest', 'serpentine'])
+    parser.add_argument('--labware-dir')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--planning', action='store_true',
+                        help='plan without the opentrons simulator')
+    parser.add_argument('--out', help='NDJSON results file (default stdout)')
+    args = parser.parse_args()
+
+    jobs = (dict(job, writer=args.writer, order=args.order,
+                 labware_dir=args.labware_dir, planning=args.planning)
+            for job in get_jobs(args.jobs))
+
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            failures = run(jobs, out_file, args.workers)
+    else:
+        failures = run(jobs, sys.stdout, args.workers)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import argparse
+import ast
+import importlib
+import os.path
+from string import Template
+import sys
+
+
+_PACKAGE = 'liv_ot'
+_PACKAGE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Standalone protocol, as the robot is given a single file, importing the
+# bundled liv_ot modules from their sources:
+_TEMPLATE = Template("""'''
+Protocol liv_ot.$writer, bundled with the liv_ot modules it imports.
+'''
+import importlib.abc
+import importlib.util
+import sys
+
+metadata = $metadata
+
+_SOURCES = {
+$sources
+}
+
+
+class _Importer(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    '''Importer of bundled modules, ahead of any installed liv_ot.'''
+
+    def find_spec(self, fullname, path, target=None):
+        '''Get spec of bundled module, or None.'''
+        if fullname not in _SOURCES:
+            return None
+
+        spec = importlib.util.spec_from_loader(
+            fullname, self, origin=fullname.replace('.', '/') + '.py',
+            is_package=fullname == 'liv_ot')
+        spec.has_location = True
+        return spec
+
+    def create_module(self, spec):
+        '''Create module by default.'''
+        return None
+
+    def get_source(self, fullname):
+        '''Get source of bundled module.'''
+        return _SOURCES[fullname]
+
+    def exec_module(self, module):
+        '''Execute bundled module.'''
+        exec(compile(_SOURCES[module.__name__], module.__file__, 'exec'),
+             module.__dict__)
+
+
+sys.meta_path.insert(0, _Importer())
+
+from liv_ot import $writer as _writer  # noqa: E402
+$overrides
+
+def run(protocol):
+    '''Run protocol.'''
+    _writer.run(protocol)
+""")
+
+
+def get_protocol(writer, setup_url=None, wrklst_url=None, checkpoint=None,
+                 resume=False):
+    '''Get source of a protocol running ProtocolWriter writer (a liv_ot
+    module name), with the sources of all liv_ot modules it imports, and
+    optionally its setup and worklist URLs and checkpoint path (on the
+    robot) and whether to resume from it.'''
+    module = importlib.import_module('%s.%s' % (_PACKAGE, writer))
+    names = get_imports(module.__name__)
+
+    overrides = [('SETUP_URL', setup_url), ('WRKLST_URL', wrklst_url),
+                 ('CHECKPOINT', checkpoint), ('RESUME', resume)]
+
+    return _TEMPLATE.substitute(
+        writer=writer,
+        metadata=repr(module.metadata),
+        sources='\n'.join('    %r: %r,' % (name, _read(name))
+                          for name in names),
+        overrides=''.join('_writer.%s = %r\n' % (key, value)
+                          for key, value in overrides if value))
+
+
+def get_imports(name):
+    '''Get names of liv_ot modules imported by module name, including
+    itself and the package, in order of first import.'''
+    names = [_PACKAGE]
+    pending = [name]
+
+    while pending:
+        name = pending.pop(0)
+
+        if name in names:
+            continue
+
+        names.append(name)
+
+        for node in ast.walk(ast.parse(_read(name))):
+            if isinstance(node, ast.ImportFrom) and node.module and \
+                    node.module.startswith(_PACKAGE + '.'):
+                pending.append(node.module)
+            elif isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names
+                               if alias.name.startswith(_PACKAGE + '.'))
+
+    return names
+
+
+def _read(name):
+    '''Read source of liv_ot module name.'''
+    parts = name.split('.')[1:] or ['__init__']
+
+    with open(os.path.join(_PACKAGE_DIR, *parts) + '.py') as src_file:
+        return src_file.read()
+
+
+def main():
+    '''main method.'''
+    parser = argparse.ArgumentParser(
+        description='Write a single-file protocol for the robot')
+    parser.add_argument('writer', choices=['simple', 'simple_pandas'])
+    parser.add_argument('--setup-url')
+    parser.add_argument('--worklist-url')
+    parser.add_argument('--checkpoint',
+                        help='checkpoint path on the robot, recording '
+                        'progress')
+    parser.add_argument('--resume', action='store_true',
+                        help='resume from the checkpoint')
+    parser.add_argument('--out', help='protocol file (default stdout)')
+    args = parser.parse_args()
+
+    protocol = get_protocol(args.writer, args.setup_url, args.worklist_url,
+                            args.checkpoint, args.resume)
+
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            out_file.write(protocol)
+    else:
+        sys.stdout.write(protocol)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import argparse
+import json
+from string import Template
+import sys
+
+from liv_ot.labware import Registry
+from liv_ot.planning import get_labware_definition
+
+
+# Slots for labware in serpentine order, so consecutive plates are
+# adjacent (the tip rack being in 5 and the trash in 12):
+_SLOTS = ['1', '2', '3', '6', '9', '8', '7', '4', '10', '11']
+_TIPRACK_SLOT = '5'
+
+# Standalone protocol, as the robot is given a single file:
+_TEMPLATE = Template('''import json
+
+from opentrons import types
+
+CALIBRATION_CROSS_COORDS = {
+    '1': {
+        'x': 12.13,
+        'y': 9.0,
+        'z': 0.0
+    },
+    '3': {
+        'x': 380.87,
+        'y': 9.0,
+        'z': 0.0
+    },
+    '7': {
+        'x': 12.13,
+        'y': 258.0,
+        'z': 0.0
+    }
+}
+CALIBRATION_CROSS_SLOTS = ['1', '3', '7']
+
+FAST_RATE = 1.0  # % of default speeds, between wells
+RATE = 0.25
+SLOWER_RATE = 0.1  # near well edges
+
+PIPETTE_MOUNT = $pipette_mount
+PIPETTE_NAME = $pipette_name
+
+TIPRACK_SLOT = $tiprack_slot
+TIPRACK_LOADNAME = $tiprack_loadname
+
+# Labware to check, as load name, slot, (custom) definition and the half
+# x, y and z dimensions of its corner wells (one if these are the same):
+LABWARE_JSON = r"""$labware"""
+LABWARE = json.loads(LABWARE_JSON)
+
+metadata = {'apiLevel': '2.0'}
+
+
+def get_corners(plate):
+    return [plate.columns()[0][0], plate.columns()[-1][-1]]
+
+
+def run(protocol):
+    tiprack = protocol.load_labware(TIPRACK_LOADNAME, TIPRACK_SLOT)
+    pipette = protocol.load_instrument(
+        PIPETTE_NAME, PIPETTE_MOUNT, tip_racks=[tiprack])
+
+    plates = []
+
+    for labware in LABWARE:
+        if labware['definition']:
+            plate = protocol.load_labware_from_definition(
+                labware['definition'], labware['slot'],
+                labware['load_name'])
+        else:
+            plate = protocol.load_labware(labware['load_name'],
+                                          labware['slot'])
+
+        plates.append((labware, plate))
+
+    pipette.pick_up_tip()
+
+    def set_speeds(rate):
+        protocol.max_speeds.update({
+            'X': (600 * rate),
+            'Y': (400 * rate),
+            'Z': (125 * rate),
+            'A': (125 * rate),
+        })
+
+        speed_max = max(protocol.max_speeds.values())
+
+        for instr in protocol.loaded_instruments.values():
+            instr.default_speed = speed_max
+
+    set_speeds(RATE)
+
+    for slot in CALIBRATION_CROSS_SLOTS:
+        coordinate = CALIBRATION_CROSS_COORDS[slot]
+        location = types.Location(point=types.Point(**coordinate),
+                                  labware=None)
+        pipette.move_to(location)
+        protocol.pause(f"Confirm {PIPETTE_MOUNT} pipette is at slot {slot} "
+                       "calibration cross")
+
+    pipette.home()
+    protocol.pause('Place your labware: ' + ', '.join(
+        f"{labware['load_name']} in slot {labware['slot']}"
+        for labware, _ in plates))
+
+    for labware, plate in plates:
+        for well, (x, y, z) in zip(get_corners(plate), labware['corners']):
+            center = well.center()
+            all_4_edges = [
+                [center.move(types.Point(x=-x, y=0, z=z)), 'left'],
+                [center.move(types.Point(x=x, y=0, z=z)), 'right'],
+                [center.move(types.Point(x=0, y=-y, z=z)), 'front'],
+                [center.move(types.Point(x=0, y=y, z=z)), 'back']
+            ]
+
+            set_speeds(FAST_RATE)
+            pipette.move_to(well.top())
+            protocol.pause(f"Moved to the top of {well.display_name}")
+
+            set_speeds(SLOWER_RATE)
+
+            for edge_location, edge_name in all_4_edges:
+                pipette.move_to(edge_location)
+                protocol.pause(f'Moved to {edge_name} edge')
+
+            set_speeds(RATE)
+            pipette.move_to(well.bottom())
+            protocol.pause("Moved to the bottom of the well")
+
+            pipette.blow_out(well)
+
+    set_speeds(1.0)
+    pipette.return_tip()
+''')
+
+
+def get_protocol(load_names, pipette_name='p10_single', pipette_mount='right',
+                 tiprack_loadname='opentrons_96_tiprack_10ul',
+                 registry=None):
+    '''Get source of a protocol checking the calibration crosses once, then
+    the corner wells of each labware (by load name) in turn. Custom labware
+    definitions from registry are embedded.'''
+    if len(load_names) > len(_SLOTS):
+        raise ValueError('Too many labware: %d (maximum %d)' %
+                         (len(load_names), len(_SLOTS)))
+
+    registry = registry or Registry()
+    labware = []
+
+    for load_name, slot in zip(load_names, _SLOTS):
+        definition = get_labware_definition(load_name, registry=registry)
+
+        labware.append({'load_name': load_name,
+                        'slot': slot,
+                        'definition': definition
+                                      if load_name in registry else None,
+                        'corners': _get_corners(definition)})
+
+    return _TEMPLATE.substitute(pipette_mount=repr(pipette_mount),
+                                pipette_name=repr(pipette_name),
+                                tiprack_slot=repr(_TIPRACK_SLOT),
+                                tiprack_loadname=repr(tiprack_loadname),
+                                labware=json.dumps(labware))
+
+
+def _get_corners(definition):
+    '''Get half x, y and z dimensions of first and last wells of labware
+    definition, or of just one if these are the same.'''
+    ordering = definition['ordering']
+    corners = []
+
+    for well_name in dict.fromkeys([ordering[0][0], ordering[-1][-1]]):
+        well = definition['wells'][well_name]
+
+        if well['shape'] == 'circular':
+            size = [well['diameter']] * 2
+        else:
+            size = [well['xDimension'], well['yDimension']]
+
+        corners.append([dim / 2 for dim in size + [well['depth']]])
+
+    return corners
+
+
+def main():
+    '''main method.'''
+    parser = argparse.ArgumentParser(
+        description='Write one calibration protocol checking many labware')
+    parser.add_argument('load_names', nargs='*',
+                        help='labware load names (default all custom labware)')
+    parser.add_argument('--pipette', default='p10_single')
+    parser.add_argument('--mount', default='right',
+                        choices=['left', 'right'])
+    parser.add_argument('--tip-rack', default='opentrons_96_tiprack_10ul')
+    parser.add_argument('--labware-dir')
+    parser.add_argument('--out', help='protocol file (default stdout)')
+    args = parser.parse_args()
+
+    registry = Registry(args.labware_dir)
+    protocol = get_protocol(args.load_names or
+                            sorted(registry.get_definitions()),
+                            args.pipette, args.mount, args.tip_rack,
+                            registry)
+
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            out_file.write(protocol)
+    else:
+        sys.stdout.write(protocol)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+from collections import defaultdict
+import json
+import os.path
+import tempfile
+
+import numpy as np
+
+from liv_ot.transfers import get_row
+
+
+_TOLERANCE = 1e-3
+
+
+class Checkpoint():
+    '''Progress of a run, journalled as it happens.
+
+    Records volume dispensed per transfer (by worklist index), volume drawn
+    per source well, the next unused tip of each pipette (by mount, as index
+    of tip rack of the pipette and well) and the destination layout seed.
+
+    The journal is a file of JSON lines. Each aspiration and each dispense
+    appends a line of increments, so that a crash loses no more than the
+    dispense in progress. The first line written by a run holds the whole
+    state, replacing any previous journal.'''
+
+    def __init__(self, path):
+        self.__path = path
+        self.__dispensed = defaultdict(float)
+        self.__drawn = defaultdict(float)
+        self.__started = False
+        self.next_tip = {}
+        self.seed = None
+
+    @classmethod
+    def load(cls, path):
+        '''Load Checkpoint, or start afresh if there is none.'''
+        checkpoint = cls(path)
+
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash may leave the last line incomplete:
+                        break
+
+                    checkpoint.__update(record)
+
+        return checkpoint
+
+    def get_drawn(self):
+        '''Get volume drawn by source well, keyed by plate:well.'''
+        return dict(self.__drawn)
+
+    def get_remaining(self, transfers):
+        '''Get transfers (a TransferTable) not yet completed, reducing the
+        volumes of those partly dispensed.'''
+        dispensed = np.array([self.__dispensed.get(idx, 0.0)
+                              for idx in transfers['idx'].tolist()],
+                             dtype=np.float64)
+
+        remaining = transfers['vol'] - dispensed
+        transfers = transfers.filter(remaining > _TOLERANCE)
+        transfers.columns['vol'] = remaining[remaining > _TOLERANCE]
+
+        return transfers
+
+    def get_summary(self, idxs, vols):
+        '''Get summary of progress over transfers (by worklist index and
+        volume), listing worklist rows remaining and volumes drawn.'''
+        rows = [get_row(idx) for idx, vol in zip(idxs, vols)
+                if vol - self.__dispensed.get(idx, 0.0) > _TOLERANCE]
+
+        return 'Resuming with %d of %d transfers remaining (rows %s); ' \
+            'source wells drawn (uL): %s' % (
+                len(rows), len(idxs), _format_ranges(rows) or 'none',
+                ', '.join('%s %.1f' % item
+                          for item in sorted(self.__drawn.items()))
+                or 'none')
+
+    def recorder(self, transfers, columns, disposal_volume):
+        '''Get function recording progress of a (pipette, Aspiration) step
+        of transfers, given the number of its dispenses done: called once
+        aspirated (with 0) and after each dispense.
+
+        columns maps first-channel row positions of multi-channel steps to
+        the row positions of all channels.'''
+        idxs = transfers['idx'].tolist()
+        srcs = ['%s:%s' % src for src in zip(transfers.get_plates('src'),
+                                             transfers.get_well_names('src'))]
+
+        def record(pipette, asp, num_dispensed):
+            '''Record progress of step.'''
+            if num_dispensed:
+                pos, vol = asp.dispenses[num_dispensed - 1]
+                dispensed = defaultdict(float)
+
+                for chan_pos in columns.get(pos, [pos]):
+                    dispensed[idxs[chan_pos]] += vol
+
+                self.__append({'dispensed': dispensed})
+            else:
+                vol = sum(vol for _, vol in asp.dispenses) + disposal_volume
+                drawn = defaultdict(float)
+
+                for chan_pos in columns.get(asp.src, [asp.src]):
+                    drawn[srcs[chan_pos]] += vol
+
+                self.__append({'drawn': drawn,
+                               'next_tip': {
+                                   pipette.mount: _get_next_tip(pipette)}})
+
+        return record
+
+    def save(self):
+        '''Save whole state atomically, replacing the journal.'''
+        state = {'next_tip': self.next_tip,
+                 'seed': self.seed,
+                 'dispensed': self.__dispensed,
+                 'drawn': self.__drawn}
+
+        with tempfile.NamedTemporaryFile(
+                'w', dir=os.path.dirname(os.path.abspath(self.__path)),
+                delete=False) as tmp_file:
+            tmp_file.write(json.dumps(state) + '\n')
+
+        os.replace(tmp_file.name, self.__path)
+        self.__started = True
+
+    def __append(self, record):
+        '''Apply record, appending it to the journal.'''
+        self.__update(record)
+
+        if not self.__started:
+            self.save()
+            return
+
+        with open(self.__path, 'a') as checkpoint_file:
+            checkpoint_file.write(json.dumps(record) + '\n')
+
+    def __update(self, record):
+        '''Apply record of increments in volumes and current tip and seed.'''
+        for idx, vol in record.get('dispensed', {}).items():
+            self.__dispensed[int(idx)] += vol
+
+        for src, vol in record.get('drawn', {}).items():
+            self.__drawn[src] += vol
+
+        self.next_tip.update(record.get('next_tip', {}))
+
+        if 'seed' in record:
+            self.seed = record['seed']
+
+
+def get_checkpoint(path, resume=False):
+    '''Get Checkpoint at path (or None if no path) and whether to resume
+    from it.'''
+    if not path:
+        if resume:
+            raise ValueError('Resuming requires a checkpoint')
+
+        return None, False
+
+    return (Checkpoint.load(path) if resume else Checkpoint(path)), resume
+
+
+def _format_ranges(rows):
+    '''Format ascending row numbers as ranges, e.g. 2-4, 7.'''
+    ranges = []
+
+    for row in rows:
+        if ranges and row == ranges[-1][1] + 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+
+    return ', '.join('%d-%d' % tuple(rng) if rng[0] != rng[1]
+                     else '%d' % rng[0] for rng in ranges)
+
+
+def _get_next_tip(pipette):
+    '''Get tip following the last used tip of pipette, as (tip rack index,
+    well name), or None if none follows.'''
+    tip_racks = pipette.tip_racks
+
+    for rack_idx in reversed(range(len(tip_racks))):
+        wells = tip_racks[rack_idx].wells_by_name()
+        used = [idx for idx, well in enumerate(wells.values())
+                if not well.has_tip]
+
+        if used:
+            if used[-1] + 1 < len(wells):
+                return [rack_idx, list(wells)[used[-1] + 1]]
+
+            if rack_idx + 1 < len(tip_racks):
+                return [rack_idx + 1,
+                        next(iter(tip_racks[rack_idx + 1].wells_by_name()))]
+
+            return None
+
+    return None
@@ -0,0 +1,105 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import numpy as np
+
+from liv_ot.instrument import NULL
+from liv_ot.labware import Geometry, get_loaded_definition
+
+
+class DeckIndex():
+    '''Name-indexed lookup of loaded labware and their wells.
+
+    Geometries of labware in registry, if given (that labware was loaded
+    from), are taken from it; others are compiled from their definitions.'''
+
+    def __init__(self, instrumentation=NULL, registry=None):
+        self.__labware = {}
+        self.__wells = {}
+        self.__geometries = {}
+        self.__instrumentation = instrumentation
+        self.__registry = registry
+
+    def add(self, labware, name=None):
+        '''Index labware by name (by default, its own).'''
+        name = name or labware.name
+        self.__labware[name] = labware
+        self.__geometries.pop(name, None)
+
+        # Wells of a replaced labware must be resolved afresh:
+        self.__wells = {key: well for key, well in self.__wells.items()
+                        if key[0] != name}
+
+    def get_labware(self, name):
+        '''Get labware by name.'''
+        self.__instrumentation.count('deck_lookups')
+
+        try:
+            return self.__labware[name]
+        except KeyError:
+            raise ValueError('Unknown labware: %s' % name)
+
+    def get_geometry(self, name):
+        '''Get (compiled) Geometry of labware by name.'''
+        geometry = self.__geometries.get(name)
+
+        if geometry is None:
+            labware = self.get_labware(name)
+
+            if self.__registry and labware.load_name in self.__registry:
+                geometry = self.__registry.get(labware.load_name)
+            else:
+                geometry = Geometry.from_definition(
+                    get_loaded_definition(labware))
+
+            self.__geometries[name] = geometry
+
+        return geometry
+
+    def get_num_rows(self, name):
+        '''Get number of rows of labware.'''
+        return self.get_geometry(name).num_rows
+
+    def get_xy(self, name, rows, cols):
+        '''Get (n, 2) array of XY deck coordinates of well tops by row and
+        column indices.'''
+        offset = self.get_labware(name).calibrated_offset
+        xyz = self.get_geometry(name).get_xyz(rows, cols)
+
+        return xyz[:, :2] + np.array([offset.x, offset.y])
+
+    def get_well(self, plate_name, well_name):
+        '''Get (cached) well by plate and well name.'''
+        key = (plate_name, well_name)
+        well = self.__wells.get(key)
+
+        if well is None:
+            try:
+                well = self.get_labware(plate_name)[well_name]
+            except KeyError:
+                raise ValueError('Unknown well: %s %s' %
+                                 (plate_name, well_name))
+
+            self.__wells[key] = well
+            self.__instrumentation.count('wells_resolved')
+
+        return well
+
+    def get_location(self, plate_name, well_name, top=None, bottom=None):
+        '''Get well, or location offset from its top or bottom.'''
+        well = self.get_well(plate_name, well_name)
+
+        if top is not None:
+            return well.top(top)
+
+        if bottom is not None:
+            return well.bottom(bottom)
+
+        return well
+
+    def __contains__(self, name):
+        return name in self.__labware
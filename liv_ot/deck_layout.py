@@ -0,0 +1,198 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+from collections import Counter
+import itertools
+
+import numpy as np
+
+
+_TRASH = ('trash',)
+_SECTIONS = ['tip_racks', 'plates']
+
+
+def plan_setup(protocol, setup, pairs):
+    '''Plan slots for the tip racks and plates of setup.
+
+    pairs counts worklist rows by (src_plate, dest_plate). Each labware
+    pinned by a 'slot' in its setup entry keeps that slot. Returns slots
+    keyed by (section, index) and the expected travel (mm) of the planned
+    and of the first-free-slot layouts.'''
+    slot_xy = get_slot_xy(protocol)
+    free = _get_free_slots(protocol)
+    fixed = {_TRASH: int(protocol.fixed_trash.parent)}
+    keys = []
+    plate_keys = {}
+
+    for section in _SECTIONS:
+        for idx, item in enumerate(setup.get(section, [])):
+            key = (section, idx)
+            keys.append(key)
+
+            if section == 'plates':
+                plate_keys[item['name']] = key
+
+            if 'slot' in item:
+                slot = int(item['slot'])
+
+                if slot not in free or slot in fixed.values():
+                    raise ValueError('Slot %s unavailable for %s' %
+                                     (slot, item.get('name', item['type'])))
+
+                fixed[key] = slot
+
+    traffic = get_traffic(pairs, plate_keys,
+                          [key for key in keys if key[0] == 'tip_racks'])
+
+    naive = get_naive_layout(keys, free, fixed)
+    layout = plan_layout(keys, free, slot_xy, traffic, fixed)
+
+    return {key: layout[key] for key in keys}, \
+        get_cost(layout, slot_xy, traffic), \
+        get_cost(naive, slot_xy, traffic)
+
+
+def get_slot_xy(protocol):
+    '''Get XY deck coordinates of (integer) slots.'''
+    return {int(slot): np.array([protocol.deck.position_for(slot).point.x,
+                                 protocol.deck.position_for(slot).point.y])
+            for slot in protocol.deck}
+
+
+def get_nearest_slot(protocol, slot):
+    '''Get free slot nearest slot, or None if the deck is full.'''
+    slot_xy = get_slot_xy(protocol)
+    free = _get_free_slots(protocol)
+
+    if not free:
+        return None
+
+    return min(free, key=lambda free_slot: np.linalg.norm(
+        slot_xy[free_slot] - slot_xy[int(slot)]))
+
+
+def get_traffic(pairs, plate_keys, tip_rack_keys):
+    '''Get expected head moves between labware.
+
+    Each transfer is taken as one aspiration, moving source to destination,
+    destination to trash (for blow out) and trash back to source. Each tip
+    rack is visited once, from and to the trash.'''
+    traffic = Counter()
+
+    for (src, dest), num in pairs.items():
+        src = plate_keys.get(src)
+        dest = plate_keys.get(dest)
+
+        if src is not None and dest is not None:
+            traffic[src, dest] += num
+            traffic[dest, _TRASH] += num
+            traffic[_TRASH, src] += num
+
+    for key in tip_rack_keys:
+        traffic[key, _TRASH] += 2
+
+    return traffic
+
+
+def get_cost(layout, slot_xy, traffic):
+    '''Get expected travel (mm) of layout (labware key to slot).'''
+    return float(sum(num * np.linalg.norm(slot_xy[layout[key1]] -
+                                          slot_xy[layout[key2]])
+                     for (key1, key2), num in traffic.items()))
+
+
+def get_naive_layout(keys, free, fixed):
+    '''Get layout giving labware the first free slots, in order.'''
+    layout = dict(fixed)
+    slots = iter([slot for slot in free if slot not in fixed.values()])
+
+    for key in keys:
+        if key not in layout:
+            layout[key] = _next(slots)
+
+    return layout
+
+
+def plan_layout(keys, free, slot_xy, traffic, fixed):
+    '''Get layout minimising expected travel.
+
+    Labware are placed greedily, busiest first, each into the free slot
+    adding least travel; placements are then improved by swaps and moves
+    until none reduces travel.'''
+    layout = dict(fixed)
+    busy = Counter()
+
+    for (key1, key2), num in traffic.items():
+        busy[key1] += num
+        busy[key2] += num
+
+    movable = sorted([key for key in keys if key not in fixed],
+                     key=lambda key: -busy[key])
+
+    for key in movable:
+        slots = [slot for slot in free if slot not in layout.values()]
+
+        if not slots:
+            raise ValueError('Not enough free deck slots')
+
+        layout[key] = min(slots, key=lambda slot: _get_key_cost(
+            _with(layout, key, slot), key, slot_xy, traffic))
+
+    improved = True
+
+    while improved:
+        improved = False
+        cost = get_cost(layout, slot_xy, traffic)
+
+        for key1, key2 in itertools.combinations(movable, 2):
+            candidate = _with(_with(layout, key1, layout[key2]),
+                              key2, layout[key1])
+            candidate_cost = get_cost(candidate, slot_xy, traffic)
+
+            if candidate_cost < cost - 1e-6:
+                layout, cost, improved = candidate, candidate_cost, True
+
+        for key in movable:
+            for slot in free:
+                if slot in layout.values():
+                    continue
+
+                candidate = _with(layout, key, slot)
+                candidate_cost = get_cost(candidate, slot_xy, traffic)
+
+                if candidate_cost < cost - 1e-6:
+                    layout, cost, improved = candidate, candidate_cost, True
+
+    return layout
+
+
+def _get_key_cost(layout, key, slot_xy, traffic):
+    '''Get expected travel to and from key of placed labware.'''
+    return sum(num * np.linalg.norm(slot_xy[layout[key1]] -
+                                    slot_xy[layout[key2]])
+               for (key1, key2), num in traffic.items()
+               if key in (key1, key2) and key1 in layout and key2 in layout)
+
+
+def _with(layout, key, slot):
+    '''Get copy of layout with key in slot.'''
+    layout = dict(layout)
+    layout[key] = slot
+    return layout
+
+
+def _next(slots):
+    '''Get next slot, raising if none remain.'''
+    try:
+        return next(slots)
+    except StopIteration:
+        raise ValueError('Not enough free deck slots')
+
+
+def _get_free_slots(protocol):
+    '''Get free (integer) slots.'''
+    return [int(slot) for slot, obj in protocol.deck.items() if not obj]
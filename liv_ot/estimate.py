@@ -0,0 +1,113 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import numpy as np
+
+
+# OT-2 gantry defaults (mm/s); x is faster but y usually dominates:
+_XY_SPEED = 400.0
+_Z_SPEED = 125.0
+
+# Retract to and descend from safe height (mm) on each move between wells:
+_Z_TRAVEL = 2 * 30.0
+
+# Fixed times (s):
+_TIP_PICK_UP = 6.0
+_TIP_DROP = 4.0
+_TOUCH_TIP = 2.0
+
+PHASES = ['tips', 'travel', 'mix', 'aspirate', 'dispense', 'touch_tip',
+          'blow_out']
+
+
+def get_xy(locations):
+    '''Get (n, 2) array of XY deck coordinates of wells or Locations.'''
+    points = [loc.point if hasattr(loc, 'point') else loc.top().point
+              for loc in locations]
+
+    return np.array([[point.x, point.y] for point in points],
+                    dtype=np.float64).reshape(-1, 2)
+
+
+def estimate(steps, src_xy, dest_xy, trash_xy, disposal_volume=0.0,
+             touch_tip=True, blow_out=None, mix=None):
+    '''Estimate runtime (s) by phase of (pipette, Aspiration) steps.
+
+    Tips are blown out into the trash if blow_out, by default if there is
+    a disposal volume, any disposal volume otherwise being dispensed
+    there; mix is None or (repetitions, volume) of the source before each
+    aspiration.
+
+    src_xy and dest_xy are row-indexed XY coordinates, as from get_xy, so
+    may be computed once and reused to score many candidate plans.'''
+    phases = dict.fromkeys(PHASES, 0.0)
+
+    if blow_out is None:
+        blow_out = bool(disposal_volume)
+
+    pipettes = []
+
+    for pipette, asp in steps:
+        if pipette not in pipettes:
+            pipettes.append(pipette)
+            phases['tips'] += _TIP_PICK_UP
+
+        flow_rate = pipette.flow_rate
+        vol = sum(vol for _, vol in asp.dispenses)
+
+        phases['aspirate'] += (vol + disposal_volume) / flow_rate.aspirate
+        phases['dispense'] += vol / flow_rate.dispense
+
+        if mix:
+            repetitions, mix_vol = mix
+            mix_vol = min(mix_vol, pipette.max_volume)
+            phases['mix'] += repetitions * (mix_vol / flow_rate.aspirate +
+                                            mix_vol / flow_rate.dispense)
+
+        if touch_tip:
+            phases['touch_tip'] += _TOUCH_TIP * (len(asp.dispenses) + 1)
+
+        if blow_out:
+            phases['blow_out'] += pipette.max_volume / flow_rate.blow_out
+        elif disposal_volume:
+            phases['dispense'] += disposal_volume / flow_rate.dispense
+
+    phases['tips'] += _TIP_DROP * len(pipettes)
+
+    dists = _get_distances(steps, src_xy, dest_xy, trash_xy,
+                           blow_out or bool(disposal_volume))
+    phases['travel'] = float(dists.sum() / _XY_SPEED +
+                             len(dists) * _Z_TRAVEL / _Z_SPEED)
+
+    return phases
+
+
+def get_travel(steps, src_xy, dest_xy, trash_xy, to_trash=False):
+    '''Get head travel (mm) of (pipette, Aspiration) steps, visiting the
+    trash after each step if to_trash.'''
+    return float(_get_distances(steps, src_xy, dest_xy, trash_xy,
+                                to_trash).sum())
+
+
+def _get_distances(steps, src_xy, dest_xy, trash_xy, to_trash):
+    '''Get distances (mm) of moves between wells of steps.'''
+    path = []
+
+    for _, asp in steps:
+        path.append(src_xy[asp.src])
+        path.extend(dest_xy[pos] for pos, _ in asp.dispenses)
+
+        if to_trash:
+            path.append(trash_xy)
+
+    if steps:
+        path.append(trash_xy)
+
+    if len(path) < 2:
+        return np.zeros(0)
+
+    return np.linalg.norm(np.diff(np.array(path), axis=0), axis=1)
@@ -0,0 +1,182 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os.path
+import tempfile
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, url2pathname, urlopen
+
+
+_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'liv_ot')
+_CHUNK_SIZE = 2 ** 16
+_MAX_WORKERS = 8
+
+_executor = None
+
+
+def submit(func, *args, **kwargs):
+    '''Run func in the background, returning a Future.'''
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS,
+                                       thread_name_prefix='liv_ot_fetch')
+
+    return _executor.submit(func, *args, **kwargs)
+
+
+def fetch_json(url, **kwargs):
+    '''Fetch and parse JSON.'''
+    with open(fetch(url, **kwargs)) as json_file:
+        return json.load(json_file)
+
+
+def fetch(url, cache_dir=None, offline=False, max_age=0, timeout=30,
+          retries=2):
+    '''Fetch url (or local path), returning the path of a local copy.'''
+    for attempt in range(retries + 1):
+        try:
+            return _fetch(url, cache_dir, offline, max_age, timeout)
+        except HTTPError as err:
+            if err.code < 500 or attempt == retries:
+                raise
+        except (URLError, OSError):
+            if attempt == retries:
+                raise
+
+        time.sleep(0.5 * 2 ** attempt)
+
+    return None
+
+
+def _fetch(url, cache_dir, offline, max_age, timeout):
+    '''Fetch url (or local path) once.'''
+    local_path = _get_local_path(url)
+
+    if local_path:
+        return local_path
+
+    cache = Cache(cache_dir)
+    entry = cache.get(url)
+
+    if entry and (offline or time.time() - entry['fetched'] < max_age):
+        return cache.get_path(entry)
+
+    if offline:
+        raise ValueError('Not cached (offline): %s' % url)
+
+    request = Request(url, headers=_get_conditional_headers(entry))
+
+    try:
+        with urlopen(request, timeout=timeout) as response:
+            return cache.put(url, response)
+    except HTTPError as err:
+        if err.code == 304 and entry:
+            return cache.touch(url, entry)
+
+        # Server failing, so fall back to last good copy:
+        if err.code >= 500 and entry:
+            return cache.get_path(entry)
+
+        raise
+    except OSError:
+        # Network unavailable or timed out, so fall back to last good copy:
+        if entry:
+            return cache.get_path(entry)
+
+        raise
+
+
+class Cache():
+    '''Content-addressed on-disk cache of fetched urls.'''
+
+    def __init__(self, cache_dir=None):
+        self.__cache_dir = cache_dir or _CACHE_DIR
+        self.__obj_dir = os.path.join(self.__cache_dir, 'objects')
+        self.__idx_dir = os.path.join(self.__cache_dir, 'index')
+        os.makedirs(self.__obj_dir, exist_ok=True)
+        os.makedirs(self.__idx_dir, exist_ok=True)
+
+    def get(self, url):
+        '''Get index entry for url, or None if not cached.'''
+        try:
+            with open(self.__get_idx_path(url)) as idx_file:
+                entry = json.load(idx_file)
+        except (OSError, ValueError):
+            return None
+
+        return entry if os.path.exists(self.get_path(entry)) else None
+
+    def get_path(self, entry):
+        '''Get path of cached content.'''
+        return os.path.join(self.__obj_dir, entry['sha256'])
+
+    def put(self, url, response):
+        '''Store response content, returning its path.'''
+        sha256 = hashlib.sha256()
+
+        with tempfile.NamedTemporaryFile(dir=self.__obj_dir,
+                                         delete=False) as tmp_file:
+            for chunk in iter(lambda: response.read(_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+                tmp_file.write(chunk)
+
+        entry = {'url': url,
+                 'sha256': sha256.hexdigest(),
+                 'etag': response.headers.get('ETag'),
+                 'last_modified': response.headers.get('Last-Modified')}
+
+        os.replace(tmp_file.name, self.get_path(entry))
+        return self.touch(url, entry)
+
+    def touch(self, url, entry):
+        '''Record entry as freshly validated, returning its path.'''
+        entry['fetched'] = time.time()
+
+        with tempfile.NamedTemporaryFile('w', dir=self.__idx_dir,
+                                         delete=False) as tmp_file:
+            json.dump(entry, tmp_file)
+
+        os.replace(tmp_file.name, self.__get_idx_path(url))
+        return self.get_path(entry)
+
+    def __get_idx_path(self, url):
+        '''Get index path of url.'''
+        return os.path.join(self.__idx_dir,
+                            hashlib.sha256(url.encode()).hexdigest() + '.json')
+
+
+def _get_local_path(url):
+    '''Get local path from file url or path, or None if remote.'''
+    parsed = urlparse(url)
+
+    if parsed.scheme == 'file':
+        return url2pathname(parsed.path)
+
+    if parsed.scheme in ('http', 'https', 'ftp'):
+        return None
+
+    return url
+
+
+def _get_conditional_headers(entry):
+    '''Get conditional request headers from cached entry.'''
+    headers = {}
+
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    return headers
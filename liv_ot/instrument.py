@@ -0,0 +1,91 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+import json
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Instrumentation():
+    '''Phase timers and operation counters, reported as JSON.
+
+    If path is given, each completed phase and the final report are
+    appended to it as JSON lines as they happen.'''
+
+    def __init__(self, path=None):
+        self.__path = path
+        self.__phases = defaultdict(float)
+        self.__counters = Counter()
+
+    @contextmanager
+    def phase(self, name):
+        '''Time a phase (repeated phases accumulate).'''
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.__phases[name] += elapsed
+            self.__stream({'phase': name, 'time': elapsed})
+
+    def count(self, name, num=1):
+        '''Increment a counter.'''
+        self.__counters[name] += num
+
+    def report(self):
+        '''Get report.'''
+        return {'phases': dict(self.__phases),
+                'counters': dict(self.__counters),
+                'peak_memory_kb': _get_peak_memory()}
+
+    def close(self):
+        '''Stream final report.'''
+        self.__stream({'report': self.report()})
+
+    def __stream(self, record):
+        '''Append record to stream file, if any.'''
+        if self.__path:
+            with open(self.__path, 'a') as stream_file:
+                stream_file.write(json.dumps(record) + '\n')
+
+
+class _NullInstrumentation():
+    '''Do-nothing Instrumentation, used when instrumentation is disabled.'''
+
+    @staticmethod
+    def phase(_):
+        '''Time nothing.'''
+        return nullcontext()
+
+    def count(self, name, num=1):
+        '''Count nothing.'''
+
+    @staticmethod
+    def report():
+        '''Get empty report.'''
+        return {}
+
+    def close(self):
+        '''Do nothing.'''
+
+
+NULL = _NullInstrumentation()
+
+
+def _get_peak_memory():
+    '''Get peak resident memory (kB), where available.'''
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,197 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import glob
+import hashlib
+import json
+import os.path
+import tempfile
+
+import numpy as np
+
+from liv_ot.transfers import get_well_idx
+
+
+_PLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'data', 'plates')
+
+_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'liv_ot',
+                          'labware')
+
+# One record per well, in definition ordering (column by column):
+_DTYPE = np.dtype([('row', np.int16), ('col', np.int16),
+                   ('x', np.float32), ('y', np.float32), ('z', np.float32),
+                   ('depth', np.float32), ('diameter', np.float32),
+                   ('x_dim', np.float32), ('y_dim', np.float32),
+                   ('capacity', np.float32)])
+
+
+class Geometry():
+    '''Well geometry of a labware definition, as a NumPy record array.
+
+    Positions are relative to the labware, x, y and z being the centre of
+    each well's bottom. diameter is NaN for rectangular wells, x_dim and
+    y_dim NaN for circular wells.'''
+
+    def __init__(self, load_name, wells):
+        self.load_name = load_name
+        self.wells = wells
+        self.num_rows = int(wells['row'].max()) + 1 if len(wells) else 0
+        self.num_cols = int(wells['col'].max()) + 1 if len(wells) else 0
+
+        # (row, col) to position in wells, -1 where there is no well:
+        self.index = np.full((self.num_rows, self.num_cols), -1,
+                             dtype=np.int32)
+        self.index[wells['row'], wells['col']] = np.arange(len(wells))
+
+    @classmethod
+    def from_definition(cls, definition):
+        '''Compile from labware definition.'''
+        names = [name for col in definition['ordering'] for name in col]
+        wells = np.empty(len(names), dtype=_DTYPE)
+
+        for pos, name in enumerate(names):
+            well = definition['wells'][name]
+            row, col = get_well_idx(name)
+
+            wells[pos] = (row, col, well['x'], well['y'], well['z'],
+                          well['depth'], well.get('diameter', np.nan),
+                          well.get('xDimension', np.nan),
+                          well.get('yDimension', np.nan),
+                          well['totalLiquidVolume'])
+
+        return cls(definition['parameters']['loadName'], wells)
+
+    def find_idxs(self, rows, cols):
+        '''Get positions in wells of (row, col) indices, -1 where there is
+        no such well.'''
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+
+        valid = (rows >= 0) & (rows < self.num_rows) & \
+            (cols >= 0) & (cols < self.num_cols)
+
+        idxs = np.full(len(rows), -1, dtype=np.int64)
+        idxs[valid] = self.index[rows[valid], cols[valid]]
+
+        return idxs
+
+    def get_idxs(self, rows, cols):
+        '''Get positions in wells of (row, col) indices.'''
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        idxs = self.find_idxs(rows, cols)
+        invalid = np.flatnonzero(idxs < 0)
+
+        if len(invalid):
+            raise ValueError('Unknown wells in %s: rows %s, cols %s' %
+                             (self.load_name, rows[invalid].tolist(),
+                              cols[invalid].tolist()))
+
+        return idxs
+
+    def get_xyz(self, rows, cols):
+        '''Get (n, 3) array of well top centres, relative to the labware.'''
+        wells = self.wells[self.get_idxs(rows, cols)]
+
+        return np.stack([wells['x'], wells['y'],
+                         wells['z'] + wells['depth']],
+                        axis=1).astype(np.float64)
+
+
+class Registry():
+    '''Lazily compiled, memory-mapped geometry of custom labware.
+
+    Definitions are found as <plates_dir>/<load name>/<version>.json, the
+    latest version being used. Each is compiled once to a .npy file in
+    cache_dir, named by its content hash, so edits recompile it.'''
+
+    def __init__(self, plates_dir=None, cache_dir=None):
+        self.__cache_dir = cache_dir or _CACHE_DIR
+        self.__paths = {}
+        self.__geometries = {}
+
+        for path in glob.glob(os.path.join(plates_dir or _PLATES_DIR, '*',
+                                           '*.json')):
+            load_name = os.path.basename(os.path.dirname(path))
+            current = self.__paths.get(load_name)
+
+            if current is None or _get_version(path) > _get_version(current):
+                self.__paths[load_name] = path
+
+    def __contains__(self, load_name):
+        return load_name in self.__paths
+
+    def get(self, load_name):
+        '''Get Geometry by load name.'''
+        geometry = self.__geometries.get(load_name)
+
+        if geometry is None:
+            try:
+                path = self.__paths[load_name]
+            except KeyError:
+                raise ValueError('Unknown labware: %s' % load_name)
+
+            geometry = Geometry(load_name, self.__load(path))
+            self.__geometries[load_name] = geometry
+
+        return geometry
+
+    def get_definition(self, load_name):
+        '''Get (parsed) labware definition by load name.'''
+        try:
+            path = self.__paths[load_name]
+        except KeyError:
+            raise ValueError('Unknown labware: %s' % load_name)
+
+        with open(path) as def_file:
+            return json.load(def_file)
+
+    def get_definitions(self):
+        '''Get all labware definitions by load name.'''
+        return {load_name: self.get_definition(load_name)
+                for load_name in self.__paths}
+
+    def __load(self, path):
+        '''Load compiled wells of definition, compiling if required.'''
+        with open(path, 'rb') as def_file:
+            data = def_file.read()
+
+        npy_path = os.path.join(
+            self.__cache_dir, '%s-%s.npy' % (
+                os.path.basename(os.path.dirname(path)),
+                hashlib.sha256(data).hexdigest()[:16]))
+
+        if not os.path.exists(npy_path):
+            wells = Geometry.from_definition(json.loads(data)).wells
+            os.makedirs(self.__cache_dir, exist_ok=True)
+
+            with tempfile.NamedTemporaryFile(dir=self.__cache_dir,
+                                             suffix='.npy',
+                                             delete=False) as tmp_file:
+                np.save(tmp_file, wells)
+
+            os.replace(tmp_file.name, npy_path)
+
+        return np.load(npy_path, mmap_mode='r')
+
+
+def get_loaded_definition(labware):
+    '''Get definition of loaded labware, on any opentrons version.'''
+    # pylint: disable=protected-access
+    core = getattr(labware, '_core', None)
+
+    if core is not None:
+        return core.get_definition()
+
+    return labware._definition
+
+
+def _get_version(path):
+    '''Get definition version from path.'''
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return int(stem) if stem.isdigit() else -1
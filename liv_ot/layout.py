@@ -0,0 +1,90 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import numpy as np
+
+
+METHODS = ['column', 'serpentine', 'travel', 'random']
+
+
+def assign(geometry, num, method='column', rand=None, well_xy=None,
+           groups=None, src_xy=None):
+    '''Assign num destination wells of geometry, returning their positions
+    in geometry.wells, one per transfer.
+
+    method is one of:
+    column: column by column, in definition ordering.
+    serpentine: column by column, alternating direction down and up.
+    travel: the column- or row-wise (serpentine or not, either direction)
+        path minimising head travel, scored with XY deck coordinates
+        well_xy (per well) and src_xy (per transfer). Transfers sharing a
+        source (by groups, numbered in order of first appearance) receive
+        consecutive wells, as the planner dispenses them together.
+    random: shuffled by rand, a numpy RandomState.'''
+    if method not in METHODS:
+        raise ValueError('Unknown layout: %s' % method)
+
+    if num > len(geometry.wells):
+        raise ValueError('%d transfers exceed %d wells of %s' %
+                         (num, len(geometry.wells), geometry.load_name))
+
+    if method == 'column':
+        return np.arange(num)
+
+    if method == 'serpentine':
+        return _get_path(geometry.index.T, serpentine=True)[:num]
+
+    if method == 'random':
+        return rand.permutation(len(geometry.wells))[:num]
+
+    # Visit transfers grouped by source, keeping order within a source:
+    order = np.argsort(groups, kind='stable')
+    new_src = np.ones(num, dtype=bool)
+    new_src[1:] = groups[order][1:] != groups[order][:-1]
+
+    best = None
+
+    for path in get_paths(geometry):
+        dest_xy = well_xy[path[:num]]
+        prev = np.empty_like(dest_xy)
+        prev[1:] = dest_xy[:-1]
+        prev[new_src] = src_xy[order][new_src]
+        travel = np.linalg.norm(dest_xy - prev, axis=1).sum()
+
+        if best is None or travel < best[0]:
+            best = (travel, path)
+
+    positions = np.empty(num, dtype=np.int64)
+    positions[order] = best[1][:num]
+
+    return positions
+
+
+def get_paths(geometry):
+    '''Get candidate paths through all wells, as arrays of positions:
+    column-wise and row-wise, straight and serpentine, in both
+    directions.'''
+    paths = []
+
+    for grid in [geometry.index.T, geometry.index]:
+        for serpentine in [False, True]:
+            path = _get_path(grid, serpentine)
+            paths.extend([path, path[::-1]])
+
+    return paths
+
+
+def _get_path(grid, serpentine=False):
+    '''Get path through grid of positions row by row, reversing alternate
+    rows if serpentine.'''
+    grid = grid.copy()
+
+    if serpentine:
+        grid[1::2] = grid[1::2, ::-1]
+
+    path = grid.ravel()
+    return path[path >= 0]
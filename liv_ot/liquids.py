@@ -0,0 +1,93 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+LiquidClass = namedtuple('LiquidClass', ['name',
+                                         'aspirate_flow_rate',
+                                         'dispense_flow_rate',
+                                         'blow_out_flow_rate',
+                                         'touch_tip',
+                                         'blow_out',
+                                         'air_gap',
+                                         'disposal_volume',
+                                         'mix'])
+
+# Flow rates (uL/s) of None leave pipette defaults; mix is None or
+# [repetitions, volume], mixing the source before each aspiration:
+DEFAULT = LiquidClass(name='default',
+                      aspirate_flow_rate=None,
+                      dispense_flow_rate=None,
+                      blow_out_flow_rate=None,
+                      touch_tip=True,
+                      blow_out=True,
+                      air_gap=0.0,
+                      disposal_volume=50.0,
+                      mix=None)
+
+_FLOW_RATES = {'aspirate_flow_rate': 'aspirate',
+               'dispense_flow_rate': 'dispense',
+               'blow_out_flow_rate': 'blow_out'}
+
+
+def get_liquid_classes(setup):
+    '''Get LiquidClasses by name from setup's liquid_classes, each
+    defaulting unspecified properties to those of the default class (which
+    setup may itself redefine).'''
+    defs = setup.get('liquid_classes', {})
+    default = _get_liquid_class(DEFAULT, 'default', defs.get('default', {}))
+    liquid_classes = {'default': default}
+
+    for name, liquid_def in defs.items():
+        liquid_classes[name] = _get_liquid_class(default, name, liquid_def)
+
+    return liquid_classes
+
+
+def get_plate_classes(setup):
+    '''Get liquid class names by source plate name, from setup's plates.'''
+    return {plate['name']: plate['liquid_class']
+            for plate in setup.get('plates', [])
+            if plate.get('liquid_class')}
+
+
+@contextmanager
+def flow_rates(pipettes, liquid):
+    '''Set flow rates of pipettes for liquid, restoring them afterwards.'''
+    saved = [(pipette, {attr: getattr(pipette.flow_rate, attr)
+                        for attr in _FLOW_RATES.values()})
+             for pipette in pipettes]
+
+    for pipette in pipettes:
+        for field, attr in _FLOW_RATES.items():
+            if getattr(liquid, field) is not None:
+                setattr(pipette.flow_rate, attr, getattr(liquid, field))
+
+    try:
+        yield
+    finally:
+        for pipette, rates in saved:
+            for attr, rate in rates.items():
+                setattr(pipette.flow_rate, attr, rate)
+
+
+def _get_liquid_class(base, name, liquid_def):
+    '''Get LiquidClass from definition, defaulting to base.'''
+    unknown = set(liquid_def) - set(LiquidClass._fields)
+
+    if unknown:
+        raise ValueError('Unknown liquid class properties for %s: %s' %
+                         (name, ', '.join(sorted(unknown))))
+
+    liquid = base._replace(name=name, **liquid_def)
+
+    if liquid.mix is not None and len(liquid.mix) != 2:
+        raise ValueError('Invalid mix for %s: %s' % (name, liquid.mix))
+
+    return liquid
@@ -0,0 +1,104 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import numpy as np
+
+
+_CHANNELS = 8
+
+# Rows between adjacent channels, by number of rows in labware (0 being a
+# single-row trough that all channels dip into together):
+_STRIDES = {1: 0, 8: 1, 16: 2}
+
+_OFFSETS = ['src_top', 'src_bottom', 'dest_top', 'dest_bottom']
+
+
+def find_columns(transfers, get_num_rows):
+    '''Find transfers that together fill whole columns for an 8-channel.
+
+    A column is 8 transfers of equal volume and offsets from one source
+    column to one destination column, channel k of the destination (every
+    row of a 96-well plate, every other row of a 384-well plate) being fed
+    by channel k of the source, or by a single-row trough.
+
+    Returns (first-channel row indices, one per column; (columns, 8) array
+    of row indices of each column, by channel).'''
+    empty = np.array([], dtype=np.int64)
+
+    if not len(transfers):
+        return empty, empty.reshape(0, _CHANNELS)
+
+    strides = np.array([_STRIDES.get(get_num_rows(plate), -1)
+                        for plate in transfers.plates], dtype=np.int64)
+
+    src_stride = strides[transfers['src_plate']]
+    dest_stride = strides[transfers['dest_plate']]
+    src_row = transfers['src_row'].astype(np.int64)
+    dest_row = transfers['dest_row'].astype(np.int64)
+
+    dest_chan = dest_row // np.maximum(dest_stride, 1)
+    src_chan = np.where(src_stride == 0, dest_chan,
+                        src_row // np.maximum(src_stride, 1))
+
+    valid = np.flatnonzero((src_stride >= 0) & (dest_stride > 0) &
+                           (src_chan == dest_chan) &
+                           (dest_chan < _CHANNELS))
+
+    if not len(valid):
+        return empty, empty.reshape(0, _CHANNELS)
+
+    keys = np.stack(
+        [transfers['src_plate'][valid],
+         transfers['src_col'][valid],
+         (src_row % np.maximum(src_stride, 1))[valid],
+         transfers['dest_plate'][valid],
+         transfers['dest_col'][valid],
+         (dest_row % np.maximum(dest_stride, 1))[valid],
+         transfers['vol'][valid]] +
+        [np.nan_to_num(transfers[offset][valid], nan=np.inf)
+         for offset in _OFFSETS if offset in transfers],
+        axis=1).astype(np.float64)
+
+    groups = _get_ids(keys)
+
+    # Sort rows by group, channel and worklist order:
+    chans = dest_chan[valid]
+    order = np.lexsort([valid, chans, groups])
+    rows, chans, groups = valid[order], chans[order], groups[order]
+
+    # Rank each row among those of its group and channel:
+    starts = np.ones(len(rows), dtype=bool)
+    starts[1:] = (groups[1:] != groups[:-1]) | (chans[1:] != chans[:-1])
+    pos = np.arange(len(rows))
+    ranks = pos - np.maximum.accumulate(np.where(starts, pos, 0))
+
+    # Rows of equal group and rank form a column, if all channels are met:
+    cols = _get_ids(np.stack([groups, ranks], axis=1))
+    counts = np.bincount(cols)
+    full = counts[cols] == _CHANNELS
+
+    members = np.empty((len(counts), _CHANNELS), dtype=np.int64)
+    members[cols[full], chans[full]] = rows[full]
+    members = members[counts == _CHANNELS]
+    members = members[np.argsort(members[:, 0])]
+
+    return members[:, 0].copy(), members
+
+
+def _get_ids(keys):
+    '''Get dense ids of the rows of 2D array keys, equal rows sharing an
+    id.'''
+    order = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+
+    ids = np.empty(len(keys), dtype=np.int64)
+    ids[order] = np.cumsum(starts) - 1
+
+    return ids
@@ -0,0 +1,101 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import numpy as np
+
+
+_SRC_KEYS = ['src_plate', 'src_row', 'src_col']
+
+# Largest group of a source well ordered by 'nearest', as that is
+# quadratic in its size:
+_MAX_NEAREST = 1000
+_MAX_TWO_OPT_PASSES = 8
+
+
+def order_transfers(transfers, src_xy, dest_xy, method='nearest'):
+    '''Get order of destinations within each source well reducing travel.
+
+    method is 'nearest' (nearest neighbour improved by 2-opt, for source
+    wells of up to _MAX_NEAREST destinations, larger ones keeping their
+    order) or 'serpentine' (column by column, alternating direction).
+    Source wells are visited in order of first appearance.'''
+    if method not in ('nearest', 'serpentine'):
+        raise ValueError('Unknown ordering: %s' % method)
+
+    order = []
+
+    for _, group in transfers.group_idxs(*_SRC_KEYS):
+        if method == 'serpentine':
+            order.append(group[_serpentine(transfers, group)])
+        elif len(group) <= _MAX_NEAREST:
+            path = _nearest(src_xy[group[0]], dest_xy[group])
+            path = _two_opt(src_xy[group[0]], dest_xy[group], path)
+            order.append(group[path])
+        else:
+            order.append(group)
+
+    return np.concatenate(order) if order else np.array([], dtype=int)
+
+
+def _serpentine(transfers, group):
+    '''Get serpentine order of group's destinations.'''
+    cols = transfers['dest_col'][group].astype(np.int64)
+    rows = transfers['dest_row'][group].astype(np.int64)
+    rows = np.where(cols % 2, -rows, rows)
+
+    return np.lexsort([rows, cols, transfers['dest_plate'][group]])
+
+
+def _nearest(start, points):
+    '''Get nearest-neighbour path through points from start.'''
+    remaining = np.ones(len(points), dtype=bool)
+    path = np.empty(len(points), dtype=np.int64)
+    current = start
+
+    for step in range(len(points)):
+        dists = np.linalg.norm(points - current, axis=1)
+        dists[~remaining] = np.inf
+        nxt = int(np.argmin(dists))
+        path[step] = nxt
+        remaining[nxt] = False
+        current = points[nxt]
+
+    return path
+
+
+def _two_opt(start, points, path):
+    '''Improve open path from start through points by 2-opt moves.'''
+    pts = np.vstack([start, points[path]])
+    order = np.arange(len(pts))
+
+    for _ in range(_MAX_TWO_OPT_PASSES):
+        improved = False
+
+        for i in range(1, len(pts) - 1):
+            seq = pts[order]
+            j = np.arange(i + 1, len(pts))
+            nxt = np.minimum(j + 1, len(pts) - 1)
+            is_end = j == len(pts) - 1
+
+            old = np.linalg.norm(seq[i] - seq[i - 1]) + \
+                np.where(is_end, 0,
+                         np.linalg.norm(seq[nxt] - seq[j], axis=1))
+            new = np.linalg.norm(seq[j] - seq[i - 1], axis=1) + \
+                np.where(is_end, 0,
+                         np.linalg.norm(seq[nxt] - seq[i], axis=1))
+
+            gains = old - new
+            best = int(np.argmax(gains))
+
+            if gains[best] > 1e-6:
+                order[i:j[best] + 1] = order[i:j[best] + 1][::-1].copy()
+                improved = True
+
+        if not improved:
+            break
+
+    return path[order[1:] - 1]
@@ -0,0 +1,67 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import numpy as np
+
+from liv_ot.transfers import get_row
+
+
+def get_num_ops(vols, pipette, disposal_volume=0.0):
+    '''Get number of aspirations pipette needs per volume (inf if too small,
+    or if the disposal volume leaves no capacity).
+
+    Volumes are split into equal parts no larger than max_volume, less any
+    disposal volume (a scalar, or one per volume).'''
+    vols = np.asarray(vols, dtype=np.float64)
+    capacity = pipette.max_volume - np.asarray(disposal_volume,
+                                               dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        num_ops = np.ceil(vols / capacity - 1e-6)
+
+    return np.where((vols < pipette.min_volume) | ~(capacity > 0), np.inf,
+                    num_ops)
+
+
+def can_transfer(vols, pipettes, disposal_volume=0.0):
+    '''Get mask of volumes some pipette can transfer.'''
+    valid = np.zeros(len(vols), dtype=bool)
+
+    for pipette in pipettes:
+        valid |= np.isfinite(get_num_ops(vols, pipette, disposal_volume))
+
+    return valid
+
+
+def partition(transfers, pipettes, disposal_volume=0.0):
+    '''Assign each transfer to the pipette needing fewest aspirations.
+
+    Ties go to the pipette with the smallest max_volume, being the more
+    accurate. Returns a list of (pipette, row indices), omitting unused
+    pipettes.'''
+    pipettes = sorted(pipettes, key=lambda pip: pip.max_volume)
+
+    if not pipettes:
+        raise ValueError('No pipettes loaded')
+
+    num_ops = np.stack([get_num_ops(transfers['vol'], pip, disposal_volume)
+                        for pip in pipettes])
+
+    invalid = np.flatnonzero(np.isinf(num_ops.min(axis=0)))
+
+    if len(invalid):
+        raise ValueError('No pipette can transfer rows: %s' %
+                         ', '.join('%d (%s uL)' % (get_row(idx), vol)
+                                   for idx, vol in zip(
+                                       transfers['idx'][invalid].tolist(),
+                                       transfers['vol'][invalid].tolist())))
+
+    choice = num_ops.argmin(axis=0)
+
+    return [(pip, np.flatnonzero(choice == pip_idx))
+            for pip_idx, pip in enumerate(pipettes)
+            if np.any(choice == pip_idx)]
@@ -0,0 +1,193 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import hashlib
+import json
+import os.path
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from liv_ot.labware import get_loaded_definition
+from liv_ot.planner import Aspiration
+from liv_ot.transfers import TransferTable
+
+
+_PACKAGE = 'liv_ot'
+
+_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'liv_ot',
+                          'plans')
+_CHUNK_SIZE = 2 ** 16
+
+# Plans kept, least recently used being removed first, and their maximum
+# age (s) since last use:
+_MAX_PLANS = 256
+_MAX_AGE = 30 * 24 * 60 * 60
+
+
+class PlanCache():
+    '''On-disk cache of compiled plans, keyed by hash of their inputs.
+
+    A plan is a sequence of (TransferTable, steps, comments, pause, liquid
+    class name) calls, each step being a (pipette, Aspiration) pair and
+    pause being an operator message to pause with beforehand, or None.
+    Plans are stored as JSON lines, one per call, so that neither storing
+    nor replaying a plan holds it all in memory.
+
+    At most max_plans plans are kept, none unused for more than max_age
+    seconds.'''
+
+    def __init__(self, cache_dir=None, max_plans=_MAX_PLANS,
+                 max_age=_MAX_AGE):
+        self.__cache_dir = cache_dir or _CACHE_DIR
+        self.__max_plans = max_plans
+        self.__max_age = max_age
+        os.makedirs(self.__cache_dir, exist_ok=True)
+
+    def get(self, key, protocol):
+        '''Get plan, with pipettes loaded in protocol, as an iterator of
+        calls read as they are needed, or None.'''
+        path = self.__get_path(key)
+
+        try:
+            plan_file = open(path)
+
+            # Mark as used, so as to be removed last:
+            os.utime(path)
+        except OSError:
+            return None
+
+        return _read_calls(plan_file, protocol)
+
+    def put(self, key, plan):
+        '''Store plan.'''
+        with self.writer(key) as plan_writer:
+            for call in plan:
+                plan_writer.add(*call)
+
+    def writer(self, key):
+        '''Get PlanWriter, storing plan call by call.'''
+        return PlanWriter(self.__cache_dir, self.__get_path(key),
+                          self.__prune)
+
+    def __prune(self):
+        '''Remove plans beyond the maximum number or age.'''
+        plans = []
+
+        for entry in os.scandir(self.__cache_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    plans.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+
+        plans.sort(reverse=True)
+        expiry = time.time() - self.__max_age
+
+        for idx, (mtime, path) in enumerate(plans):
+            if idx >= self.__max_plans or mtime < expiry:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def __get_path(self, key):
+        '''Get path of plan.'''
+        return os.path.join(self.__cache_dir, key + '.json')
+
+
+class PlanWriter():
+    '''Writer of a plan, call by call, into a temporary file, stored as
+    the plan (then calling on_store) when closed, or discarded on error.'''
+
+    def __init__(self, cache_dir, path, on_store):
+        self.__path = path
+        self.__on_store = on_store
+        self.__file = tempfile.NamedTemporaryFile('w', dir=cache_dir,
+                                                  suffix='.tmp',
+                                                  delete=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__file.close()
+
+        if exc_type is None:
+            os.replace(self.__file.name, self.__path)
+            self.__on_store()
+        else:
+            os.remove(self.__file.name)
+
+    def add(self, transfers, steps, comments, pause, liquid_class):
+        '''Write call.'''
+        self.__file.write(json.dumps(
+            {'transfers': [list(record) for record in transfers],
+             'idx': transfers['idx'].tolist(),
+             'steps': [[pipette.mount, asp.src, asp.dispenses]
+                       for pipette, asp in steps],
+             'comments': comments,
+             'pause': pause,
+             'liquid_class': liquid_class}) + '\n')
+
+
+def get_key(protocol, setup, wrklst_path, **options):
+    '''Get plan key from setup, worklist content, writer options, the
+    definitions of loaded labware and pipettes and the sources of loaded
+    liv_ot modules, so that any change to planning invalidates plans.'''
+    sha256 = hashlib.sha256()
+
+    with open(wrklst_path, 'rb') as wrklst_file:
+        for chunk in iter(lambda: wrklst_file.read(_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+
+    labware = sorted([str(slot), obj.name, get_loaded_definition(obj)]
+                     for slot, obj in protocol.loaded_labwares.items())
+
+    pipettes = [[mount, pip.name, pip.channels, pip.min_volume,
+                 pip.max_volume]
+                for mount, pip in sorted(protocol.loaded_instruments.items())]
+
+    sha256.update(json.dumps([_get_sources_hash(), setup, options, labware,
+                              pipettes],
+                             sort_keys=True, default=str).encode())
+
+    return sha256.hexdigest()
+
+
+def _get_sources_hash():
+    '''Get hash of the sources of loaded liv_ot modules.'''
+    sha256 = hashlib.sha256()
+
+    for name, module in sorted(list(sys.modules.items())):
+        if name.split('.')[0] != _PACKAGE or module is None:
+            continue
+
+        sha256.update(name.encode())
+        sha256.update((module.__loader__.get_source(name) or '').encode())
+
+    return sha256.hexdigest()
+
+
+def _read_calls(plan_file, protocol):
+    '''Read calls of plan file, one JSON line at a time.'''
+    with plan_file:
+        for line in plan_file:
+            call = json.loads(line)
+            transfers = TransferTable.from_transfers(
+                [tuple(record) for record in call['transfers']])
+            transfers.columns['idx'] = np.array(call['idx'], dtype=np.int64)
+
+            steps = [(protocol.loaded_instruments[mount],
+                      Aspiration(src, [tuple(dispense)
+                                       for dispense in dispenses]))
+                     for mount, src, dispenses in call['steps']]
+
+            yield (transfers, steps, call['comments'], call['pause'],
+                   call['liquid_class'])
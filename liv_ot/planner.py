@@ -0,0 +1,346 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+from collections import namedtuple
+import math
+
+import numpy as np
+
+from liv_ot.estimate import estimate, get_travel, get_xy
+from liv_ot.instrument import NULL
+from liv_ot.liquids import DEFAULT, flow_rates
+from liv_ot.multichannel import find_columns
+from liv_ot.ordering import order_transfers
+from liv_ot.pipettes import can_transfer, partition
+
+
+_SRC_KEYS = ['src_plate', 'src_row', 'src_col']
+_TOLERANCE = 1e-6
+_CHANNELS = 8
+
+# Decimal places (uL) of summed volumes, dropping floating-point noise:
+_DECIMALS = 6
+
+Aspiration = namedtuple('Aspiration', ['src', 'dispenses'])
+
+
+def distribute(protocol, pipettes, transfers, srcs, dests, liquid=DEFAULT,
+               get_num_rows=None, instrumentation=NULL, steps=None,
+               checkpoint=None):
+    '''Plan transfers of a LiquidClass (unless steps are given, e.g. from a
+    cached plan), comment the plan summary and emit its commands, recording
+    progress to checkpoint, if given, unless simulating.'''
+    pipettes = list(pipettes)
+
+    if steps is None:
+        with instrumentation.phase('plan'):
+            steps = schedule(transfers, pipettes, _get_reserve(liquid),
+                             get_num_rows)
+
+    protocol.comment('Plan: %(aspirations)d aspirations, %(dispenses)d '
+                     'dispenses, %(tips)d tips, %(volume).1f uL drawn' %
+                     get_summary(steps, liquid.disposal_volume) +
+                     ('' if liquid.name == DEFAULT.name else
+                      ' (%s)' % liquid.name))
+
+    with flow_rates(pipettes, liquid):
+        if steps:
+            runtime = estimate(
+                steps, get_xy(srcs), get_xy(dests),
+                get_xy(pipettes[0].trash_container.wells()[:1])[0],
+                liquid.disposal_volume, liquid.touch_tip, liquid.blow_out,
+                liquid.mix)
+
+            protocol.comment('Estimated runtime: %.0f s (%s)' % (
+                sum(runtime.values()),
+                ', '.join('%s %.0f s' % item for item in runtime.items())))
+
+            instrumentation.count('estimated_runtime', sum(runtime.values()))
+
+        on_progress = None
+
+        # Simulation (including analysis of the protocol before a run)
+        # makes no progress, so must not mark transfers done:
+        if checkpoint and not protocol.is_simulating():
+            on_progress = checkpoint.recorder(
+                transfers, _get_columns(transfers, steps, get_num_rows),
+                liquid.disposal_volume)
+
+        with instrumentation.phase('execute'):
+            execute(steps, srcs, dests, liquid, instrumentation,
+                    on_progress)
+
+    return steps
+
+
+def schedule_ordered(transfers, pipettes, srcs, dests, method,
+                     liquid=DEFAULT, get_num_rows=None):
+    '''Get (pipette, Aspiration) steps of a LiquidClass visiting each source
+    well's destinations in order of method (see order_transfers), with the
+    estimated head travel (mm) of those steps and of unordered steps.
+
+    Aspirations take contiguous runs of the order, so keep its path.'''
+    pipettes = list(pipettes)
+    reserve = _get_reserve(liquid)
+    src_xy = get_xy(srcs)
+    dest_xy = get_xy(dests)
+    trash_xy = get_xy(pipettes[0].trash_container.wells()[:1])[0]
+
+    order = order_transfers(transfers, src_xy, dest_xy, method)
+    steps = _take_steps(schedule(transfers.take(order), pipettes, reserve,
+                                 get_num_rows, contiguous=True), order)
+    unordered = schedule(transfers, pipettes, reserve, get_num_rows)
+
+    to_trash = liquid.blow_out or bool(liquid.disposal_volume)
+
+    return (steps,
+            get_travel(steps, src_xy, dest_xy, trash_xy, to_trash),
+            get_travel(unordered, src_xy, dest_xy, trash_xy, to_trash))
+
+
+def schedule(transfers, pipettes, disposal_volume=0.0, get_num_rows=None,
+             contiguous=False):
+    '''Get (pipette, Aspiration) steps across pipettes.
+
+    If an 8-channel pipette is loaded and get_num_rows (plate name to
+    number of rows) is given, transfers filling whole columns go to it as
+    one step per column, addressed by their first-channel transfer, if it
+    can transfer their volume. Each
+    remaining transfer goes to the single-channel pipette needing fewest
+    aspirations. Steps are ordered by source well (in order of first
+    appearance), so that all pipettes work a source well before the head
+    moves on. Aspirations are packed as by plan, given contiguous.'''
+    src_ranks = np.empty(len(transfers), dtype=np.int64)
+
+    for rank, (_, group) in enumerate(transfers.group_idxs(*_SRC_KEYS)):
+        src_ranks[group] = rank
+
+    singles = [pip for pip in pipettes if pip.channels == 1]
+    multis = [pip for pip in pipettes if pip.channels == _CHANNELS]
+    single_idxs = np.arange(len(transfers))
+    steps = []
+
+    if multis and get_num_rows:
+        col_idxs, members = find_columns(transfers, get_num_rows)
+
+        # Columns no 8-channel pipette can transfer are left to singles:
+        valid = can_transfer(transfers['vol'][col_idxs], multis,
+                             disposal_volume)
+        col_idxs, members = col_idxs[valid], members[valid]
+        single_idxs = np.setdiff1d(single_idxs, members.ravel())
+
+        if len(col_idxs):
+            steps.extend(_get_steps(transfers, col_idxs, multis,
+                                    disposal_volume, contiguous))
+
+    if len(single_idxs):
+        steps.extend(_get_steps(transfers, single_idxs, singles,
+                                disposal_volume, contiguous))
+
+    steps.sort(key=lambda step: src_ranks[step[1].src])
+
+    return steps
+
+
+def plan(transfers, max_volume, disposal_volume=0.0, contiguous=False):
+    '''Pack each source well's dispenses into aspirations.
+
+    Dispenses are packed first-fit-decreasing into aspirations of at most
+    max_volume - disposal_volume, splitting any dispense that is larger,
+    or, if contiguous, in runs of their order, keeping any path it follows.
+    Each Aspiration holds the row position of its source and a list of
+    (row position, volume) dispenses, kept in their original order.'''
+    capacity = max_volume - disposal_volume
+
+    if capacity <= 0:
+        raise ValueError('Disposal volume %s exceeds max volume %s' %
+                         (disposal_volume, max_volume))
+
+    aspirations = []
+
+    for _, group in transfers.group_idxs(*_SRC_KEYS):
+        items = []
+
+        for pos, vol in zip(group.tolist(), transfers['vol'][group].tolist()):
+            num_parts = math.ceil(vol / capacity - _TOLERANCE)
+            items.extend([(pos, vol / num_parts)] * num_parts)
+
+        if contiguous:
+            bins = _next_fit(items, capacity)
+        else:
+            bins = [sorted(dispenses)
+                    for dispenses in _first_fit_decreasing(items, capacity)]
+
+        aspirations.extend(Aspiration(int(group[0]), dispenses)
+                           for dispenses in sorted(bins))
+
+    return aspirations
+
+
+def get_summary(steps, disposal_volume=0.0):
+    '''Get summary of (pipette, Aspiration) steps, volumes being over all
+    channels.'''
+    volume = sum(pipette.channels *
+                 (sum(vol for _, vol in asp.dispenses) + disposal_volume)
+                 for pipette, asp in steps)
+    pipettes = []
+
+    for pipette, _ in steps:
+        if pipette not in pipettes:
+            pipettes.append(pipette)
+
+    return {'aspirations': len(steps),
+            'dispenses': sum(len(asp.dispenses) for _, asp in steps),
+            'tips': sum(pipette.channels for pipette in pipettes),
+            'volume': volume}
+
+
+def execute(steps, srcs, dests, liquid=DEFAULT, instrumentation=NULL,
+            on_progress=None):
+    '''Emit aspirate / multi-dispense commands for (pipette, Aspiration)
+    steps, handling liquid as its LiquidClass, each pipette keeping one tip
+    throughout. Any disposal volume goes to the trash after each step.
+
+    on_progress, if given, is called with each step and the number of its
+    dispenses done, once aspirated and after each dispense.'''
+    pipettes = []
+
+    for pipette, asp in steps:
+        if pipette not in pipettes:
+            pipette.pick_up_tip()
+            pipettes.append(pipette)
+            instrumentation.count('tips', pipette.channels)
+
+        if liquid.mix:
+            repetitions, volume = liquid.mix
+            pipette.mix(repetitions, min(volume, pipette.max_volume),
+                        srcs[asp.src])
+            instrumentation.count('mixes')
+
+        pipette.aspirate(
+            round(sum(vol for _, vol in asp.dispenses) +
+                  liquid.disposal_volume, _DECIMALS),
+            srcs[asp.src])
+
+        if on_progress:
+            on_progress(pipette, asp, 0)
+
+        instrumentation.count('aspirations')
+        instrumentation.count('dispenses', len(asp.dispenses))
+
+        if liquid.touch_tip:
+            pipette.touch_tip()
+
+        if liquid.air_gap:
+            pipette.air_gap(liquid.air_gap)
+
+        for dispense_idx, (pos, vol) in enumerate(asp.dispenses):
+            # The air gap leaves with the first dispense:
+            pipette.dispense(vol if dispense_idx else vol + liquid.air_gap,
+                             dests[pos])
+
+            if on_progress:
+                on_progress(pipette, asp, dispense_idx + 1)
+
+            if liquid.touch_tip:
+                pipette.touch_tip()
+
+        if liquid.touch_tip:
+            instrumentation.count('touch_tips', len(asp.dispenses) + 1)
+
+        if liquid.blow_out:
+            pipette.blow_out(pipette.trash_container.wells()[0])
+            instrumentation.count('blow_outs')
+        elif liquid.disposal_volume:
+            # Without blowing out, the disposal volume must still be
+            # discarded, as it would otherwise accumulate in the tip:
+            pipette.dispense(liquid.disposal_volume,
+                             pipette.trash_container.wells()[0].top())
+            instrumentation.count('disposals')
+
+    for pipette in pipettes:
+        pipette.drop_tip()
+
+
+def _get_columns(transfers, steps, get_num_rows):
+    '''Get row positions of all channels by first-channel row position, for
+    multi-channel steps.'''
+    multi_pos = {pos for pipette, asp in steps if pipette.channels > 1
+                 for pos, _ in asp.dispenses}
+
+    if not get_num_rows or not multi_pos:
+        return {}
+
+    firsts, members = find_columns(transfers, get_num_rows)
+
+    # Columns left to single-channel pipettes are not expanded:
+    return {first: chans
+            for first, chans in zip(firsts.tolist(), members.tolist())
+            if first in multi_pos}
+
+
+def _get_steps(transfers, idxs, pipettes, disposal_volume, contiguous):
+    '''Get (pipette, Aspiration) steps for rows idxs, in pipette order.'''
+    steps = []
+    transfers = transfers.take(idxs)
+
+    for pipette, pip_idxs in partition(transfers, pipettes, disposal_volume):
+        steps.extend(_take_steps(
+            [(pipette, asp)
+             for asp in plan(transfers.take(pip_idxs), pipette.max_volume,
+                             disposal_volume, contiguous)],
+            idxs[pip_idxs]))
+
+    return steps
+
+
+def _take_steps(steps, rows):
+    '''Get steps with row positions mapped to rows.'''
+    return [(pipette,
+             Aspiration(int(rows[asp.src]),
+                        [(int(rows[pos]), vol) for pos, vol in asp.dispenses]))
+            for pipette, asp in steps]
+
+
+def _get_reserve(liquid):
+    '''Get tip capacity reserved by LiquidClass.'''
+    # Air gaps take up tip capacity, as disposal volumes do:
+    return liquid.disposal_volume + liquid.air_gap
+
+
+def _first_fit_decreasing(items, capacity):
+    '''Pack (pos, vol) items into bins of capacity.'''
+    bins = []
+    remaining = np.empty(len(items))
+
+    for pos, vol in sorted(items, key=lambda item: -item[1]):
+        fits = np.flatnonzero(remaining[:len(bins)] >= vol - _TOLERANCE)
+
+        if len(fits):
+            bins[fits[0]].append((pos, vol))
+            remaining[fits[0]] -= vol
+        else:
+            remaining[len(bins)] = capacity - vol
+            bins.append([(pos, vol)])
+
+    return bins
+
+
+def _next_fit(items, capacity):
+    '''Pack (pos, vol) items, in order, into bins of capacity.'''
+    bins = []
+    remaining = 0.0
+
+    for pos, vol in items:
+        if bins and remaining >= vol - _TOLERANCE:
+            bins[-1].append((pos, vol))
+            remaining -= vol
+        else:
+            bins.append([(pos, vol)])
+            remaining = capacity - vol
+
+    return bins
@@ -0,0 +1,558 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=import-outside-toplevel
+# pylint: disable=too-many-arguments
+# pylint: disable=unused-argument
+from collections import namedtuple
+import importlib.util
+import json
+import os.path
+
+from liv_ot.labware import Registry
+
+
+_TRASH = 'opentrons_1_trash_1100ml_fixed'
+
+# OT-2 deck slot pitch (mm):
+_COL_OFFSET = 132.5
+_ROW_OFFSET = 90.5
+
+_API_LEVEL = '2.0'
+# Commands are recorded as by this major version of opentrons, unless
+# another is installed:
+_LATEST_MAJOR_VERSION = 7
+
+_VERSIONS = {}
+
+_PIPETTE_SPECS = {}
+
+
+class Point(namedtuple('Point', ['x', 'y', 'z'])):
+    '''Deck coordinates.'''
+
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+
+Location = namedtuple('Location', ['point', 'labware'])
+
+
+class Well():
+    '''Well of Labware.'''
+
+    def __init__(self, well_def, parent, display_name, has_tip):
+        self.parent = parent
+        self.display_name = display_name
+        self.has_tip = has_tip
+        self.__depth = well_def['depth']
+        self.__position = Point(well_def['x'], well_def['y'],
+                                well_def['z'] + well_def['depth']) + \
+            parent.calibrated_offset
+
+    def top(self, z=0.0):
+        '''Get location of top of well, offset by z.'''
+        return Location(self.__position + Point(0, 0, z), self)
+
+    def bottom(self, z=0.0):
+        '''Get location of bottom of well, offset by z.'''
+        top = self.top()
+        return Location(Point(top.point.x, top.point.y,
+                              top.point.z - self.__depth + z), self)
+
+    def __repr__(self):
+        return self.display_name
+
+
+class Labware():
+    '''Labware loaded from a definition.'''
+
+    def __init__(self, definition, slot, position, label=None):
+        parameters = definition['parameters']
+        offset = definition['cornerOffsetFromSlot']
+
+        self.name = label or parameters['loadName']
+        self.load_name = parameters['loadName']
+        self.parent = str(slot)
+        self.is_tiprack = parameters['isTiprack']
+        self.calibrated_offset = Point(offset['x'], offset['y'],
+                                       offset['z']) + position
+        self._definition = definition
+        self._ordering = [well for col in definition['ordering']
+                          for well in col]
+        self.__display_name = '%s on %s' % (
+            label or definition['metadata']['displayName'], slot)
+        self.__wells = [Well(definition['wells'][well], self,
+                             '%s of %s' % (well, self.__display_name),
+                             self.is_tiprack)
+                        for well in self._ordering]
+        self.__wells_by_name = dict(zip(self._ordering, self.__wells))
+
+    def wells(self):
+        '''Get wells, in definition order (column by column).'''
+        return list(self.__wells)
+
+    def wells_by_name(self):
+        '''Get wells by name.'''
+        return dict(self.__wells_by_name)
+
+    def columns(self):
+        '''Get wells by column.'''
+        wells = iter(self.__wells)
+
+        return [[next(wells) for _ in col]
+                for col in self._definition['ordering']]
+
+    def next_tip(self, num_tips=1, starting_tip=None):
+        '''Get first well starting num_tips consecutive tips in a column,
+        at or after starting_tip, or None.'''
+        columns = self.columns()
+
+        if starting_tip:
+            while starting_tip not in columns[0]:
+                columns.pop(0)
+
+            columns[0] = columns[0][columns[0].index(starting_tip):]
+
+        for column in columns:
+            tips = []
+
+            for well in column:
+                if well.has_tip:
+                    tips.append(well)
+                elif tips:
+                    break
+
+            if len(tips) >= num_tips:
+                return tips[0]
+
+        return None
+
+    def use_tips(self, start_well, num_channels=1):
+        '''Mark tips used by a pipette of num_channels at start_well.'''
+        column = [col for col in self.columns() if start_well in col][0]
+        start = column.index(start_well)
+
+        for well in column[start:start + num_channels]:
+            well.has_tip = False
+
+    def __getitem__(self, key):
+        return self.__wells_by_name[key]
+
+    def __repr__(self):
+        return self.__display_name
+
+
+class Deck(dict):
+    '''Labware (or None) by integer slot.'''
+
+    def __init__(self):
+        super().__init__((slot, None) for slot in range(1, 13))
+
+    def position_for(self, slot):
+        '''Get location of the front-left corner of slot.'''
+        idx = self.__check(slot) - 1
+
+        return Location(Point((idx % 3) * _COL_OFFSET,
+                              idx // 3 * _ROW_OFFSET, 0), str(slot))
+
+    def __getitem__(self, slot):
+        return super().__getitem__(self.__check(slot))
+
+    def __check(self, slot):
+        '''Get slot as an integer.'''
+        try:
+            slot = int(slot)
+        except (TypeError, ValueError):
+            raise ValueError('Unknown slot: %s' % slot)
+
+        if slot not in self:
+            raise ValueError('Unknown slot: %s' % slot)
+
+        return slot
+
+
+class FlowRates():
+    '''Flow rates (uL/s) of a pipette.'''
+
+    def __init__(self, aspirate, dispense, blow_out):
+        self.aspirate = aspirate
+        self.dispense = dispense
+        self.blow_out = blow_out
+
+
+class Pipette():
+    '''Pipette recording the commands it is given.'''
+
+    def __init__(self, ctx, name, mount, tip_racks):
+        spec = _get_pipette_spec(name)
+
+        self.name = name
+        self.mount = mount
+        self.channels = spec['channels']
+        self.min_volume = spec['minVolume']
+        self.max_volume = spec['maxVolume']
+        self.flow_rate = FlowRates(
+            *[_get_flow_rate(spec[key]) for key in
+              ['defaultAspirateFlowRate', 'defaultDispenseFlowRate',
+               'defaultBlowOutFlowRate']])
+        self.tip_racks = list(tip_racks or [])
+        self.trash_container = ctx.fixed_trash
+        self.starting_tip = None
+        self.current_volume = 0.0
+        self.__ctx = ctx
+        self.__has_tip = False
+
+    def pick_up_tip(self, location=None):
+        '''Pick up tip from location, or the next available.'''
+        if isinstance(location, Location):
+            location = location.labware
+
+        if location is None:
+            tip_rack, location = self.__next_available_tip()
+        else:
+            tip_rack = location.parent
+
+        self.__ctx.record('Picking up tip from %s' % _stringify(location))
+        self.__move_to(location.top())
+        tip_rack.use_tips(location, self.channels)
+        self.__has_tip = True
+        return self
+
+    def drop_tip(self, location=None):
+        '''Drop tip into location, by default the trash.'''
+        target = location or self.trash_container.wells()[0].top()
+        self.__ctx.record('Dropping tip into %s' % _stringify(target))
+        self.__move_to(target)
+        self.__has_tip = False
+        self.current_volume = 0.0
+        return self
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        '''Aspirate volume from location (by default, the current one).'''
+        self.__check_tip()
+        location = self.__get_location(location, True)
+        volume = volume or self.max_volume - self.current_volume
+
+        if self.current_volume + volume > self.max_volume:
+            raise ValueError('Cannot aspirate more than pipette max volume')
+
+        self.__ctx.record('Aspirating %s uL from %s at %s' %
+                          (float(volume), _stringify(location),
+                           _get_speed(self.flow_rate.aspirate, rate)))
+        self.__move_to(location)
+        self.current_volume += volume
+        return self
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        '''Dispense volume to location (by default, the current one).'''
+        location = self.__get_location(location, False)
+        volume = volume or self.current_volume
+
+        self.__ctx.record('Dispensing %s uL into %s at %s' %
+                          (float(volume), _stringify(location),
+                           _get_speed(self.flow_rate.dispense, rate)))
+        self.__move_to(location)
+        self.current_volume = max(self.current_volume - volume, 0.0)
+        return self
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        '''Mix volume repetitions times at location.'''
+        self.__check_tip()
+        volume = volume or self.max_volume
+        self.__ctx.record('Mixing %s times with a volume of %s ul' %
+                          (repetitions, float(volume)))
+        self.aspirate(volume, location, rate)
+
+        for _ in range(repetitions - 1):
+            self.dispense(volume, rate=rate)
+            self.aspirate(volume, rate=rate)
+
+        self.dispense(volume, rate=rate)
+        return self
+
+    def air_gap(self, volume=None, height=None):
+        '''Aspirate air above the current well.'''
+        self.__check_tip()
+        self.__ctx.record('Air gap')
+
+        location = self.__ctx.location_cache
+
+        if not location or not isinstance(location.labware, Well):
+            raise ValueError('No previous well to perform air gap')
+
+        self.__move_to(location.labware.top(5 if height is None else height))
+        return self.aspirate(volume)
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0,
+                  speed=60.0):
+        '''Touch tip to the sides of the current well.'''
+        self.__check_tip()
+        self.__ctx.record('Touching tip')
+        return self
+
+    def blow_out(self, location=None):
+        '''Blow out at location (by default, the current one).'''
+        if location is not None:
+            self.__move_to(location.top() if isinstance(location, Well)
+                           else location)
+
+        self.__ctx.record('Blowing out' + ('' if location is None else
+                                           ' at %s' % _stringify(location)))
+        self.current_volume = 0.0
+        return self
+
+    def __get_location(self, location, aspirate):
+        '''Get location of a well or location, or the current one.'''
+        if isinstance(location, Well):
+            return location.bottom(1.0)
+
+        if location is None:
+            if not self.__ctx.location_cache:
+                raise ValueError('No location given to %s' %
+                                 ('aspirate' if aspirate else 'dispense'))
+
+            return self.__ctx.location_cache
+
+        return location
+
+    def __move_to(self, location):
+        '''Move to location.'''
+        self.__ctx.location_cache = location
+
+    def __check_tip(self):
+        '''Check a tip is attached.'''
+        if not self.__has_tip:
+            raise ValueError('Pipette %s has no tip' % self.name)
+
+    def __next_available_tip(self):
+        '''Get (tip rack, well) of next available tip.'''
+        tip_racks = self.tip_racks
+        start = self.starting_tip
+
+        if start is not None:
+            tip_racks = tip_racks[tip_racks.index(start.parent):]
+
+        for tip_rack in tip_racks:
+            tip = tip_rack.next_tip(self.channels, start or
+                                    tip_rack.wells()[0])
+
+            if tip:
+                return tip_rack, tip
+
+            start = None
+
+        raise ValueError('Out of tips')
+
+
+class PlanningContext():
+    '''Lightweight, pure-Python stand-in for an opentrons ProtocolContext,
+    implementing the subset used by ProtocolWriters and recording the same
+    commands, without the hardware stack.
+
+    Labware definitions are found in extra_labware (by load name), then
+    registry, then the definitions shipped with opentrons, if installed.'''
+
+    def __init__(self, extra_labware=None, registry=None):
+        self.deck = Deck()
+        self.location_cache = None
+        self.__extra_labware = extra_labware or {}
+        self.__registry = registry or Registry()
+        self.__instruments = {}
+        self.__commands = []
+        self.load_labware(_TRASH, 12)
+
+    @property
+    def fixed_trash(self):
+        '''Get the trash fixed to slot 12.'''
+        return self.deck[12]
+
+    @property
+    def loaded_labwares(self):
+        '''Get loaded labware by slot.'''
+        return {slot: labware for slot, labware in self.deck.items()
+                if labware is not None}
+
+    @property
+    def loaded_instruments(self):
+        '''Get loaded pipettes by mount.'''
+        return dict(self.__instruments)
+
+    def load_labware(self, load_name, location, label=None, namespace=None,
+                     version=None):
+        '''Load labware by load name into slot location.'''
+        return self.load_labware_from_definition(
+            get_labware_definition(load_name, namespace, version,
+                                   self.__extra_labware, self.__registry),
+            location, label)
+
+    def load_labware_from_definition(self, definition, location, label=None):
+        '''Load labware from definition into slot location.'''
+        slot = int(location)
+
+        if self.deck[slot] is not None:
+            raise ValueError('Deck location %s already has an item: %s' %
+                             (location, self.deck[slot]))
+
+        labware = Labware(definition, location,
+                          self.deck.position_for(slot).point, label)
+        self.deck[slot] = labware
+        return labware
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None,
+                        replace=False):
+        '''Load pipette onto mount.'''
+        mount = mount.lower()
+
+        if mount not in ['left', 'right']:
+            raise ValueError('Unknown mount: %s' % mount)
+
+        if mount in self.__instruments and not replace:
+            raise ValueError('Instrument already present in %s mount: %s' %
+                             (mount, self.__instruments[mount].name))
+
+        pipette = Pipette(self, instrument_name, mount, tip_racks)
+        self.__instruments[mount] = pipette
+        return pipette
+
+    def is_simulating(self):
+        '''Get whether simulating, as always.'''
+        return True
+
+    def comment(self, msg):
+        '''Add comment.'''
+        self.record(msg)
+
+    def pause(self, msg=None):
+        '''Pause.'''
+        self.record('Pausing robot operation' +
+                    ('' if msg is None else ': %s' % msg))
+
+    def commands(self):
+        '''Get text of recorded commands.'''
+        return self.__commands
+
+    def record(self, text):
+        '''Record command text.'''
+        self.__commands.append(text)
+
+
+def _stringify(location):
+    '''Get location text, as in opentrons command logs.'''
+    if isinstance(location, Location):
+        if isinstance(location.labware, str):
+            return location.labware
+
+        if location.labware is not None:
+            return repr(location.labware)
+
+        return str(location.point)
+
+    return repr(location)
+
+
+def _get_speed(flow_rate, rate):
+    '''Get text of aspirate or dispense speed, as in opentrons command
+    logs: the flow rate (uL/s) from opentrons 4, the rate before.'''
+    if _get_major_version() < 4:
+        return '%s speed' % float(rate)
+
+    return '%s uL/sec' % float(flow_rate * rate)
+
+
+def _get_major_version():
+    '''Get major version of opentrons, if installed, or else of the latest
+    supported, without importing opentrons.'''
+    if not _VERSIONS:
+        try:
+            version = _get_version('opentrons')
+        except Exception:  # pylint: disable=broad-except
+            version = None
+
+        _VERSIONS['opentrons'] = int(version.split('.')[0]) if version \
+            else _LATEST_MAJOR_VERSION
+
+    return _VERSIONS['opentrons']
+
+
+def _get_version(package):
+    '''Get version of installed package.'''
+    try:
+        from importlib import metadata
+    except ImportError:
+        # Before Python 3.8:
+        import pkg_resources
+        return pkg_resources.get_distribution(package).version
+
+    return metadata.version(package)
+
+
+def _get_flow_rate(flow_rate_spec):
+    '''Get default flow rate (uL/s) of apiLevel 2.0 from specification.'''
+    return flow_rate_spec.get('valuesByApiLevel', {}).get(
+        _API_LEVEL, flow_rate_spec['value'])
+
+
+def get_labware_definition(load_name, namespace=None, version=None,
+                           extra_labware=None, registry=None):
+    '''Get labware definition by load name, from extra_labware, registry
+    or else the definitions shipped with opentrons, if installed.'''
+    if extra_labware and load_name in extra_labware:
+        return extra_labware[load_name]
+
+    if registry is not None and load_name in registry:
+        return registry.get_definition(load_name)
+
+    shared_data = _get_shared_data()
+
+    if shared_data and namespace in [None, 'opentrons']:
+        path = os.path.join(shared_data, 'labware', 'definitions', '2',
+                            load_name, '%d.json' % (version or 1))
+
+        if os.path.exists(path):
+            with open(path) as def_file:
+                return json.load(def_file)
+
+    raise ValueError('Unknown labware: %s' % load_name)
+
+
+def _get_pipette_spec(name):
+    '''Get pipette specification by name.'''
+    if not _PIPETTE_SPECS:
+        shared_data = _get_shared_data()
+
+        # Specifications moved to a versioned directory in later releases:
+        for subdir in [['1'], []]:
+            path = os.path.join(shared_data or '', 'pipette', 'definitions',
+                                *subdir, 'pipetteNameSpecs.json')
+
+            if shared_data and os.path.exists(path):
+                with open(path) as specs_file:
+                    _PIPETTE_SPECS.update(json.load(specs_file))
+
+                break
+
+    try:
+        return _PIPETTE_SPECS[name]
+    except KeyError:
+        raise ValueError('Unknown pipette: %s' % name)
+
+
+def _get_shared_data():
+    '''Get directory of opentrons shared data, if installed, without
+    importing opentrons.'''
+    for package, subdir in [('opentrons_shared_data', 'data'),
+                            ('opentrons', 'shared_data')]:
+        spec = importlib.util.find_spec(package)
+
+        if spec and spec.submodule_search_locations:
+            path = os.path.join(spec.submodule_search_locations[0], subdir)
+
+            if os.path.isdir(path):
+                return path
+
+    return None
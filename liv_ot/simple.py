@@ -5,15 +5,26 @@ All rights reserved.
 
 @author: neilswainston
 '''
+# pylint: disable=import-outside-toplevel
 # pylint: disable=invalid-name
 # pylint: disable=protected-access
 # pylint: disable=too-few-public-methods
-import csv
-import json
+from contextlib import nullcontext
 import os.path
-from urllib.request import urlopen
 
-from opentrons import simulate
+import numpy as np
+
+from liv_ot.checkpoint import get_checkpoint
+from liv_ot.deck import DeckIndex
+from liv_ot.deck_layout import plan_setup
+from liv_ot.fetch import fetch, fetch_json, submit
+from liv_ot.instrument import NULL
+from liv_ot.liquids import DEFAULT, get_liquid_classes, get_plate_classes
+from liv_ot.plan_cache import PlanCache, get_key
+from liv_ot.planner import distribute, schedule_ordered
+from liv_ot.transfers import TransferTable, batch, count_plate_pairs, \
+    iter_transfers
+from liv_ot.validate import Validator, get_volumes
 
 
 metadata = {'apiLevel': '2.0',
@@ -21,9 +32,20 @@ metadata = {'apiLevel': '2.0',
             'description': 'simple'}
 
 
+# Setup and worklist of run, and any checkpoint (a path on the robot) and
+# whether to resume from it, replaced in bundled protocols:
+SETUP_URL = 'http://bit.ly/genemill-ot-setup'
+WRKLST_URL = 'http://bit.ly/genemill-ot-worklist'
+CHECKPOINT = None
+RESUME = False
+
+
 def run(protocol):
     '''Run protocol.'''
-    writer = ProtocolWriter(protocol)
+    writer = ProtocolWriter(protocol, SETUP_URL, WRKLST_URL,
+                            plan_cache=PlanCache(),
+                            checkpoint=CHECKPOINT,
+                            resume=RESUME)
     writer.write()
 
 
@@ -31,28 +53,109 @@ class ProtocolWriter():
     '''Class to write protocol from CSV file.'''
 
     def __init__(self, protocol,
-                 setup_url='http://bit.ly/genemill-ot-setup',
-                 wrklst_url='http://bit.ly/genemill-ot-worklist'):
+                 setup_url=SETUP_URL,
+                 wrklst_url=WRKLST_URL,
+                 cache_dir=None,
+                 offline=False,
+                 batch_size=1024,
+                 order=None,
+                 instrumentation=None,
+                 plan_cache=None,
+                 checkpoint=None,
+                 resume=False,
+                 registry=None):
         self.__protocol = protocol
-
-        # Parse setup:
-        with urlopen(setup_url) as setup_file:
-            self.__setup = json.load(setup_file)
-
-        # Parse csv file:
-        self.__hdr_idxs, self.__rows = read_csv(wrklst_url)
+        self.__instrumentation = instrumentation or NULL
+        self.__deck = DeckIndex(self.__instrumentation, registry)
+
+        # Fetch setup and csv file concurrently:
+        self.__setup_ftr = submit(fetch_json, setup_url,
+                                  cache_dir=cache_dir, offline=offline)
+        self.__wrklst_ftr = submit(fetch, wrklst_url,
+                                   cache_dir=cache_dir, offline=offline)
+
+        self.__setup = None
+        self.__slots = None
+        self.__liquids = None
+        self.__plate_liquids = None
+        self.__batch_size = batch_size
+        self.__order = order
+        self.__plan_cache = plan_cache
+        self.__plan = None
+        self.__checkpoint, self.__resume = get_checkpoint(checkpoint,
+                                                          resume)
 
     def write(self):
         '''Write protocol.'''
 
+        # Wait for inputs:
+        with self.__instrumentation.phase('fetch'):
+            self.__setup = self.__setup_ftr.result()
+            wrklst_path = self.__wrklst_ftr.result()
+
         # Setup:
-        self.__do_setup()
+        with self.__instrumentation.phase('setup'):
+            with open(wrklst_path, newline='') as csv_file:
+                self.__do_setup(count_plate_pairs(csv_file))
+
+        # Replay cached plan, if any:
+        key = None
+
+        if self.__plan_cache and not self.__resume:
+            key = get_key(self.__protocol, self.__setup, wrklst_path,
+                          writer='simple', batch_size=self.__batch_size,
+                          order=self.__order)
+            plan = self.__plan_cache.get(key, self.__protocol)
+
+            if plan is not None:
+                self.__replay(plan)
+                self.__instrumentation.close()
+                return
+
+        # Validate whole worklist before adding any functions:
+        with self.__instrumentation.phase('validate'):
+            with open(wrklst_path, newline='') as csv_file:
+                self.__validate(iter_transfers(csv_file))
+
+        if self.__resume:
+            with open(wrklst_path, newline='') as csv_file:
+                vols = [transfer.vol for transfer in iter_transfers(csv_file)]
+
+            self.__protocol.comment(
+                self.__checkpoint.get_summary(range(len(vols)), vols))
+
+        # Add functions, writing their plan as they go, if caching:
+        with (self.__plan_cache.writer(key) if key else
+              nullcontext()) as self.__plan:
+            with open(wrklst_path, newline='') as csv_file:
+                transfers = iter_transfers(csv_file)
+
+                for idx, transfer_batch in enumerate(
+                        batch(transfers, self.__batch_size)):
+                    self.__instrumentation.count('transfers',
+                                                 len(transfer_batch))
+                    self.__add_funcs(
+                        TransferTable.from_transfers(transfer_batch,
+                                                     idx * self.__batch_size),
+                        [transfer.liquid_class
+                         for transfer in transfer_batch])
+
+        self.__instrumentation.close()
+
+    def __do_setup(self, pairs):
+        '''Setup.'''
 
-        # Add functions:
-        self.__add_funcs()
+        # Plan deck layout:
+        self.__slots, travel, naive_travel = plan_setup(
+            self.__protocol, self.__setup, pairs)
 
-    def __do_setup(self):
-        '''Setup.'''
+        self.__protocol.comment(
+            'Deck layout: expected travel %.0f mm (first free slots: %.0f mm)'
+            % (travel, naive_travel))
+
+        # Setup liquid classes:
+        self.__liquids = get_liquid_classes(self.__setup)
+        self.__plate_liquids = get_plate_classes(self.__setup)
 
         # Setup tip racks:
         tip_racks = self.__add_tip_racks()
@@ -67,129 +170,175 @@ class ProtocolWriter():
         '''Add tip racks.'''
         tip_racks = {}
 
-        for tip_rack_def in self.__setup['tip_racks']:
+        for idx, tip_rack_def in enumerate(self.__setup['tip_racks']):
             tip_rack = self.__protocol.load_labware(
                 tip_rack_def['type'],
-                self.__next_empty_slot())
-            tip_racks[tip_rack] = tip_rack_def.get('start_at_tip', 'A1')
+                self.__slots['tip_racks', idx])
+            self.__deck.add(tip_rack)
+            self.__instrumentation.count('labware_loads')
+            tip_racks[tip_rack] = tip_rack_def
 
         return tip_racks
 
     def __add_pipettes(self, tip_racks):
-        '''Add pipettes.'''
+        '''Add pipettes, each with the tip racks of its mount (or of no
+        mount).'''
         for mount, instrument_name in self.__setup['pipettes'].items():
+            racks = [tip_rack for tip_rack, tip_rack_def in tip_racks.items()
+                     if tip_rack_def.get('mount', mount) == mount]
+
             pipette = self.__protocol.load_instrument(
-                instrument_name, mount, tip_racks=list(tip_racks))
+                instrument_name, mount, tip_racks=racks)
 
-            for tip_rack, start_at_tip in tip_racks.items():
-                pipette.starting_tip = tip_rack[start_at_tip]
+            for tip_rack in racks:
+                pipette.starting_tip = tip_rack[
+                    tip_racks[tip_rack].get('start_at_tip', 'A1')]
+
+            if self.__resume and self.__checkpoint.next_tip.get(mount):
+                rack_idx, well_name = self.__checkpoint.next_tip[mount]
+                pipette.starting_tip = racks[rack_idx][well_name]
 
     def __add_plates(self):
         '''Add plates.'''
-        for plate in self.__setup['plates']:
-            self.__protocol.load_labware(plate['type'],
-                                         self.__next_empty_slot(),
-                                         plate['name'])
-
-    def __add_funcs(self):
-        '''Add functions.'''
-        src_plates = []
-        dest_plates = []
-        src_wells = []
-        dest_wells = []
-        vols = []
-        tops = []
-
-        for row in self.__rows:
-            src_plate = get_obj(
-                row[self.__hdr_idxs['src_plate']], self.__protocol)
-            dest_plate = get_obj(
-                row[self.__hdr_idxs['dest_plate']], self.__protocol)
-            src_plates.append(src_plate)
-            dest_plates.append(dest_plate)
-            src_wells.append(row[self.__hdr_idxs['src_well']])
-            dest_wells.append(row[self.__hdr_idxs['dest_well']])
-            vols.append(float(row[self.__hdr_idxs['vol']]))
-
-            if 'dest_top' in self.__hdr_idxs:
-                tops.append(float(row[self.__hdr_idxs['dest_top']]))
-
-        pipette = get_pipette(vols, self.__protocol)
-
-        if tops:
-            dests = \
-                [plate[well].top(top)
-                 for plate, well, top in zip(dest_plates, dest_wells, tops)]
-        else:
-            dests = [plate[well]
-                     for plate, well in zip(dest_plates, dest_wells)]
-
-        pipette.distribute(
-            vols,
-            [plate[well] for plate, well in zip(src_plates, src_wells)],
+        for idx, plate in enumerate(self.__setup['plates']):
+            self.__deck.add(
+                self.__protocol.load_labware(plate['type'],
+                                             self.__slots['plates', idx],
+                                             plate['name']))
+            self.__instrumentation.count('labware_loads')
+
+    def __validate(self, transfers):
+        '''Validate Transfers, raising ValueError listing all errors.'''
+        validator = Validator(self.__deck,
+                              self.__protocol.loaded_instruments.values(),
+                              self.__liquids, get_volumes(self.__setup))
+
+        for idx, transfer_batch in enumerate(
+                batch(transfers, self.__batch_size)):
+            table = TransferTable.from_transfers(transfer_batch,
+                                                 idx * self.__batch_size)
+            validator.add(table, self.__get_liquid_names(
+                table, [transfer.liquid_class
+                        for transfer in transfer_batch]).tolist())
+
+        validator.check()
+
+    def __add_funcs(self, transfers, liquid_classes):
+        '''Add functions, in batches by liquid class.'''
+        names = self.__get_liquid_names(transfers, liquid_classes)
+
+        for name in dict.fromkeys(names.tolist()):
+            self.__add_liquid_funcs(transfers.filter(names == name),
+                                    self.__get_liquid(name))
+
+    def __add_liquid_funcs(self, transfers, liquid):
+        '''Add functions for transfers of a LiquidClass.'''
+        comments = []
+
+        if self.__resume:
+            transfers = self.__checkpoint.get_remaining(transfers)
+
+            if not len(transfers):
+                return
+
+        with self.__instrumentation.phase('resolve'):
+            srcs = [self.__deck.get_location(transfer.src_plate,
+                                             transfer.src_well,
+                                             transfer.src_top,
+                                             transfer.src_bottom)
+                    for transfer in transfers]
+            dests = [self.__deck.get_location(transfer.dest_plate,
+                                              transfer.dest_well,
+                                              transfer.dest_top,
+                                              transfer.dest_bottom)
+                     for transfer in transfers]
+
+        steps = None
+
+        if self.__order:
+            with self.__instrumentation.phase('order'):
+                steps, travel, unordered = schedule_ordered(
+                    transfers, self.__protocol.loaded_instruments.values(),
+                    srcs, dests, self.__order, liquid,
+                    self.__deck.get_num_rows)
+
+            comments.append('Estimated travel: %.0f mm (unordered: %.0f mm)'
+                            % (travel, unordered))
+
+        for comment in comments:
+            self.__protocol.comment(comment)
+
+        steps = distribute(
+            self.__protocol,
+            self.__protocol.loaded_instruments.values(),
+            transfers,
+            srcs,
             dests,
-            touch_tip=True,
-            disposal_volume=50)
-
-    def __next_empty_slot(self):
-        '''Get next empty slot.'''
-        for slot, obj in self.__protocol.deck.items():
-            if not obj:
-                return slot
-
-        return None
-
-
-def read_csv(csv_url):
-    '''Read csv.'''
-    with urlopen(csv_url) as csv_file:
-        csv_reader = csv.reader(csv_file.read().decode().splitlines())
-
-        header_line = True
-        headers = None
-        rows = []
-
-        for row in csv_reader:
-            if header_line:
-                headers = row
-                header_line = False
-            else:
-                rows.append(row)
-
-        return {header: idx for idx, header in enumerate(headers)}, rows
-
-
-def get_obj(obj_name, protocol):
-    '''Get object.'''
-    for val in protocol.deck.values():
-        if val and val.name == obj_name:
-            return val
-
-    return None
-
-
-def get_pipette(vols, protocol):
-    '''Get appropriate pipette for volume.'''
-
-    # Ensure pipette is appropriate for minimum volume:
-    valid_pipettes = [pip for pip in protocol.loaded_instruments.values()
-                      if pip.min_volume <= min(vols)]
-
-    if not valid_pipettes:
-        return None
-
-    # Calculate number of operations per pipette:
-    num_ops = {pip: sum([vol // pip.max_volume for vol in vols])
-               for pip in valid_pipettes}
-
-    num_ops = {k: v for k, v in sorted(
-        num_ops.items(), key=lambda item: item[1])}
-
-    return next(iter(num_ops))
+            liquid=liquid,
+            get_num_rows=self.__deck.get_num_rows,
+            instrumentation=self.__instrumentation,
+            steps=steps,
+            checkpoint=self.__checkpoint)
+
+        if self.__plan:
+            self.__plan.add(transfers, steps, comments, None, liquid.name)
+
+    def __replay(self, plan):
+        '''Replay cached plan, skipping parsing, ordering and planning.'''
+        for transfers, steps, comments, pause, liquid_name in plan:
+            if pause:
+                self.__protocol.pause(pause)
+
+            for comment in comments:
+                self.__protocol.comment(comment)
+
+            with self.__instrumentation.phase('resolve'):
+                srcs = [self.__deck.get_location(transfer.src_plate,
+                                                 transfer.src_well,
+                                                 transfer.src_top,
+                                                 transfer.src_bottom)
+                        for transfer in transfers]
+                dests = [self.__deck.get_location(transfer.dest_plate,
+                                                  transfer.dest_well,
+                                                  transfer.dest_top,
+                                                  transfer.dest_bottom)
+                         for transfer in transfers]
+
+            distribute(
+                self.__protocol,
+                self.__protocol.loaded_instruments.values(),
+                transfers,
+                srcs,
+                dests,
+                liquid=self.__get_liquid(liquid_name),
+                get_num_rows=self.__deck.get_num_rows,
+                instrumentation=self.__instrumentation,
+                steps=steps,
+                checkpoint=self.__checkpoint)
+
+    def __get_liquid_names(self, transfers, liquid_classes):
+        '''Get liquid class names of transfers, by row or else by source
+        plate.'''
+        return np.array([
+            liquid_class or
+            self.__plate_liquids.get(src_plate, DEFAULT.name)
+            for liquid_class, src_plate in zip(liquid_classes,
+                                               transfers.get_plates('src'))],
+                        dtype=object)
+
+    def __get_liquid(self, name):
+        '''Get LiquidClass by name.'''
+        try:
+            return self.__liquids[name]
+        except KeyError:
+            raise ValueError('Unknown liquid class: %s' % name)
 
 
 def main():
     '''main method.'''
+    # Deferred, as initialising the simulator is slow:
+    from opentrons import simulate
+
     filename = os.path.realpath(__file__)
 
     with open(filename) as protocol_file:
@@ -5,18 +5,28 @@ All rights reserved.
 
 @author: neilswainston
 '''
+# pylint: disable=import-outside-toplevel
 # pylint: disable=invalid-name
 # pylint: disable=protected-access
 # pylint: disable=too-few-public-methods
-from functools import partial
-import json
+from contextlib import nullcontext
+import math
 import os.path
 import random
-from urllib.request import urlopen
 
-from opentrons import simulate
+import numpy as np
 
-import pandas as pd
+from liv_ot.checkpoint import get_checkpoint
+from liv_ot.deck import DeckIndex
+from liv_ot.deck_layout import get_nearest_slot, plan_setup
+from liv_ot.fetch import fetch, fetch_json, submit
+from liv_ot.instrument import NULL
+from liv_ot.liquids import DEFAULT, get_liquid_classes, get_plate_classes
+from liv_ot.layout import assign
+from liv_ot.plan_cache import PlanCache, get_key
+from liv_ot.planner import distribute, schedule_ordered
+from liv_ot.transfers import TransferTable, get_well_idx, get_well_name
+from liv_ot.validate import Validator, get_volumes
 
 
 metadata = {'apiLevel': '2.0',
@@ -24,9 +34,20 @@ metadata = {'apiLevel': '2.0',
             'description': 'simple'}
 
 
+# Setup and worklist of run, and any checkpoint (a path on the robot) and
+# whether to resume from it, replaced in bundled protocols:
+SETUP_URL = 'http://bit.ly/genemill-ot-setup'
+WRKLST_URL = 'http://bit.ly/genemill-ot-worklist'
+CHECKPOINT = None
+RESUME = False
+
+
 def run(protocol):
     '''Run protocol.'''
-    writer = ProtocolWriter(protocol)
+    writer = ProtocolWriter(protocol, SETUP_URL, WRKLST_URL,
+                            plan_cache=PlanCache(),
+                            checkpoint=CHECKPOINT,
+                            resume=RESUME)
     writer.write()
 
 
@@ -34,33 +55,125 @@ class ProtocolWriter():
     '''Class to write protocol from CSV file.'''
 
     def __init__(self, protocol,
-                 setup_url='http://bit.ly/genemill-ot-setup',
-                 wrklst_url='http://bit.ly/genemill-ot-worklist',
-                 random_dests=True):
+                 setup_url=SETUP_URL,
+                 wrklst_url=WRKLST_URL,
+                 random_dests=True,
+                 dest_layout=None,
+                 seed=None,
+                 layout_out=None,
+                 cache_dir=None,
+                 offline=False,
+                 order=None,
+                 instrumentation=None,
+                 plan_cache=None,
+                 checkpoint=None,
+                 resume=False,
+                 registry=None):
         self.__protocol = protocol
+        self.__instrumentation = instrumentation or NULL
+        self.__deck = DeckIndex(self.__instrumentation, registry)
+
+        # Fetch and parse setup and csv file concurrently:
+        self.__setup_ftr = submit(fetch_json, setup_url,
+                                  cache_dir=cache_dir, offline=offline)
+        self.__df_ftr = submit(_read_wrklst, wrklst_url,
+                               cache_dir=cache_dir, offline=offline)
+
+        self.__setup = None
+        self.__slots = None
+        self.__liquids = None
+        self.__plate_liquids = None
+        self.__df = None
+
+        # Overflow destination plate name to (plate, swap number), for
+        # plates swapped in place of plate once the deck is full:
+        self.__swaps = {}
+
+        # Set destination layout (random unless random_dests is False),
+        # recording a fresh seed so that random layouts can be reproduced:
+        self.__dest_layout = dest_layout or \
+            ('random' if random_dests else 'column')
+
+        generated = seed is None and self.__dest_layout == 'random'
 
-        # Parse setup:
-        with urlopen(setup_url) as setup_file:
-            self.__setup = json.load(setup_file)
+        if generated:
+            seed = random.SystemRandom().randrange(2 ** 32)
 
-        # Parse csv file:
-        self.__df = pd.read_csv(wrklst_url)
+        self.__seed = seed
+        self.__layout_out = layout_out
 
-        # Set randomise destinations:
-        self.__random_dests = random_dests
+        # Set transfer ordering:
+        self.__order = order
+
+        # Set plan cache, unless the seed was generated, as a plan for it
+        # would never be used again:
+        self.__plan_cache = None if generated else plan_cache
+        self.__plan = None
+
+        # Set checkpoint, resuming from it (and its layout seed) if required:
+        self.__checkpoint, self.__resume = get_checkpoint(checkpoint,
+                                                          resume)
+
+        if self.__checkpoint:
+            if self.__resume and self.__checkpoint.seed is not None:
+                self.__seed = self.__checkpoint.seed
+
+            self.__checkpoint.seed = self.__seed
 
     def write(self):
         '''Write protocol.'''
 
-        # Setup:
-        self.__do_setup()
+        # Wait for inputs:
+        with self.__instrumentation.phase('fetch'):
+            self.__setup = self.__setup_ftr.result()
+            wrklst_path, self.__df = self.__df_ftr.result()
 
-        # Add functions:
-        self.__add_funcs()
+        self.__instrumentation.count('transfers', len(self.__df.index))
 
-    def __do_setup(self):
+        # Setup:
+        with self.__instrumentation.phase('setup'):
+            self.__do_setup(self.__df.groupby(['src_plate', 'dest_plate'])
+                            .size().to_dict())
+            self.__add_overflow_plates()
+
+        # Replay cached plan, if any:
+        key = None
+
+        if self.__plan_cache and not self.__resume:
+            key = get_key(self.__protocol, self.__setup, wrklst_path,
+                          writer='simple_pandas',
+                          dest_layout=self.__dest_layout,
+                          seed=self.__seed,
+                          order=self.__order)
+            plan = self.__plan_cache.get(key, self.__protocol)
+
+            if plan is not None:
+                self.__replay(plan)
+                self.__instrumentation.close()
+                return
+
+        # Add functions, writing their plan as they go, if caching:
+        with (self.__plan_cache.writer(key) if key else
+              nullcontext()) as self.__plan:
+            self.__add_funcs()
+
+        self.__instrumentation.close()
+
+    def __do_setup(self, pairs):
         '''Setup.'''
 
+        # Plan deck layout:
+        self.__slots, travel, naive_travel = plan_setup(
+            self.__protocol, self.__setup, pairs)
+
+        self.__protocol.comment(
+            'Deck layout: expected travel %.0f mm (first free slots: %.0f mm)'
+            % (travel, naive_travel))
+
+        # Setup liquid classes:
+        self.__liquids = get_liquid_classes(self.__setup)
+        self.__plate_liquids = get_plate_classes(self.__setup)
+
         # Setup tip racks:
         tip_racks = self.__add_tip_racks()
 
@@ -74,125 +187,331 @@ class ProtocolWriter():
         '''Add tip racks.'''
         tip_racks = {}
 
-        for tip_rack_def in self.__setup['tip_racks']:
+        for idx, tip_rack_def in enumerate(self.__setup['tip_racks']):
             tip_rack = self.__protocol.load_labware(
                 tip_rack_def['type'],
-                self.__next_empty_slot())
-            tip_racks[tip_rack] = tip_rack_def.get('start_at_tip', 'A1')
+                self.__slots['tip_racks', idx])
+            self.__deck.add(tip_rack)
+            self.__instrumentation.count('labware_loads')
+            tip_racks[tip_rack] = tip_rack_def
 
         return tip_racks
 
     def __add_pipettes(self, tip_racks):
-        '''Add pipettes.'''
+        '''Add pipettes, each with the tip racks of its mount (or of no
+        mount).'''
         for mount, instrument_name in self.__setup['pipettes'].items():
+            racks = [tip_rack for tip_rack, tip_rack_def in tip_racks.items()
+                     if tip_rack_def.get('mount', mount) == mount]
+
             pipette = self.__protocol.load_instrument(
-                instrument_name, mount, tip_racks=list(tip_racks))
+                instrument_name, mount, tip_racks=racks)
+
+            for tip_rack in racks:
+                pipette.starting_tip = tip_rack[
+                    tip_racks[tip_rack].get('start_at_tip', 'A1')]
 
-            for tip_rack, start_at_tip in tip_racks.items():
-                pipette.starting_tip = tip_rack[start_at_tip]
+            if self.__resume and self.__checkpoint.next_tip.get(mount):
+                rack_idx, well_name = self.__checkpoint.next_tip[mount]
+                pipette.starting_tip = racks[rack_idx][well_name]
 
     def __add_plates(self):
         '''Add plates.'''
-        for plate in self.__setup['plates']:
-            self.__protocol.load_labware(plate['type'],
-                                         self.__next_empty_slot(),
-                                         plate['name'])
+        for idx, plate in enumerate(self.__setup['plates']):
+            self.__deck.add(
+                self.__protocol.load_labware(plate['type'],
+                                             self.__slots['plates', idx],
+                                             plate['name']))
+            self.__instrumentation.count('labware_loads')
+
+    def __add_overflow_plates(self):
+        '''Add plates for destinations overflowing their plate, named
+        <plate>_2, <plate>_3 etc., into free slots or, once the deck is
+        full, to be swapped in place of plate.'''
+        if 'dest_well' in self.__df:
+            return
+
+        for plate, count in self.__df['dest_plate'].value_counts(
+                sort=False).items():
+            # Unknown plates are left to validation to report:
+            if plate not in self.__deck:
+                continue
+
+            labware = self.__deck.get_labware(plate)
+            num_wells = len(self.__deck.get_geometry(plate).wells)
+            num_swaps = 0
+
+            for idx in range(2, math.ceil(count / num_wells) + 1):
+                name = '%s_%d' % (plate, idx)
+
+                if name in self.__deck:
+                    raise ValueError('Overflow plate already loaded: %s' %
+                                     name)
+
+                slot = get_nearest_slot(self.__protocol,
+                                        labware.parent)
+
+                if slot is None:
+                    num_swaps += 1
+                    self.__deck.add(labware, name)
+                    self.__swaps[name] = (plate, num_swaps)
+                else:
+                    self.__deck.add(self.__protocol.load_labware(
+                        labware.load_name, slot, name))
+                    self.__instrumentation.count('labware_loads')
 
     def __add_funcs(self):
         '''Add functions.'''
-        self.__process_wklst()
+        comments = []
+
+        with self.__instrumentation.phase('process'):
+            comments.extend(self.__process_wklst())
+            transfers = TransferTable.from_frame(self.__df)
+
+        # Batch by liquid class, by row or else by source plate:
+        names = self.__df['src_plate'].map(self.__plate_liquids)
+
+        if 'liquid_class' in self.__df:
+            names = self.__df['liquid_class'].where(
+                self.__df['liquid_class'].notna(), names)
+
+        names = names.fillna(DEFAULT.name).to_numpy()
+
+        # Validate whole worklist before adding any functions:
+        with self.__instrumentation.phase('validate'):
+            validator = Validator(self.__deck,
+                                  self.__protocol.loaded_instruments.values(),
+                                  self.__liquids, get_volumes(self.__setup))
+            validator.add(transfers, names.tolist())
+            validator.check()
+
+        if self.__resume:
+            self.__protocol.comment(self.__checkpoint.get_summary(
+                transfers['idx'].tolist(), transfers['vol'].tolist()))
+
+        with self.__instrumentation.phase('resolve'):
+            srcs = _get_locations(self.__df, self.__deck, 'src')
+            dests = _get_locations(self.__df, self.__deck, 'dest')
+
+        # Run transfers to swapped-in plates after the plates they replace:
+        swaps = self.__df['dest_plate'].map(
+            {plate: swap for plate, (_, swap) in self.__swaps.items()}
+        ).fillna(0).to_numpy()
+
+        for swap in np.unique(swaps):
+            pause = None
+
+            if swap:
+                pause = 'Replace plates: %s' % ', '.join(
+                    '%s with %s' % (plate, name)
+                    for name, (plate, num) in self.__swaps.items()
+                    if num == swap)
+
+                self.__protocol.pause(pause)
+
+            for name in dict.fromkeys(names[swaps == swap].tolist()):
+                self.__distribute(
+                    transfers.filter((swaps == swap) & (names == name)),
+                    srcs, dests, comments, pause, self.__get_liquid(name))
+                comments = []
+                pause = None
+
+    def __distribute(self, transfers, srcs, dests, comments, pause, liquid):
+        '''Order, plan and add functions for transfers of a LiquidClass.'''
+        if self.__resume:
+            transfers = self.__checkpoint.get_remaining(transfers)
+
+            if not len(transfers):
+                for comment in comments:
+                    self.__protocol.comment(comment)
+
+                return
+
+        srcs = [srcs[idx] for idx in transfers['idx']]
+        dests = [dests[idx] for idx in transfers['idx']]
+        steps = None
+
+        if self.__order:
+            with self.__instrumentation.phase('order'):
+                steps, travel, unordered = schedule_ordered(
+                    transfers, self.__protocol.loaded_instruments.values(),
+                    srcs, dests, self.__order, liquid,
+                    self.__deck.get_num_rows)
+
+            comments.append('Estimated travel: %.0f mm (unordered: %.0f mm)'
+                            % (travel, unordered))
+
+        for comment in comments:
+            self.__protocol.comment(comment)
+
+        steps = distribute(
+            self.__protocol,
+            self.__protocol.loaded_instruments.values(),
+            transfers,
+            srcs,
+            dests,
+            liquid=liquid,
+            get_num_rows=self.__deck.get_num_rows,
+            instrumentation=self.__instrumentation,
+            steps=steps,
+            checkpoint=self.__checkpoint)
+
+        if self.__plan:
+            self.__plan.add(transfers, steps, comments, pause, liquid.name)
+
+    def __replay(self, plan):
+        '''Replay cached plan, skipping parsing, ordering and planning.'''
+        for transfers, steps, comments, pause, liquid_name in plan:
+            if pause:
+                self.__protocol.pause(pause)
+
+            for comment in comments:
+                self.__protocol.comment(comment)
+
+            with self.__instrumentation.phase('resolve'):
+                srcs = [self.__deck.get_location(transfer.src_plate,
+                                                 transfer.src_well,
+                                                 transfer.src_top,
+                                                 transfer.src_bottom)
+                        for transfer in transfers]
+                dests = [self.__deck.get_location(transfer.dest_plate,
+                                                  transfer.dest_well,
+                                                  transfer.dest_top,
+                                                  transfer.dest_bottom)
+                         for transfer in transfers]
+
+            distribute(
+                self.__protocol,
+                self.__protocol.loaded_instruments.values(),
+                transfers,
+                srcs,
+                dests,
+                liquid=self.__get_liquid(liquid_name),
+                get_num_rows=self.__deck.get_num_rows,
+                instrumentation=self.__instrumentation,
+                steps=steps,
+                checkpoint=self.__checkpoint)
+
+    def __get_liquid(self, name):
+        '''Get LiquidClass by name.'''
+        try:
+            return self.__liquids[name]
+        except KeyError:
+            raise ValueError('Unknown liquid class: %s' % name)
+
+    def __process_wklst(self):
+        '''Process worklist, returning comments on destinations assigned.'''
+        import pandas as pd
+
+        dfs = []
 
-        get_src_well = partial(
-            _get_well, protocol=self.__protocol, is_src=True)
+        if 'dest_well' not in self.__df:
+            rand = np.random.RandomState(self.__seed)
 
-        get_dest_well = partial(
-            _get_well, protocol=self.__protocol, is_src=False)
+            for plate, plate_df in self.__df.groupby('dest_plate'):
+                # Rows of unknown plates are left to validation to report,
+                # given any well:
+                if plate not in self.__deck:
+                    dfs.append(plate_df.assign(dest_well='A1'))
+                    continue
 
-        pipette = self.__get_pipette()
+                geometry = self.__deck.get_geometry(plate)
+                num_wells = len(geometry.wells)
 
-        pipette.distribute(
-            self.__df['vol'].tolist(),
-            self.__df.apply(get_src_well, axis=1).tolist(),
-            self.__df.apply(get_dest_well, axis=1).tolist(),
-            touch_tip=True,
-            disposal_volume=50)
+                # Fill plate, then any overflow plates, in worklist order:
+                for start in range(0, len(plate_df.index), num_wells):
+                    df = plate_df.iloc[start:start + num_wells].copy()
 
-    def __process_wklst(self):
-        '''Process worklist.'''
-        dfs = []
+                    if start:
+                        df['dest_plate'] = '%s_%d' % (
+                            plate, start // num_wells + 1)
 
-        if 'dest_well' not in self.__df:
-            for plate, df in self.__df.groupby('dest_plate'):
-                df = df.copy()
-                plate = _get_obj(plate, self.__protocol)
-                wells = [well for well in plate._ordering]
+                    df['dest_well'] = self.__assign(df, geometry, rand)
+                    dfs.append(df)
+
+            # Restore worklist order, by which transfers are numbered:
+            self.__df = pd.concat(dfs).sort_index()
 
-                if self.__random_dests:
-                    random.shuffle(wells)
+            if self.__layout_out:
+                self.__df.to_csv(self.__layout_out, index=False)
 
-                df['dest_well'] = wells[:len(df.index)]
-                dfs.append(df)
+            return ['Destination layout: %s%s' %
+                    (self.__dest_layout,
+                     ' (seed %d)' % self.__seed
+                     if self.__dest_layout == 'random' else '')]
 
-        self.__df = pd.concat(dfs)
+        return []
 
-    def __next_empty_slot(self):
-        '''Get next empty slot.'''
-        for slot, obj in self.__protocol.deck.items():
-            if not obj:
-                return slot
+    def __assign(self, df, geometry, rand):
+        '''Assign destination well names to worklist rows.'''
+        plate = df['dest_plate'].iloc[0]
+        well_xy = src_xy = groups = None
 
-        return None
+        if self.__dest_layout == 'travel':
+            well_xy = self.__deck.get_xy(plate, geometry.wells['row'],
+                                         geometry.wells['col'])
+            src_xy = _get_xy(df, self.__deck, 'src')
+            groups = df.groupby(['src_plate', 'src_well'],
+                                sort=False).ngroup().to_numpy()
 
-    def __get_pipette(self):
-        '''Get appropriate pipette for volume.'''
-        vols = self.__df['vol']
+        wells = geometry.wells[assign(geometry, len(df.index),
+                                      self.__dest_layout, rand, well_xy,
+                                      groups, src_xy)]
 
-        # Ensure pipette is appropriate for minimum volume:
-        valid_pipettes = \
-            [pip for pip in self.__protocol.loaded_instruments.values()
-             if pip.min_volume <= min(vols)]
+        return [get_well_name(row, col)
+                for row, col in zip(wells['row'].tolist(),
+                                    wells['col'].tolist())]
 
-        if not valid_pipettes:
-            return None
 
-        # Calculate number of operations per pipette:
-        num_ops = {pip: sum([vol // pip.max_volume for vol in vols])
-                   for pip in valid_pipettes}
+def _read_wrklst(url, **kwargs):
+    '''Read worklist, returning its local path and DataFrame.'''
+    # Deferred, so that importing this module does not import pandas:
+    import pandas as pd
 
-        num_ops = {k: v for k, v in sorted(
-            num_ops.items(), key=lambda item: item[1])}
+    path = fetch(url, **kwargs)
+    return path, pd.read_csv(path)
 
-        return next(iter(num_ops))
 
+def _get_xy(df, deck, prefix):
+    '''Get (n, 2) array of well XY deck coordinates.'''
+    coords = np.empty((len(df.index), 2), dtype=np.float64)
+    plates = df[prefix + '_plate'].to_numpy()
+    idxs = np.array([get_well_idx(well) for well in df[prefix + '_well']],
+                    dtype=np.int64).reshape(-1, 2)
 
-def _get_obj(obj_name, protocol):
-    '''Get object.'''
-    for val in protocol.deck.values():
-        if val and val.name == obj_name:
-            return val
+    for plate in dict.fromkeys(plates.tolist()):
+        mask = plates == plate
+        coords[mask] = deck.get_xy(plate, idxs[mask, 0], idxs[mask, 1])
 
-    return None
+    return coords
 
 
-def _get_well(row, protocol, is_src=True):
-    '''Get well.'''
-    prefix = 'src' if is_src else 'dest'
-    plate = _get_obj(row['%s_plate' % prefix], protocol)
-    well = plate[row['%s_well' % prefix]]
+def _get_locations(df, deck, prefix):
+    '''Get well locations, resolving each distinct (plate, well, offset)
+    once and joining the result back onto the worklist.'''
+    cols = [col for col in ['%s_%s' % (prefix, suffix)
+                            for suffix in ['plate', 'well', 'top', 'bottom']]
+            if col in df]
 
-    top = '%s_top' % prefix
-    bottom = '%s_bottom' % prefix
+    keys = df[cols].drop_duplicates()
+    offsets = keys.reindex(columns=[prefix + '_top', prefix + '_bottom'])
+    offsets = offsets.astype(object).where(offsets.notna(), None)
 
-    if top in row:
-        well.top(row[top])
-    elif bottom in row:
-        well.bottom(row[bottom])
+    keys['location'] = [
+        deck.get_location(plate, well, top, bottom)
+        for plate, well, top, bottom in zip(keys[prefix + '_plate'],
+                                            keys[prefix + '_well'],
+                                            offsets[prefix + '_top'],
+                                            offsets[prefix + '_bottom'])]
 
-    return well
+    return df[cols].merge(keys, how='left', on=cols)['location'].tolist()
 
 
 def main():
     '''main method.'''
+    # Deferred, as initialising the simulator is slow:
+    from opentrons import simulate
+
     filename = os.path.realpath(__file__)
 
     with open(filename) as protocol_file:
@@ -0,0 +1,261 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+from collections import Counter, namedtuple
+import csv
+from itertools import islice
+import re
+
+import numpy as np
+
+
+_REQUIRED = ['src_plate', 'src_well', 'dest_plate', 'dest_well', 'vol']
+_OFFSETS = ['src_top', 'src_bottom', 'dest_top', 'dest_bottom']
+
+_OPTIONAL = _OFFSETS + ['liquid_class']
+
+Transfer = namedtuple('Transfer', _REQUIRED + _OPTIONAL,
+                      defaults=[None] * len(_OPTIONAL))
+
+_WELL_RE = re.compile(r'^([A-Z]+)(\d+)$')
+_WELL_IDXS = {}
+
+
+class TransferTable():
+    '''Columnar, NumPy-backed table of transfers.
+
+    Plates are stored as integer codes into plates, wells as zero-based
+    row and column indices, volumes and (optional) offsets as float64, so
+    that they reach commands exactly as given.
+    idx holds each transfer's position in the original worklist.'''
+
+    def __init__(self, plates, columns):
+        self.plates = plates
+        self.columns = columns
+
+    @classmethod
+    def from_transfers(cls, transfers, start=0):
+        '''Build from Transfer records.'''
+        return cls.from_columns(
+            dict(zip(Transfer._fields, zip(*transfers)))
+            if transfers else {}, start)
+
+    @classmethod
+    def from_frame(cls, df):
+        '''Build from worklist DataFrame.'''
+        return cls.from_columns({field: df[field].tolist()
+                                 for field in Transfer._fields
+                                 if field in df})
+
+    @classmethod
+    def from_columns(cls, values, start=0):
+        '''Build from dict of column name to sequence of values.'''
+        plates = {}
+        num_rows = len(values.get('vol', []))
+        columns = {'idx': np.arange(start, start + num_rows, dtype=np.int64)}
+
+        for prefix in ['src', 'dest']:
+            columns[prefix + '_plate'] = np.fromiter(
+                (plates.setdefault(plate, len(plates))
+                 for plate in values.get(prefix + '_plate', [])),
+                dtype=np.int16, count=num_rows)
+
+            idxs = np.array([get_well_idx(well)
+                             for well in values.get(prefix + '_well', [])],
+                            dtype=np.int16).reshape(num_rows, 2)
+
+            columns[prefix + '_row'] = idxs[:, 0].copy()
+            columns[prefix + '_col'] = idxs[:, 1].copy()
+
+        columns['vol'] = np.array(values.get('vol', []), dtype=np.float64)
+
+        for offset in _OFFSETS:
+            offsets = values.get(offset)
+
+            if offsets is not None and \
+                    any(val is not None and val == val for val in offsets):
+                columns[offset] = np.array(
+                    [np.nan if val is None else val for val in offsets],
+                    dtype=np.float64)
+
+        return cls(list(plates), columns)
+
+    def __len__(self):
+        return len(self.columns['vol'])
+
+    def __getitem__(self, key):
+        '''Get column by name, or sub-table by index array or mask.'''
+        if isinstance(key, str):
+            return self.columns[key]
+
+        return self.take(key)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        '''Iterate Transfer records.'''
+        src_plates = self.get_plates('src')
+        dest_plates = self.get_plates('dest')
+        src_wells = self.get_well_names('src')
+        dest_wells = self.get_well_names('dest')
+        offsets = [self.get_offsets(offset) for offset in _OFFSETS]
+
+        for idx, vol in enumerate(self.columns['vol'].tolist()):
+            yield Transfer(src_plates[idx], src_wells[idx],
+                           dest_plates[idx], dest_wells[idx], vol,
+                           *[vals[idx] for vals in offsets])
+
+    def take(self, idxs):
+        '''Get sub-table of rows by index array or boolean mask.'''
+        return TransferTable(self.plates,
+                             {name: col[idxs]
+                              for name, col in self.columns.items()})
+
+    def filter(self, mask):
+        '''Get sub-table of rows matching boolean mask.'''
+        return self.take(np.asarray(mask, dtype=bool))
+
+    def group_idxs(self, *keys):
+        '''Yield (key values, row indices) pairs in order of first key.'''
+        if not len(self):
+            return
+
+        order = np.lexsort([self.columns[key] for key in reversed(keys)])
+        starts = np.zeros(len(order), dtype=bool)
+        starts[0] = True
+
+        for key in keys:
+            col = self.columns[key][order]
+            starts[1:] |= col[1:] != col[:-1]
+
+        groups = np.split(order, np.flatnonzero(starts)[1:])
+        groups.sort(key=lambda group: group[0])
+
+        for group in groups:
+            yield tuple(self.columns[key][group[0]].item()
+                        for key in keys), group
+
+    def get_plates(self, prefix):
+        '''Get src or dest plate names.'''
+        names = np.array(self.plates + [None], dtype=object)
+        return names[self.columns[prefix + '_plate']].tolist()
+
+    def get_well_names(self, prefix):
+        '''Get src or dest well names.'''
+        return [get_well_name(row, col)
+                for row, col in zip(self.columns[prefix + '_row'].tolist(),
+                                    self.columns[prefix + '_col'].tolist())]
+
+    def get_offsets(self, offset):
+        '''Get offset values, with None where absent.'''
+        col = self.columns.get(offset)
+
+        if col is None:
+            return [None] * len(self)
+
+        return [None if val != val else val for val in col.tolist()]
+
+
+def iter_transfers(csv_file):
+    '''Stream Transfers from an open csv file, validating the header first.'''
+    reader = csv.reader(csv_file)
+    headers = next(reader, None)
+
+    if headers is None:
+        raise ValueError('Empty worklist')
+
+    missing = [header for header in _REQUIRED if header not in headers]
+
+    if missing:
+        raise ValueError('Worklist missing columns: %s' % ', '.join(missing))
+
+    idxs = [headers.index(field) if field in headers else None
+            for field in Transfer._fields]
+
+    return _iter_rows(reader, idxs)
+
+
+def count_plate_pairs(csv_file):
+    '''Count rows of an open csv file by (src_plate, dest_plate).'''
+    return Counter((row.get('src_plate'), row.get('dest_plate'))
+                   for row in csv.DictReader(csv_file))
+
+
+def batch(iterable, size):
+    '''Yield lists of at most size items.'''
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(islice(iterator, size))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def get_row(idx):
+    '''Get worklist row number of transfer idx, as in a spreadsheet: the
+    header being row 1 and blank lines not counted.'''
+    return idx + 2
+
+
+def get_well_idx(well_name):
+    '''Get zero-based (row, col) of well name, e.g. B3 -> (1, 2).'''
+    idxs = _WELL_IDXS.get(well_name)
+
+    if idxs is None:
+        match = _WELL_RE.match(str(well_name))
+
+        if not match:
+            raise ValueError('Invalid well: %s' % well_name)
+
+        row = 0
+
+        for char in match.group(1):
+            row = row * 26 + ord(char) - ord('A') + 1
+
+        idxs = (row - 1, int(match.group(2)) - 1)
+        _WELL_IDXS[well_name] = idxs
+
+    return idxs
+
+
+def get_well_name(row, col):
+    '''Get well name of zero-based row and col, e.g. (1, 2) -> B3.'''
+    letters = ''
+    row += 1
+
+    while row:
+        row, rem = divmod(row - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+
+    return '%s%d' % (letters, col + 1)
+
+
+def _iter_rows(reader, idxs):
+    '''Parse rows to Transfers.'''
+    for idx, row in enumerate(row for row in reader if row):
+        try:
+            values = [row[col] if col is not None else None for col in idxs]
+            values[4] = float(values[4])
+
+            for offset_idx in range(5, 5 + len(_OFFSETS)):
+                values[offset_idx] = _to_float(values[offset_idx])
+
+            values[-1] = values[-1] or None
+        except (IndexError, ValueError):
+            raise ValueError('Invalid worklist row %d: %s' %
+                             (get_row(idx), row))
+
+        yield Transfer(*values)
+
+
+def _to_float(value):
+    '''Parse optional float.'''
+    return float(value) if value not in (None, '') else None
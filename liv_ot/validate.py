@@ -0,0 +1,269 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import bisect
+from collections import defaultdict
+
+import numpy as np
+
+from liv_ot.liquids import DEFAULT
+from liv_ot.multichannel import find_columns
+from liv_ot.pipettes import can_transfer
+from liv_ot.transfers import get_row, get_well_name
+
+
+# Errors listed in full (those of the first rows), the remainder being
+# counted:
+_MAX_ERRORS = 20
+_TOLERANCE = 1e-6
+
+
+class Validator():
+    '''Bulk checks of transfers against loaded labware, pipettes and
+    liquid classes, accumulated over batches so that all errors in a
+    worklist are reported together.
+
+    Rows must name loaded plates and existing wells, and have volumes some
+    pipette can transfer, given the disposal volume and air gap of their
+    liquid class: as planned, rows filling whole columns may go to an
+    8-channel pipette, all others only to single-channel pipettes. Over
+    the whole worklist, no well may be filled beyond its capacity, nor
+    drawn below empty. Initial volumes (uL per well) are by
+    plate name, as from get_volumes; plates without one may hold anything
+    up to capacity. Source wells are also drawn the disposal volume of
+    each aspiration: at least as many aspirations as the largest pipette
+    needs for their total volume of each liquid class.'''
+
+    def __init__(self, deck, pipettes, liquids, volumes=None):
+        self.__deck = deck
+        pipettes = list(pipettes)
+        self.__singles = [pip for pip in pipettes if pip.channels == 1]
+        self.__multis = [pip for pip in pipettes if pip.channels > 1]
+        self.__liquids = liquids
+        self.__volumes = volumes or {}
+        self.__errors = []
+        self.__num_errors = 0
+        self.__dispensed = {}
+
+        # Volumes drawn per well by plate name, by liquid class name:
+        self.__drawn = defaultdict(dict)
+
+    def add(self, transfers, liquid_names=None):
+        '''Check rows of a TransferTable, liquid_names being their liquid
+        class names (by default, the default class).'''
+        vols = transfers['vol']
+        valid = np.ones(len(transfers), dtype=bool)
+
+        if liquid_names is None:
+            liquid_names = [DEFAULT.name] * len(transfers)
+
+        for prefix in ['src', 'dest']:
+            valid &= self.__check_wells(transfers, prefix)
+
+        bad_vols = ~(vols > 0)
+        self.__add_errors(transfers, bad_vols, 'invalid volume %s uL',
+                          lambda pos: (vols[pos],))
+
+        reserves = self.__get_reserves(transfers, liquid_names)
+        valid &= ~bad_vols & ~np.isnan(reserves)
+        self.__add_errors(
+            transfers,
+            valid & ~self.__can_transfer(transfers, valid, reserves,
+                                         liquid_names),
+            'no pipette can transfer %s uL', lambda pos: (vols[pos],))
+
+        names = np.array(liquid_names, dtype=object)
+
+        for name in dict.fromkeys(names[valid].tolist()):
+            self.__accumulate(transfers, 'src', valid & (names == name),
+                              self.__drawn[name])
+
+        self.__accumulate(transfers, 'dest', valid, self.__dispensed)
+
+    def get_errors(self):
+        '''Get (first) error messages and the total number of errors: those
+        of rows, by worklist row number, then those of wells.'''
+        errors = [error for _, error in self.__errors]
+        num_errors = self.__num_errors
+        drawn = self.__get_drawn()
+
+        for name in sorted(set(drawn) | set(self.__dispensed)):
+            geometry = self.__deck.get_geometry(name)
+            capacity = geometry.wells['capacity'].astype(np.float64)
+            net = self.__dispensed.get(name, 0) - drawn.get(name, 0)
+            initial = self.__volumes.get(name)
+
+            # Unknown initial volumes are taken as full when drawing from
+            # and empty when filling:
+            highs = net + (0 if initial is None else initial)
+            lows = net + (capacity if initial is None else initial)
+
+            for mask, msg, vols in [
+                    (highs > capacity + _TOLERANCE,
+                     '%s %s: filled to %.1f uL, exceeding capacity %.1f uL',
+                     highs),
+                    (lows < -_TOLERANCE,
+                     '%s %s: overdrawn by %.1f uL (capacity %.1f uL)',
+                     -lows)]:
+                for pos in np.flatnonzero(mask).tolist():
+                    num_errors += 1
+
+                    if len(errors) < _MAX_ERRORS:
+                        well = geometry.wells[pos]
+                        errors.append(msg % (
+                            name, get_well_name(int(well['row']),
+                                                int(well['col'])),
+                            vols[pos], capacity[pos]))
+
+        return errors, num_errors
+
+    def check(self):
+        '''Raise ValueError listing errors, if any.'''
+        errors, num_errors = self.get_errors()
+
+        if num_errors:
+            raise ValueError('Invalid worklist (%d errors):\n%s%s' % (
+                num_errors, '\n'.join(errors),
+                '\n... and %d more' % (num_errors - len(errors))
+                if num_errors > len(errors) else ''))
+
+    def __check_wells(self, transfers, prefix):
+        '''Check plates and wells exist, returning mask of valid rows.'''
+        codes = transfers[prefix + '_plate']
+        rows = transfers[prefix + '_row']
+        cols = transfers[prefix + '_col']
+        valid = np.ones(len(transfers), dtype=bool)
+
+        for code, name in enumerate(transfers.plates):
+            mask = codes == code
+
+            if not mask.any():
+                continue
+
+            if name not in self.__deck:
+                self.__add_errors(transfers, mask, 'unknown plate %s',
+                                  lambda _, name=name: (name,))
+                valid &= ~mask
+                continue
+
+            idxs = np.flatnonzero(mask)
+            geometry = self.__deck.get_geometry(name)
+            unknown = np.zeros(len(transfers), dtype=bool)
+            unknown[idxs] = geometry.find_idxs(rows[idxs], cols[idxs]) < 0
+
+            if unknown.any():
+                self.__add_errors(
+                    transfers, unknown, 'unknown well %s %s',
+                    lambda pos, name=name: (
+                        name, get_well_name(int(rows[pos]), int(cols[pos]))))
+                valid &= ~unknown
+
+        return valid
+
+    def __get_reserves(self, transfers, liquid_names):
+        '''Get disposal volume plus air gap by row, NaN for unknown liquid
+        classes.'''
+        names = np.array(liquid_names, dtype=object)
+        reserves = np.full(len(transfers), np.nan)
+
+        for name in dict.fromkeys(names.tolist()):
+            mask = names == name
+            liquid = self.__liquids.get(name)
+
+            if liquid is None:
+                self.__add_errors(transfers, mask, 'unknown liquid class %s',
+                                  lambda _, name=name: (name,))
+            else:
+                reserves[mask] = liquid.disposal_volume + liquid.air_gap
+
+        return reserves
+
+    def __can_transfer(self, transfers, valid, reserves, liquid_names):
+        '''Get mask of rows some pipette can transfer, as schedule plans
+        them: rows filling whole columns (among valid rows of a liquid
+        class) by an 8-channel pipette, any row by a single-channel.'''
+        vols = transfers['vol']
+        transferable = can_transfer(vols, self.__singles, reserves)
+
+        if not self.__multis:
+            return transferable
+
+        names = np.array(liquid_names, dtype=object)
+
+        for name in dict.fromkeys(names[valid].tolist()):
+            idxs = np.flatnonzero(valid & (names == name))
+            firsts, members = find_columns(transfers.take(idxs),
+                                           self.__deck.get_num_rows)
+            columns = can_transfer(vols[idxs[firsts]], self.__multis,
+                                   reserves[idxs[firsts]])
+            transferable[idxs[members[columns].ravel()]] = True
+
+        return transferable
+
+    def __get_drawn(self):
+        '''Get volume drawn per well by plate name, with disposal volumes of
+        the fewest aspirations the largest pipette could make.'''
+        max_volume = max([pip.max_volume
+                          for pip in self.__singles + self.__multis],
+                         default=0.0)
+        drawn = {}
+
+        for liquid_name, totals in self.__drawn.items():
+            liquid = self.__liquids[liquid_name]
+            capacity = max_volume - liquid.disposal_volume - liquid.air_gap
+
+            for name, vols in totals.items():
+                num_asps = np.ceil(vols / capacity - _TOLERANCE)
+                drawn[name] = drawn.get(name, 0) + vols + \
+                    liquid.disposal_volume * num_asps
+
+        return drawn
+
+    def __accumulate(self, transfers, prefix, valid, totals):
+        '''Add volumes of valid rows to per-well totals by plate name.'''
+        codes = transfers[prefix + '_plate']
+
+        for code, name in enumerate(transfers.plates):
+            idxs = np.flatnonzero(valid & (codes == code))
+
+            if not len(idxs):
+                continue
+
+            geometry = self.__deck.get_geometry(name)
+
+            if name not in totals:
+                totals[name] = np.zeros(len(geometry.wells))
+
+            totals[name] += np.bincount(
+                geometry.find_idxs(transfers[prefix + '_row'][idxs],
+                                   transfers[prefix + '_col'][idxs]),
+                weights=transfers['vol'][idxs],
+                minlength=len(geometry.wells))
+
+    def __add_errors(self, transfers, mask, msg, get_args):
+        '''Record errors of rows in mask, formatting msg with get_args of
+        each row position (only for errors listed in full).'''
+        idxs = np.flatnonzero(mask)
+        self.__num_errors += len(idxs)
+
+        for pos in idxs[:_MAX_ERRORS].tolist():
+            row = get_row(int(transfers['idx'][pos]))
+
+            if len(self.__errors) == _MAX_ERRORS and \
+                    row >= self.__errors[-1][0]:
+                break
+
+            bisect.insort(self.__errors,
+                          (row, 'row %d: %s' % (row, msg % get_args(pos))))
+            del self.__errors[_MAX_ERRORS:]
+
+
+def get_volumes(setup):
+    '''Get initial volume (uL per well) by plate name, from setup's plates.'''
+    return {plate['name']: plate['volume']
+            for plate in setup.get('plates', [])
+            if plate.get('volume') is not None}
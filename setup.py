@@ -0,0 +1,23 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+import os.path
+
+from setuptools import setup
+
+
+with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                       'requirements.txt')) as req_file:
+    _REQUIREMENTS = req_file.read().split()
+
+setup(name='liv_ot',
+      version='0.1.0',
+      description='Opentrons protocols of the University of Liverpool',
+      author='Neil Swainston',
+      author_email='neil.swainston@liverpool.ac.uk',
+      packages=['liv_ot'],
+      install_requires=_REQUIREMENTS)
@@ -0,0 +1,89 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from liv_ot.batch import simulate_job
+
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'data')
+
+
+class Test(unittest.TestCase):
+    '''Test class for batch.'''
+
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir)
+
+    def test_simulate_job(self):
+        '''Tests simulate_job method.'''
+        result = simulate_job(self.__get_job([]))
+
+        self.assertEqual(result['status'], 'success')
+        self.assertGreater(result['commands'], 0)
+
+    def test_simulate_job_invalid(self):
+        '''Tests simulate_job method reports the first invalid row.'''
+        result = simulate_job(self.__get_job([4, 6]))
+
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(result['row'], 4)
+
+    def test_simulate_job_labware_dir(self):
+        '''Tests simulate_job method takes well geometry from labware_dir.'''
+        name = '4ti_96_wellplate_350ul'
+
+        with open(os.path.join(_DATA_DIR, 'plates', name, '1.json')) \
+                as in_file:
+            definition = json.load(in_file)
+
+        for well in definition['wells'].values():
+            well['totalLiquidVolume'] = 100
+
+        labware_dir = os.path.join(self.__tmp_dir, 'plates')
+        os.makedirs(os.path.join(labware_dir, name))
+
+        with open(os.path.join(labware_dir, name, '1.json'), 'w') \
+                as out_file:
+            json.dump(definition, out_file)
+
+        result = simulate_job(dict(self.__get_job([]),
+                                   labware_dir=labware_dir))
+
+        self.assertEqual(result['status'], 'error')
+        self.assertIn('exceeding capacity 100.0 uL', result['error'])
+
+    def __get_job(self, bad_rows):
+        '''Get job for the shipped setup and worklist, replacing the source
+        plate of bad_rows (numbered as in a spreadsheet).'''
+        path = os.path.join(self.__tmp_dir, 'worklist.csv')
+
+        with open(os.path.join(_DATA_DIR, 'worklist_orig.csv')) as in_file, \
+                open(path, 'w') as out_file:
+            for row, line in enumerate(in_file, 1):
+                if row in bad_rows:
+                    line = line.replace('plate_1', 'unknown', 1)
+
+                out_file.write(line)
+
+        return {'name': 'test',
+                'setup': os.path.join(_DATA_DIR, 'setup.json'),
+                'worklist': path,
+                'writer': 'simple'}
+
+
+if __name__ == '__main__':
+    unittest.main()
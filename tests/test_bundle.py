@@ -0,0 +1,93 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from liv_ot.bundle import get_protocol
+from tests.test_checkpoint import run_simulation
+from tests.test_writers import _DATA_DIR, _SETUP, _TRASH, _WORKLIST_ORIG, \
+    get_num_rows
+
+
+# Simulate protocol file, printing its commands:
+_SIMULATE = '''
+import sys
+
+from opentrons import simulate
+
+with open(sys.argv[1]) as protocol_file:
+    runlog, _ = simulate.simulate(protocol_file, sys.argv[1],
+                                  custom_labware_paths=sys.argv[2:])
+
+for entry in runlog:
+    print(entry['payload']['text'])
+'''
+
+
+def simulate_bundle(tmp_dir, protocol):
+    '''Simulate bundled protocol where liv_ot cannot be imported, returning
+    its commands.'''
+    path = os.path.join(tmp_dir, 'protocol.py')
+
+    with open(path, 'w') as protocol_file:
+        protocol_file.write(protocol)
+
+    env = dict(os.environ)
+    env.pop('PYTHONPATH', None)
+
+    result = subprocess.run(
+        [sys.executable, '-c', _SIMULATE, path] +
+        glob.glob(os.path.join(_DATA_DIR, 'plates', '*')),
+        cwd=tmp_dir, env=env, stdout=subprocess.PIPE,
+        universal_newlines=True, check=True)
+
+    return result.stdout.splitlines()
+
+
+class Test(unittest.TestCase):
+    '''Test class for bundle.'''
+
+    def test_get_protocol(self):
+        '''Tests a bundled protocol runs where liv_ot cannot be imported.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            commands = simulate_bundle(
+                tmp_dir, get_protocol('simple', _SETUP, _WORKLIST_ORIG))
+
+        self.assertEqual(
+            len([cmd for cmd in commands if cmd.startswith('Dispensing')]),
+            get_num_rows(_WORKLIST_ORIG))
+        self.assertEqual(commands[-1], 'Dropping tip into %s' % _TRASH)
+
+    def test_get_protocol_resume(self):
+        '''Tests a bundled protocol resumes from its checkpoint.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint.json')
+
+            # Crash a run after 6 dispenses:
+            run_simulation(path, crash_after=6)
+
+            commands = simulate_bundle(
+                tmp_dir, get_protocol('simple', _SETUP, _WORKLIST_ORIG,
+                                      path, True))
+
+        num_rows = get_num_rows(_WORKLIST_ORIG)
+
+        self.assertIn('Resuming with %d of %d transfers remaining' %
+                      (num_rows - 6, num_rows), '\n'.join(commands))
+        self.assertEqual(
+            len([cmd for cmd in commands if cmd.startswith('Dispensing')]),
+            num_rows - 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
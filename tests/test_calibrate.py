@@ -0,0 +1,45 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import io
+import unittest
+
+from opentrons import simulate
+
+from liv_ot.calibrate import get_protocol
+
+
+class Test(unittest.TestCase):
+    '''Test class for calibrate.'''
+
+    def test_get_protocol(self):
+        '''Tests a protocol checking custom and stock labware simulates,
+        checking every edge of each corner well.'''
+        protocol = get_protocol(['4ti_96_wellplate_350ul',
+                                 'agilent_1_reservoir_290ml'],
+                                'p300_single_gen2',
+                                tiprack_loadname='opentrons_96_tiprack_300ul')
+
+        runlog, _ = simulate.simulate(io.StringIO(protocol), 'calibrate.py')
+        commands = [entry['payload']['text'] for entry in runlog]
+
+        self.assertEqual(
+            [cmd for cmd in commands if cmd.startswith('Pausing robot '
+                                                       'operation: Moved to '
+                                                       'the top')],
+            ['Pausing robot operation: Moved to the top of %s' % well
+             for well in ['A1 of 4ti_96_wellplate_350ul on 1',
+                          'H12 of 4ti_96_wellplate_350ul on 1',
+                          'A1 of Agilent 1 Well Reservoir 290 mL on 2']])
+
+        self.assertEqual(len([cmd for cmd in commands
+                              if cmd.endswith(' edge')]), 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
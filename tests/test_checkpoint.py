@@ -0,0 +1,158 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import defaultdict
+import csv
+import os.path
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from opentrons import simulate
+
+from liv_ot import simple
+from liv_ot.checkpoint import Checkpoint
+from liv_ot.labware import Registry
+
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'data')
+
+_SETUP = os.path.join(_DATA_DIR, 'setup.json')
+_WORKLIST = os.path.join(_DATA_DIR, 'worklist_orig.csv')
+
+_DISPENSE_RE = re.compile(r'Dispensing ([\d.]+) uL into (\w+) of (plate_\d+)')
+
+
+class Crash(Exception):
+    '''Simulated crash of a run.'''
+
+
+def run_simulation(checkpoint_path, resume=False, crash_after=None,
+                   live=True):
+    '''Write protocol under the simulator, crashing after crash_after
+    dispenses, returning its commands. If live, the protocol poses as
+    running on the robot, so that progress is recorded.'''
+    protocol = simulate.get_protocol_api(
+        simple.metadata['apiLevel'],
+        extra_labware=Registry().get_definitions())
+    protocol.is_simulating = lambda: not live
+
+    recorder = Checkpoint.recorder
+
+    def crashing_recorder(self, *args):
+        '''Get recorder, crashing once crash_after dispenses are recorded.'''
+        record = recorder(self, *args)
+        num_dispenses = [0]
+
+        def crashing_record(pipette, asp, num_dispensed):
+            '''Record progress, then crash if due.'''
+            record(pipette, asp, num_dispensed)
+
+            if num_dispensed:
+                num_dispenses[0] += 1
+
+                if num_dispenses[0] == crash_after:
+                    raise Crash()
+
+        return crashing_record
+
+    with mock.patch.object(Checkpoint, 'recorder', crashing_recorder):
+        try:
+            simple.ProtocolWriter(protocol, _SETUP, _WORKLIST, offline=True,
+                                  checkpoint=checkpoint_path,
+                                  resume=resume).write()
+        except Crash:
+            pass
+
+    return protocol.commands()
+
+
+def get_dispensed(commands):
+    '''Get volume dispensed by plate and well.'''
+    dispensed = defaultdict(float)
+
+    for command in commands:
+        match = _DISPENSE_RE.match(command)
+
+        if match:
+            dispensed[match.group(3), match.group(2)] += float(match.group(1))
+
+    return dispensed
+
+
+class Test(unittest.TestCase):
+    '''Test class for Checkpoint.'''
+
+    def test_resume(self):
+        '''Tests resuming after a crash mid-aspiration dispenses each
+        transfer exactly once.'''
+        with open(_WORKLIST, newline='') as csv_file:
+            expected = defaultdict(float)
+
+            for row in csv.DictReader(csv_file):
+                expected[row['dest_plate'], row['dest_well']] += \
+                    float(row['vol'])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint.json')
+
+            # Crash between dispenses of the second aspiration:
+            crashed = run_simulation(path, crash_after=6)
+            resumed = run_simulation(path, resume=True)
+
+        dispensed = get_dispensed(crashed)
+        self.assertEqual(len(dispensed), 6)
+
+        for key, vol in get_dispensed(resumed).items():
+            dispensed[key] += vol
+
+        self.assertEqual(dict(dispensed), dict(expected))
+        self.assertIn('Resuming with %d of %d transfers remaining' %
+                      (len(expected) - 6, len(expected)),
+                      '\n'.join(resumed))
+
+    def test_simulating(self):
+        '''Tests simulating, as in analysis before a run, records nothing,
+        so resuming repeats every transfer.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint.json')
+
+            run_simulation(path, crash_after=6, live=False)
+            self.assertFalse(os.path.exists(path))
+
+            crashed = run_simulation(path, crash_after=6)
+            run_simulation(path, resume=True, live=False)
+            resumed = run_simulation(path, resume=True)
+
+        self.assertEqual(len(get_dispensed(crashed)) +
+                         len(get_dispensed(resumed)),
+                         len(get_dispensed(run_simulation(None))))
+
+    def test_torn_journal(self):
+        '''Tests an incomplete last line of the journal is ignored.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'checkpoint.json')
+
+            with open(path, 'w') as checkpoint_file:
+                checkpoint_file.write(
+                    '{"next_tip": {}, "seed": 1, "dispensed": {"0": 10.0}, '
+                    '"drawn": {}}\n{"dispensed": {"0": 5.0}}\n'
+                    '{"dispensed": {"1"')
+
+            checkpoint = Checkpoint.load(path)
+
+        self.assertEqual(checkpoint.seed, 1)
+        self.assertEqual(checkpoint.get_summary([0, 1], [15.0, 20.0]),
+                         'Resuming with 1 of 2 transfers remaining (rows 3); '
+                         'source wells drawn (uL): none')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import shutil
+import tempfile
+import threading
+import unittest
+from urllib.error import HTTPError
+
+from liv_ot.fetch import fetch
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''Handler serving the server's content, with its ETag, failing with
+    500 while the server has failures left.'''
+
+    def do_GET(self):
+        '''Serve GET request.'''
+        server = self.server
+        server.requests.append(self.headers.get('If-None-Match'))
+
+        if server.failures:
+            server.failures -= 1
+            self.send_error(500)
+        elif self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('ETag', server.etag)
+            self.send_header('Content-Length', str(len(server.content)))
+            self.end_headers()
+            self.wfile.write(server.content)
+
+    def log_message(self, *args):
+        '''Log nothing.'''
+
+
+class Test(unittest.TestCase):
+    '''Test class for fetch.'''
+
+    def setUp(self):
+        self.__cache_dir = tempfile.mkdtemp()
+        self.__server = HTTPServer(('localhost', 0), Handler)
+        self.__server.requests = []
+        self.__server.failures = 0
+        self.__set_content(b'src_plate,src_well\n', '"1"')
+        self.__url = 'http://localhost:%d/worklist.csv' % \
+            self.__server.server_port
+
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+        self.__thread.start()
+
+    def tearDown(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+        shutil.rmtree(self.__cache_dir)
+
+    def test_fetch(self):
+        '''Tests fetch method caches content, revalidating it by ETag.'''
+        self.assertEqual(self.__fetch(), b'src_plate,src_well\n')
+        self.assertEqual(self.__fetch(), b'src_plate,src_well\n')
+
+        self.__set_content(b'src_plate,src_well,vol\n', '"2"')
+        self.assertEqual(self.__fetch(), b'src_plate,src_well,vol\n')
+
+        self.assertEqual(self.__server.requests, [None, '"1"', '"1"'])
+
+    def test_fetch_offline(self):
+        '''Tests fetch method uses the cached copy, without requests, when
+        offline.'''
+        with self.assertRaisesRegex(ValueError, 'Not cached'):
+            self.__fetch(offline=True)
+
+        self.__fetch()
+        self.__set_content(b'src_plate,src_well,vol\n', '"2"')
+
+        self.assertEqual(self.__fetch(offline=True), b'src_plate,src_well\n')
+        self.assertEqual(len(self.__server.requests), 1)
+
+    def test_fetch_retries(self):
+        '''Tests fetch method retries server errors.'''
+        self.__server.failures = 1
+
+        self.assertEqual(self.__fetch(retries=1), b'src_plate,src_well\n')
+        self.assertEqual(len(self.__server.requests), 2)
+
+    def test_fetch_server_error(self):
+        '''Tests fetch method raises server errors when nothing is cached,
+        else falling back to the cached copy.'''
+        self.__server.failures = 2
+
+        with self.assertRaises(HTTPError):
+            self.__fetch(retries=1)
+
+        self.__fetch()
+        self.__server.failures = 1
+
+        self.assertEqual(self.__fetch(retries=0), b'src_plate,src_well\n')
+        self.assertEqual(self.__server.failures, 0)
+
+    def __fetch(self, **kwargs):
+        '''Fetch url, returning the content of its local copy.'''
+        with open(fetch(self.__url, cache_dir=self.__cache_dir, timeout=5,
+                        **kwargs), 'rb') as local_file:
+            return local_file.read()
+
+    def __set_content(self, content, etag):
+        '''Set content served, with its ETag.'''
+        self.__server.content = content
+        self.__server.etag = etag
+
+
+if __name__ == '__main__':
+    unittest.main()
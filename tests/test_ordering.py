@@ -0,0 +1,42 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from liv_ot.ordering import order_transfers
+from tests.test_planner import get_dispenses
+
+
+# Destinations along a line, out of order:
+_DEST_XY = np.array([[30.0, 0.0], [10.0, 0.0], [20.0, 0.0], [40.0, 0.0]])
+_SRC_XY = np.zeros((4, 2))
+
+
+class Test(unittest.TestCase):
+    '''Test class for ordering.'''
+
+    def test_nearest(self):
+        '''Tests nearest ordering visits destinations along the line.'''
+        order = order_transfers(get_dispenses([10.0] * 4), _SRC_XY, _DEST_XY)
+        self.assertEqual(order.tolist(), [1, 2, 0, 3])
+
+    def test_nearest_large(self):
+        '''Tests nearest ordering keeps the order of source wells with too
+        many destinations.'''
+        with mock.patch('liv_ot.ordering._MAX_NEAREST', 3):
+            order = order_transfers(get_dispenses([10.0] * 4), _SRC_XY,
+                                    _DEST_XY)
+
+        self.assertEqual(order.tolist(), [0, 1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+from liv_ot import simple, simple_pandas
+from liv_ot.plan_cache import PlanCache, get_key
+from liv_ot.planning import PlanningContext
+from tests.test_writers import _WORKLIST, _WORKLIST_ORIG, run_simulation
+
+
+class Test(unittest.TestCase):
+    '''Test class for PlanCache.'''
+
+    def test_replay(self):
+        '''Tests a cached plan replays the commands of the original.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plan_cache = PlanCache(tmp_dir)
+            commands = run_simulation(simple, _WORKLIST_ORIG,
+                                      plan_cache=plan_cache)
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+
+            self.assertEqual(run_simulation(simple, _WORKLIST_ORIG,
+                                            plan_cache=plan_cache),
+                             commands)
+
+    def test_generated_seed(self):
+        '''Tests plans are not cached for generated layout seeds.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            run_simulation(simple_pandas, _WORKLIST,
+                           plan_cache=PlanCache(tmp_dir))
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+            run_simulation(simple_pandas, _WORKLIST, seed=0,
+                           plan_cache=PlanCache(tmp_dir))
+            self.assertEqual(len(os.listdir(tmp_dir)), 1)
+
+    def test_key_sources(self):
+        '''Tests plan keys change with the sources of liv_ot modules.'''
+        module = types.ModuleType('liv_ot.planned')
+        module.__loader__ = mock.Mock()
+        keys = []
+
+        with mock.patch.dict(sys.modules, {module.__name__: module}):
+            for source in ['planned = 1', 'planned = 2']:
+                module.__loader__.get_source.return_value = source
+                keys.append(get_key(PlanningContext(), {}, _WORKLIST_ORIG))
+
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_writer_error(self):
+        '''Tests a plan whose writing fails is not stored.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plan_cache = PlanCache(tmp_dir)
+
+            with self.assertRaises(ValueError):
+                with plan_cache.writer('a'):
+                    raise ValueError()
+
+            self.assertEqual(os.listdir(tmp_dir), [])
+            self.assertIsNone(plan_cache.get('a', None))
+
+    def test_prune(self):
+        '''Tests least recently used and expired plans are removed.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            plan_cache = PlanCache(tmp_dir, max_plans=2, max_age=3600)
+            now = time.time()
+
+            for key, age in [('old', 7200), ('a', 60), ('b', 30)]:
+                plan_cache.put(key, [])
+                path = os.path.join(tmp_dir, key + '.json')
+                os.utime(path, (now - age, now - age))
+
+            plan_cache.put('c', [])
+
+            self.assertEqual(sorted(os.listdir(tmp_dir)),
+                             ['b.json', 'c.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
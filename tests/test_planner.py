@@ -0,0 +1,144 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import namedtuple
+import unittest
+
+import numpy as np
+
+from liv_ot.estimate import estimate, get_travel
+from liv_ot.planner import Aspiration, get_summary, plan, schedule
+from liv_ot.transfers import TransferTable
+
+
+Pipette = namedtuple('Pipette', ['name', 'channels', 'min_volume',
+                                 'max_volume'])
+
+FlowRate = namedtuple('FlowRate', ['aspirate', 'dispense', 'blow_out'])
+FlowPipette = namedtuple('FlowPipette', ['max_volume', 'flow_rate'])
+
+_P20_SINGLE = Pipette('p20_single_gen2', 1, 1.0, 20.0)
+_P300_MULTI = Pipette('p300_multi_gen2', 8, 20.0, 300.0)
+
+_NUM_ROWS = {'reservoir': 1, 'plate': 8}
+
+# Source at the trash, dispensing to wells 30 mm and 50 mm away from it:
+_SRC_XY = np.zeros((1, 2))
+_DEST_XY = np.array([[30.0, 0.0], [30.0, 40.0]])
+_TRASH_XY = np.zeros(2)
+_STEPS = [(FlowPipette(100.0, FlowRate(10.0, 20.0, 100.0)),
+           Aspiration(0, [(0, 30.0), (1, 20.0)]))]
+
+
+def get_column(vol):
+    '''Get transfers filling column 1 of plate from a reservoir.'''
+    return TransferTable.from_columns({
+        'src_plate': ['reservoir'] * 8,
+        'src_well': ['A1'] * 8,
+        'dest_plate': ['plate'] * 8,
+        'dest_well': ['%s1' % row for row in 'ABCDEFGH'],
+        'vol': [vol] * 8})
+
+
+def get_dispenses(vols):
+    '''Get transfers dispensing vols from one well.'''
+    return TransferTable.from_columns({
+        'src_plate': ['reservoir'] * len(vols),
+        'src_well': ['A1'] * len(vols),
+        'dest_plate': ['plate'] * len(vols),
+        'dest_well': ['A%d' % (col + 1) for col in range(len(vols))],
+        'vol': vols})
+
+
+class Test(unittest.TestCase):
+    '''Test class for planner.'''
+
+    def test_plan(self):
+        '''Tests plan method, packing dispenses first-fit-decreasing.'''
+        aspirations = plan(get_dispenses([100.0, 200.0, 100.0, 50.0]),
+                           250.0)
+
+        self.assertEqual([asp.dispenses for asp in aspirations],
+                         [[(0, 100.0), (2, 100.0)], [(1, 200.0), (3, 50.0)]])
+
+    def test_plan_contiguous(self):
+        '''Tests plan method, packing dispenses in runs of their order.'''
+        aspirations = plan(get_dispenses([100.0, 200.0, 100.0, 50.0]),
+                           250.0, contiguous=True)
+
+        self.assertEqual([asp.dispenses for asp in aspirations],
+                         [[(0, 100.0)], [(1, 200.0)], [(2, 100.0), (3, 50.0)]])
+
+    def test_schedule_column(self):
+        '''Tests schedule method, giving a column to the 8-channel.'''
+        steps = schedule(get_column(100.0), [_P20_SINGLE, _P300_MULTI],
+                         get_num_rows=_NUM_ROWS.get)
+
+        self.assertEqual([(pip, asp.dispenses) for pip, asp in steps],
+                         [(_P300_MULTI, [(0, 100.0)])])
+
+    def test_summary_column(self):
+        '''Tests get_summary method counts all channels of the 8-channel.'''
+        steps = schedule(get_column(100.0), [_P20_SINGLE, _P300_MULTI],
+                         50.0, _NUM_ROWS.get)
+
+        self.assertEqual(get_summary(steps, 50.0),
+                         {'aspirations': 1, 'dispenses': 1, 'tips': 8,
+                          'volume': 1200.0})
+
+    def test_schedule_column_single(self):
+        '''Tests schedule method, leaving a column too small for the
+        8-channel to the single-channel.'''
+        steps = schedule(get_column(10.0), [_P20_SINGLE, _P300_MULTI],
+                         get_num_rows=_NUM_ROWS.get)
+
+        self.assertEqual({pip for pip, _ in steps}, {_P20_SINGLE})
+        self.assertEqual(sorted(pos for _, asp in steps
+                                for pos, _ in asp.dispenses),
+                         list(range(8)))
+
+    def test_schedule_column_no_single(self):
+        '''Tests schedule method, raising if no pipette can transfer a
+        column.'''
+        with self.assertRaises(ValueError):
+            schedule(get_column(10.0), [_P300_MULTI],
+                     get_num_rows=_NUM_ROWS.get)
+
+    def test_get_travel(self):
+        '''Tests get_travel method, from source to each destination and on
+        to the trash.'''
+        self.assertEqual(get_travel(_STEPS, _SRC_XY, _DEST_XY, _TRASH_XY),
+                         120.0)
+
+    def test_estimate(self):
+        '''Tests estimate method, by phase.'''
+        runtime = estimate(_STEPS, _SRC_XY, _DEST_XY, _TRASH_XY,
+                           blow_out=False, mix=(2, 200.0))
+
+        # Travel is 120 mm at 400 mm/s, with 3 moves each rising and
+        # falling 60 mm at 125 mm/s; mixing is capped at max_volume:
+        self.assertEqual({phase: round(time, 6)
+                          for phase, time in runtime.items()},
+                         {'tips': 10.0, 'travel': 1.74, 'mix': 30.0,
+                          'aspirate': 5.0, 'dispense': 2.5, 'touch_tip': 6.0,
+                          'blow_out': 0.0})
+
+    def test_estimate_blow_out(self):
+        '''Tests estimate method, drawing disposal volumes and blowing out
+        by default.'''
+        runtime = estimate(_STEPS, _SRC_XY, _DEST_XY, _TRASH_XY, 10.0,
+                           touch_tip=False)
+
+        self.assertEqual(runtime['aspirate'], 6.0)
+        self.assertEqual(runtime['dispense'], 2.5)
+        self.assertEqual(runtime['touch_tip'], 0.0)
+        self.assertEqual(runtime['blow_out'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
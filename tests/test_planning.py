@@ -0,0 +1,81 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import json
+import os.path
+import tempfile
+import unittest
+
+from opentrons import simulate
+
+from liv_ot import simple, simple_pandas
+from liv_ot.labware import Registry
+from liv_ot.planning import PlanningContext
+from tests.test_writers import _SETUP, _WORKLIST, _WORKLIST_ORIG
+
+
+def get_commands(protocol, module, wrklst_path, setup_path=_SETUP,
+                 **kwargs):
+    '''Write protocol of module, returning its commands.'''
+    module.ProtocolWriter(protocol, setup_path, wrklst_path, offline=True,
+                          **kwargs).write()
+
+    return protocol.commands()
+
+
+class Test(unittest.TestCase):
+    '''Test class for PlanningContext.'''
+
+    def test_simple(self):
+        '''Tests simple ProtocolWriter records the simulator's commands.'''
+        self.__check(simple, _WORKLIST_ORIG)
+
+    def test_simple_pandas(self):
+        '''Tests simple_pandas ProtocolWriter records the simulator's
+        commands.'''
+        self.__check(simple_pandas, _WORKLIST, seed=0)
+
+    def test_liquid_class(self):
+        '''Tests mixing and air gaps record the simulator's commands.'''
+        with open(_SETUP) as setup_file:
+            setup = json.load(setup_file)
+
+        setup['liquid_classes'] = {'default': {'mix': [2, 100],
+                                               'air_gap': 20,
+                                               'touch_tip': False,
+                                               'aspirate_flow_rate': 300}}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            setup_path = os.path.join(tmp_dir, 'setup.json')
+
+            with open(setup_path, 'w') as setup_file:
+                json.dump(setup, setup_file)
+
+            self.__check(simple, _WORKLIST_ORIG, setup_path)
+
+    def test_unknown_pipette(self):
+        '''Tests loading an unknown pipette raises ValueError.'''
+        with self.assertRaisesRegex(ValueError, 'Unknown pipette: p0_single'):
+            PlanningContext().load_instrument('p0_single', 'left')
+
+    def __check(self, module, wrklst_path, setup_path=_SETUP, **kwargs):
+        '''Check PlanningContext records the commands of the simulator.'''
+        registry = Registry()
+        protocol = simulate.get_protocol_api(
+            module.metadata['apiLevel'],
+            extra_labware=registry.get_definitions())
+
+        self.assertEqual(
+            get_commands(PlanningContext(registry=registry), module,
+                         wrklst_path, setup_path, **kwargs),
+            get_commands(protocol, module, wrklst_path, setup_path,
+                         **kwargs))
+
+
+if __name__ == '__main__':
+    unittest.main()
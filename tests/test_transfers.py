@@ -0,0 +1,38 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import io
+import unittest
+
+from liv_ot.transfers import TransferTable, iter_transfers
+
+
+_WORKLIST = '''src_plate,src_well,dest_plate,dest_well,vol,dest_top
+plate_1,A1,plate_2,A1,32.3,0.1
+plate_1,B2,plate_2,H12,261.4,
+'''
+
+
+class Test(unittest.TestCase):
+    '''Test class for transfers.'''
+
+    def test_from_transfers(self):
+        '''Tests from_transfers method, keeping volumes and offsets
+        exactly as given.'''
+        transfers = TransferTable.from_transfers(
+            list(iter_transfers(io.StringIO(_WORKLIST))))
+
+        self.assertEqual(transfers['vol'].tolist(), [32.3, 261.4])
+        self.assertEqual(transfers.get_offsets('dest_top'), [0.1, None])
+        self.assertEqual(transfers.get_well_names('dest'), ['A1', 'H12'])
+        self.assertEqual([transfer.vol for transfer in transfers],
+                         [32.3, 261.4])
+
+
+if __name__ == '__main__':
+    unittest.main()
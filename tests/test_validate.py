@@ -0,0 +1,133 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import namedtuple
+import unittest
+
+from liv_ot.labware import Registry
+from liv_ot.liquids import get_liquid_classes
+from liv_ot.transfers import TransferTable
+from liv_ot.validate import Validator
+
+
+Pipette = namedtuple('Pipette', ['name', 'channels', 'min_volume',
+                                 'max_volume'])
+
+_P20_SINGLE = Pipette('p20_single_gen2', 1, 1.0, 20.0)
+_P300_MULTI = Pipette('p300_multi_gen2', 8, 20.0, 300.0)
+
+_LIQUIDS = get_liquid_classes(
+    {'liquid_classes': {'default': {'disposal_volume': 0.0}}})
+
+
+class Deck():
+    '''Deck of two 96-well plates, src and dest.'''
+
+    def __init__(self):
+        self.__geometry = Registry().get('4ti_96_wellplate_350ul')
+
+    def get_geometry(self, _):
+        '''Get Geometry of plate.'''
+        return self.__geometry
+
+    def get_num_rows(self, _):
+        '''Get number of rows of plate.'''
+        return self.__geometry.num_rows
+
+    def __contains__(self, name):
+        return name in ['src', 'dest']
+
+
+def get_transfers(dest_wells, vol):
+    '''Get transfers from the same wells of src to dest_wells.'''
+    return TransferTable.from_columns({
+        'src_plate': ['src'] * len(dest_wells),
+        'src_well': dest_wells,
+        'dest_plate': ['dest'] * len(dest_wells),
+        'dest_well': dest_wells,
+        'vol': [vol] * len(dest_wells)})
+
+
+def get_errors(transfers, pipettes, liquids=None, volumes=None):
+    '''Get errors validating transfers.'''
+    validator = Validator(Deck(), pipettes, liquids or _LIQUIDS, volumes)
+    validator.add(transfers)
+    return validator.get_errors()
+
+
+_COLUMN = ['%s1' % row for row in 'ABCDEFGH']
+
+
+class Test(unittest.TestCase):
+    '''Test class for Validator.'''
+
+    def test_column_multi(self):
+        '''Tests a column is valid for an 8-channel alone.'''
+        self.assertEqual(get_errors(get_transfers(_COLUMN, 100.0),
+                                    [_P300_MULTI]), ([], 0))
+
+    def test_column_single(self):
+        '''Tests a column too small for the 8-channel is valid for a
+        single-channel.'''
+        self.assertEqual(get_errors(get_transfers(_COLUMN, 10.0),
+                                    [_P20_SINGLE, _P300_MULTI]), ([], 0))
+
+    def test_row_multi(self):
+        '''Tests a row outside a column is invalid for an 8-channel
+        alone.'''
+        errors, num_errors = get_errors(get_transfers(['A1'], 100.0),
+                                        [_P300_MULTI])
+
+        self.assertEqual(num_errors, 1)
+        self.assertIn('no pipette can transfer 100.0 uL', errors[0])
+
+    def test_column_too_small(self):
+        '''Tests a column too small for the 8-channel is invalid without a
+        single-channel.'''
+        _, num_errors = get_errors(get_transfers(_COLUMN, 10.0),
+                                   [_P300_MULTI])
+
+        self.assertEqual(num_errors, 8)
+
+    def test_errors_by_row(self):
+        '''Tests errors are listed by worklist row, whatever the check.'''
+        transfers = TransferTable.from_columns({
+            'src_plate': ['src', 'unknown', 'src'],
+            'src_well': ['A1', 'A1', 'Z99'],
+            'dest_plate': ['dest'] * 3,
+            'dest_well': ['A1'] * 3,
+            'vol': [-1.0, 100.0, 100.0]})
+
+        errors, num_errors = get_errors(transfers, [_P300_MULTI])
+
+        self.assertEqual(num_errors, 3)
+        self.assertEqual(errors, ['row 2: invalid volume -1.0 uL',
+                                  'row 3: unknown plate unknown',
+                                  'row 4: unknown well src Z99'])
+
+    def test_disposal_drawn(self):
+        '''Tests source wells are drawn a disposal volume per aspiration the
+        largest pipette needs.'''
+        liquids = get_liquid_classes(
+            {'liquid_classes': {'default': {'disposal_volume': 5.0}}})
+        transfers = get_transfers(['A1'] * 5, 10.0)
+
+        # 50 uL in 4 aspirations of at most 15 uL, drawing 70 uL:
+        self.assertEqual(get_errors(transfers, [_P20_SINGLE], liquids,
+                                    {'src': 70.0}), ([], 0))
+
+        errors, num_errors = get_errors(transfers, [_P20_SINGLE], liquids,
+                                        {'src': 69.0})
+
+        self.assertEqual(num_errors, 1)
+        self.assertEqual(errors, ['src A1: overdrawn by 1.0 uL '
+                                  '(capacity 350.0 uL)'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,390 @@
+'''
+(c) University of Liverpool 2020
+
+All rights reserved.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import csv
+import json
+import os.path
+import re
+import tempfile
+import unittest
+
+from opentrons import simulate
+
+from liv_ot import simple, simple_pandas
+from liv_ot.instrument import Instrumentation
+from liv_ot.labware import Registry
+from liv_ot.layout import get_paths
+from liv_ot.transfers import get_well_name
+
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'data')
+
+_SETUP = os.path.join(_DATA_DIR, 'setup.json')
+_WORKLIST = os.path.join(_DATA_DIR, 'worklist.csv')
+_WORKLIST_ORIG = os.path.join(_DATA_DIR, 'worklist_orig.csv')
+
+_TRASH = 'A1 of Opentrons Fixed Trash on 12'
+
+
+def run_simulation(module, wrklst_path, setup_path=_SETUP, **kwargs):
+    '''Write protocol of module under the simulator, returning its
+    commands.'''
+    protocol = simulate.get_protocol_api(
+        module.metadata['apiLevel'],
+        extra_labware=Registry().get_definitions())
+
+    module.ProtocolWriter(protocol, setup_path, wrklst_path, offline=True,
+                          **kwargs).write()
+
+    return protocol.commands()
+
+
+def get_setup():
+    '''Get shipped setup.'''
+    with open(_SETUP) as setup_file:
+        return json.load(setup_file)
+
+
+def run_setup(module, wrklst_path, setup, **kwargs):
+    '''Write protocol of module from setup under the simulator, returning
+    its commands.'''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        setup_path = os.path.join(tmp_dir, 'setup.json')
+
+        with open(setup_path, 'w') as setup_file:
+            json.dump(setup, setup_file)
+
+        return run_simulation(module, wrklst_path, setup_path, **kwargs)
+
+
+def run_layout(wrklst_path, **kwargs):
+    '''Write simple_pandas protocol under the simulator, returning its
+    commands and the worklist rows written with their assigned
+    destinations.'''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        layout_path = os.path.join(tmp_dir, 'layout.csv')
+        commands = run_simulation(simple_pandas, wrklst_path,
+                                  layout_out=layout_path, **kwargs)
+
+        with open(layout_path, newline='') as layout_file:
+            return commands, list(csv.DictReader(layout_file))
+
+
+def write_worklist(tmp_dir, num_rows):
+    '''Write worklist of num_rows 200 uL transfers from plate_1 to plate_2,
+    without destination wells, returning its path.'''
+    wrklst_path = os.path.join(tmp_dir, 'worklist.csv')
+
+    with open(wrklst_path, 'w') as wrklst_file:
+        wrklst_file.write('src_plate,src_well,dest_plate,vol\n')
+
+        for _ in range(num_rows):
+            wrklst_file.write('plate_1,A1,plate_2,200\n')
+
+    return wrklst_path
+
+
+def get_num_rows(wrklst_path):
+    '''Get number of transfers in worklist.'''
+    with open(wrklst_path, newline='') as csv_file:
+        return len(list(csv.DictReader(csv_file)))
+
+
+class Test(unittest.TestCase):
+    '''Test class for ProtocolWriters over the shipped data.'''
+
+    def test_simple(self):
+        '''Tests simple ProtocolWriter.'''
+        commands = run_simulation(simple, _WORKLIST_ORIG)
+        self.__check(commands, _WORKLIST_ORIG)
+
+    def test_simple_pandas(self):
+        '''Tests simple_pandas ProtocolWriter, assigning destinations.'''
+        commands = run_simulation(simple_pandas, _WORKLIST, seed=0)
+        self.__check(commands, _WORKLIST)
+
+    def test_simple_pandas_dest_wells(self):
+        '''Tests simple_pandas ProtocolWriter with given destinations.'''
+        commands = run_simulation(simple_pandas, _WORKLIST_ORIG)
+        self.__check(commands, _WORKLIST_ORIG)
+
+    def test_dest_layout_column(self):
+        '''Tests column destination layout, written to layout_out in
+        worklist order.'''
+        commands, rows = run_layout(_WORKLIST, dest_layout='column')
+
+        self.assertIn('Destination layout: column', commands)
+        self.assertEqual([row['dest_well'] for row in rows],
+                         ['%s%d' % (row, col) for col in range(1, 13)
+                          for row in 'ABCDEFGH'][:get_num_rows(_WORKLIST)])
+
+        with open(_WORKLIST, newline='') as csv_file:
+            self.assertEqual([row['vol'] for row in rows],
+                             [row['vol'] for row in csv.DictReader(csv_file)])
+
+        self.__check(commands, _WORKLIST)
+
+    def test_dest_layout_serpentine(self):
+        '''Tests serpentine destination layout.'''
+        _, rows = run_layout(_WORKLIST, dest_layout='serpentine')
+
+        self.assertEqual([row['dest_well'] for row in rows[:16]],
+                         ['%s1' % row for row in 'ABCDEFGH'] +
+                         ['%s2' % row for row in 'HGFEDCBA'])
+
+    def test_dest_layout_travel(self):
+        '''Tests travel destination layout follows one of the candidate
+        paths, avoiding the straight column-wise path.'''
+        _, rows = run_layout(_WORKLIST, dest_layout='travel')
+        wells = [row['dest_well'] for row in rows]
+
+        geometry = Registry().get(get_setup()['plates'][1]['type'])
+        paths = [[get_well_name(row, col)
+                  for row, col in zip(geometry.wells['row'][path].tolist(),
+                                      geometry.wells['col'][path].tolist())]
+                 for path in get_paths(geometry)]
+
+        self.assertIn(wells, [path[:len(wells)] for path in paths])
+        self.assertNotEqual(wells, paths[0][:len(wells)])
+
+    def test_dest_layout_random(self):
+        '''Tests random destination layout is reproduced by its seed.'''
+        commands, rows = run_layout(_WORKLIST, seed=0)
+        _, rows_again = run_layout(_WORKLIST, seed=0)
+        _, rows_other = run_layout(_WORKLIST, seed=1)
+
+        wells = [row['dest_well'] for row in rows]
+
+        self.assertIn('Destination layout: random (seed 0)', commands)
+        self.assertEqual(len(set(wells)), len(wells))
+        self.assertEqual([row['dest_well'] for row in rows_again], wells)
+        self.assertNotEqual([row['dest_well'] for row in rows_other], wells)
+
+    def test_dest_layout_unknown(self):
+        '''Tests an unknown destination layout is rejected.'''
+        with self.assertRaisesRegex(ValueError, 'Unknown layout: diagonal'):
+            run_simulation(simple_pandas, _WORKLIST, dest_layout='diagonal')
+
+    def test_overflow_plate(self):
+        '''Tests destinations overflowing their plate spill onto a new
+        plate of the same type in a free slot.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wrklst_path = write_worklist(tmp_dir, 100)
+            commands, rows = run_layout(wrklst_path, dest_layout='column')
+
+            self.__check(commands, wrklst_path)
+
+        self.assertEqual([(row['dest_plate'], row['dest_well'])
+                          for row in rows[94:]],
+                         [('plate_2', 'G12'), ('plate_2', 'H12'),
+                          ('plate_2_2', 'A1'), ('plate_2_2', 'B1'),
+                          ('plate_2_2', 'C1'), ('plate_2_2', 'D1')])
+        self.assertEqual(len([cmd for cmd in commands
+                              if cmd.startswith('Dispensing') and
+                              ' of plate_2_2 on ' in cmd]), 4)
+        self.assertFalse([cmd for cmd in commands
+                          if cmd.startswith('Pausing')])
+
+    def test_overflow_swap(self):
+        '''Tests destinations overflowing their plate on a full deck pause
+        for the plate to be replaced, then continue in its slot.'''
+        setup = get_setup()
+        plate_type = setup['plates'][1]['type']
+
+        # Fill the deck's 8 free slots:
+        setup['plates'].extend({'name': 'filler_%d' % idx,
+                                'type': plate_type}
+                               for idx in range(8))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wrklst_path = write_worklist(tmp_dir, 100)
+            commands = run_setup(simple_pandas, wrklst_path, setup,
+                                 dest_layout='column')
+
+            self.__check(commands, wrklst_path)
+
+        pauses = [idx for idx, cmd in enumerate(commands)
+                  if cmd.startswith('Pausing')]
+
+        self.assertEqual(len(pauses), 1)
+        self.assertIn('Replace plates: plate_2 with plate_2_2',
+                      commands[pauses[0]])
+
+        # The swapped-in plate takes its transfers after the pause:
+        self.assertEqual(
+            [len([cmd for cmd in cmds if cmd.startswith('Dispensing')])
+             for cmds in [commands[:pauses[0]], commands[pauses[0]:]]],
+            [96, 4])
+        self.assertTrue(all(' of plate_2 on ' in cmd
+                            for cmd in commands[pauses[0]:]
+                            if cmd.startswith('Dispensing')))
+
+    def test_deck_layout(self):
+        '''Tests the planned deck layout travels less than first free
+        slots.'''
+        commands = run_simulation(simple, _WORKLIST_ORIG)
+
+        matches = [re.match(r'Deck layout: expected travel (\d+) mm '
+                            r'\(first free slots: (\d+) mm\)$', cmd)
+                   for cmd in commands]
+        travel, naive_travel = [[float(value) for value in match.groups()]
+                                for match in matches if match][0]
+
+        self.assertLess(travel, naive_travel)
+
+    def test_deck_layout_pinned(self):
+        '''Tests labware pinned to a slot keeps it.'''
+        setup = get_setup()
+        setup['tip_racks'][0]['slot'] = '11'
+        setup['plates'][1]['slot'] = 1
+
+        commands = run_setup(simple, _WORKLIST_ORIG, setup)
+
+        self.assertTrue(all(cmd.endswith(' on 11') for cmd in commands
+                            if cmd.startswith('Picking up tip')))
+        self.assertTrue(all(' of plate_2 on 1' in cmd for cmd in commands
+                            if cmd.startswith('Dispensing')))
+        self.__check(commands, _WORKLIST_ORIG)
+
+    def test_deck_layout_pinned_unavailable(self):
+        '''Tests labware pinned to the trash's or another pinned slot is
+        rejected.'''
+        for slots in [[12], [3, 3]]:
+            setup = get_setup()
+
+            for plate, slot in zip(setup['plates'], slots):
+                plate['slot'] = slot
+
+            with self.assertRaisesRegex(ValueError, 'Slot %d unavailable '
+                                        'for plate_%d' % (slots[-1],
+                                                          len(slots))):
+                run_setup(simple, _WORKLIST_ORIG, setup)
+
+    def test_simple_order(self):
+        '''Tests simple ProtocolWriter, ordering transfers.'''
+        commands = run_simulation(simple, _WORKLIST_ORIG, order='nearest')
+        self.__check(commands, _WORKLIST_ORIG)
+        self.assertTrue([cmd for cmd in commands
+                         if cmd.startswith('Estimated travel: ')])
+
+    def test_no_blow_out(self):
+        '''Tests disposal volumes are discarded without blowing out.'''
+        setup = get_setup()
+        setup['liquid_classes'] = {'default': {'blow_out': False}}
+
+        commands = run_setup(simple, _WORKLIST_ORIG, setup)
+
+        self.assertFalse([cmd for cmd in commands
+                          if cmd.startswith('Blowing out')])
+        self.assertEqual(
+            len([cmd for cmd in commands if cmd.startswith(
+                'Dispensing 50.0 uL into %s' % _TRASH)]),
+            len([cmd for cmd in commands if cmd.startswith('Aspirating')]))
+
+    def test_simple_pandas_invalid_row(self):
+        '''Tests simple_pandas ProtocolWriter numbers invalid rows by their
+        worklist order, although destinations are assigned plate by
+        plate.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wrklst_path = os.path.join(tmp_dir, 'worklist.csv')
+
+            with open(wrklst_path, 'w') as wrklst_file:
+                wrklst_file.write('src_plate,src_well,dest_plate,vol\n'
+                                  'plate_1,A1,plate_2,100\n'
+                                  'plate_1,A1,plate_2,-5\n'
+                                  'plate_1,A1,plate_1,100\n')
+
+            with self.assertRaisesRegex(ValueError,
+                                        r'\nrow 3: invalid volume'):
+                run_simulation(simple_pandas, wrklst_path, seed=0)
+
+    def test_simple_pandas_unknown_plate(self):
+        '''Tests simple_pandas ProtocolWriter reports an unknown destination
+        plate with the worklist's other errors.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            wrklst_path = os.path.join(tmp_dir, 'worklist.csv')
+
+            with open(wrklst_path, 'w') as wrklst_file:
+                wrklst_file.write('src_plate,src_well,dest_plate,vol\n'
+                                  'plate_1,A1,plate_2,100\n'
+                                  'plate_1,A1,unknown,100\n'
+                                  'plate_1,A1,plate_2,-5\n')
+
+            with self.assertRaisesRegex(
+                    ValueError, r'\(2 errors\):\nrow 3: unknown plate '
+                    r'unknown\nrow 4: invalid volume'):
+                run_simulation(simple_pandas, wrklst_path, seed=0)
+
+    def test_tip_rack_mounts(self):
+        '''Tests tip racks naming a mount serve only its pipette.'''
+        setup = get_setup()
+        setup['tip_racks'][0]['mount'] = 'right'
+        setup['tip_racks'].append({'type': 'opentrons_96_tiprack_300ul',
+                                   'mount': 'left'})
+        setup['pipettes']['left'] = 'p300_single'
+
+        commands = run_setup(simple, _WORKLIST_ORIG, setup)
+
+        # Each pipette starts at the start_at_tip of its own rack:
+        self.assertEqual([cmd.rsplit(' on ', 1)[0] for cmd in commands
+                          if cmd.startswith('Picking up tip')],
+                         ['Picking up tip from A1 of Opentrons 96 Tip Rack '
+                          '300 µL',
+                          'Picking up tip from E1 of Opentrons 96 Filter Tip '
+                          'Rack 1000 µL'])
+        self.__check(commands, _WORKLIST_ORIG)
+
+    def test_instrumentation(self):
+        '''Tests instrumentation counts operations and times phases,
+        streaming them.'''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'instrumentation.jsonl')
+            instrumentation = Instrumentation(path)
+
+            commands = run_simulation(simple, _WORKLIST_ORIG,
+                                      instrumentation=instrumentation)
+
+            with open(path) as stream_file:
+                records = [json.loads(line) for line in stream_file]
+
+        report = instrumentation.report()
+        counters = report['counters']
+
+        self.assertEqual(counters['transfers'], get_num_rows(_WORKLIST_ORIG))
+        self.assertEqual(counters['labware_loads'], 3)
+
+        for name, prefix in [('tips', 'Picking up tip'),
+                             ('aspirations', 'Aspirating'),
+                             ('dispenses', 'Dispensing'),
+                             ('blow_outs', 'Blowing out')]:
+            self.assertEqual(counters[name],
+                             len([cmd for cmd in commands
+                                  if cmd.startswith(prefix)]))
+
+        self.assertTrue({'fetch', 'setup', 'validate', 'resolve', 'plan',
+                         'execute'} <= set(report['phases']))
+
+        # Each phase is streamed as it completes, then the report:
+        self.assertEqual({record['phase'] for record in records[:-1]},
+                         set(report['phases']))
+        self.assertEqual(records[-1]['report']['counters'], counters)
+
+    def __check(self, commands, wrklst_path):
+        '''Check every transfer is dispensed, blowing out into the fixed
+        trash.'''
+        self.assertEqual(
+            len([cmd for cmd in commands if cmd.startswith('Dispensing')]),
+            get_num_rows(wrklst_path))
+
+        self.assertIn('Blowing out at %s' % _TRASH, commands)
+        self.assertEqual(commands[-1], 'Dropping tip into %s' % _TRASH)
+
+
+if __name__ == '__main__':
+    unittest.main()